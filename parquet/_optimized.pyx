@@ -6,7 +6,6 @@ import struct
 
 
 cdef extern from "optimized.h":
-    int read_bitpacked_internal(void *data, int data_len, int mask, int* res, int total, int bit_width);
     long read_litle_endian_int(unsigned char *data);
 
 
@@ -15,45 +14,11 @@ cdef class BinaryReader:
     an order of magnitude performance gain
     """
 
-    cdef array.array _array
-    cdef int _array_size
     cdef bytes _zero_data
 
     def __init__(self):
-        # Initialize array size to something reasonable
-        self._array_size = 0
-        self._ensure_array(10240)
         self._zero_data = b"\x00\x00\x00\x00"
 
-    def __del__(self):
-        self._array = None
-
-    def _ensure_array(self, size):
-        if size <= self._array_size:
-            return
-        self._array = array.array('i', [0] * size)
-        self._array_size = size
-
-    def filter_values(self, dictionary, values, definition_levels):
-        # We need to do masking for which are null.
-        dsize = len(definition_levels)
-        vsize = len(values)
-        if dsize <= vsize and sum(definition_levels) == dsize:
-            # no missing, can optimize
-            return list(map(lambda x: dictionary[x], values))[:dsize]
-        else:
-            all_values = list(map(lambda x: dictionary[x], values))
-
-            def _gen():
-
-                viter = iter(all_values)
-                for ind in definition_levels:
-                    if ind == 0:
-                        yield None
-                    else:
-                        yield next(viter)
-            return list(_gen())[:dsize]
-
     def read_unsigned_var_int(self, fo):
         result = 0
         shift = 0
@@ -66,18 +31,33 @@ cdef class BinaryReader:
         return result
 
 
-    def read_bitpacked_data(self, data, mask, width):
-
-        cdef bytes py_bytes = data
-        cdef int bit_width = width
-        cdef int data_mask = mask
-        cdef char * py_raw = py_bytes
-
-        total = len(data) * 8
-        self._ensure_array(total)
-        cdef int* native =  &self._array.data.as_ints[0]
-        size = read_bitpacked_internal(py_raw, total, data_mask, native, total, bit_width)
-        return self._array[:size]
+    def read_byte_array_offsets(self, data, count):
+        """Scans count length prefixed byte arrays at the start of data.
+
+        Returns an int64 array of count + 1 offsets to the values as if the
+        length prefixes were removed, and the number of bytes scanned.
+        """
+        cdef const unsigned char[:] raw = data
+        cdef Py_ssize_t size = raw.shape[0]
+        cdef Py_ssize_t pos = 0
+        cdef long long total = 0
+        cdef unsigned int length
+        cdef int i
+        cdef int n = count
+        cdef array.array offsets = array.clone(array.array('q'), n + 1,
+                                               zero=False)
+        offsets.data.as_longlongs[0] = 0
+        for i in range(n):
+            if pos + 4 > size:
+                raise ValueError("byte array length runs past the end of data")
+            length = (raw[pos] | (raw[pos + 1] << 8) | (raw[pos + 2] << 16) |
+                      (<unsigned int>raw[pos + 3] << 24))
+            pos += 4 + length
+            if pos > size:
+                raise ValueError("byte array runs past the end of data")
+            total += length
+            offsets.data.as_longlongs[i + 1] = total
+        return offsets, pos
 
     def read_rle(self, fo, header, width):
         count = header >> 1
@@ -137,4 +117,292 @@ cdef class BinaryReader:
 
     def read_plain_byte_array_fixed(self, fo, fixed_length):
         """Reads a byte array of the given fixed_length"""
-        return fo.read(fixed_length).decode('utf-8')
\ No newline at end of file
+        return fo.read(fixed_length).decode('utf-8')
+
+# compact protocol type ids, and the thrift type of each by index.
+DEF COMPACT_STOP = 0
+DEF COMPACT_TRUE = 1
+DEF COMPACT_FALSE = 2
+DEF COMPACT_BYTE = 3
+DEF COMPACT_I16 = 4
+DEF COMPACT_I32 = 5
+DEF COMPACT_I64 = 6
+DEF COMPACT_DOUBLE = 7
+DEF COMPACT_BINARY = 8
+DEF COMPACT_LIST = 9
+DEF COMPACT_SET = 10
+DEF COMPACT_MAP = 11
+DEF COMPACT_STRUCT = 12
+DEF TTYPE_I32 = 8
+DEF TTYPE_STRING = 11
+
+cdef int COMPACT_TTYPES[13]
+COMPACT_TTYPES[:] = [0, 2, 2, 3, 6, 8, 10, 4, 11, 15, 14, 13, 12]
+
+
+cdef class CompactDecoder:
+    """Decodes thrift compact protocol structs from a buffer into new
+    instances of their classes.
+
+    fields maps every struct class to a dict of field id to a tuple of the
+    field's name, thrift type and thrift_spec type arguments. The classes in
+    keep_unknown append the value of fields they don't know to their extra
+    list.
+    """
+
+    cdef dict _fields
+    cdef tuple _keep_unknown
+
+    def __init__(self, fields, keep_unknown=()):
+        self._fields = fields
+        self._keep_unknown = tuple(keep_unknown)
+
+    def read_struct(self, cls, data, Py_ssize_t pos=0):
+        """Reads the cls struct at pos in data, returning it and the position
+        just after it."""
+        cdef const unsigned char[:] buf = data
+        try:
+            obj = self._struct(buf, &pos, cls)
+        except IndexError:
+            raise ValueError("{0} runs past the end of the buffer".format(
+                cls.__name__))
+        return obj, pos
+
+    def read_struct_lazy(self, cls, data, Py_ssize_t pos=0, lazy=()):
+        """Reads the cls struct at pos in data like read_struct, except for
+        the lists of structs named in lazy, which are skipped over. Each of
+        these fields is set to the list of the positions of its elements in
+        data instead, which read_struct can decode them from."""
+        cdef const unsigned char[:] buf = data
+        try:
+            obj = self._struct(buf, &pos, cls, frozenset(lazy))
+        except IndexError:
+            raise ValueError("{0} runs past the end of the buffer".format(
+                cls.__name__))
+        return obj, pos
+
+    cdef unsigned long long _varint(self, const unsigned char[:] buf,
+                                    Py_ssize_t *pos) except? 0:
+        cdef unsigned long long result = 0
+        cdef int shift = 0
+        cdef unsigned char byte
+        while True:
+            byte = buf[pos[0]]
+            pos[0] += 1
+            result |= (<unsigned long long>(byte & 0x7f)) << shift
+            if not byte & 0x80:
+                return result
+            shift += 7
+            if shift > 63:
+                raise ValueError("varint is longer than 64 bits")
+
+    cdef long long _zigzag(self, const unsigned char[:] buf,
+                           Py_ssize_t *pos) except? -1:
+        cdef unsigned long long value = self._varint(buf, pos)
+        return <long long>(value >> 1) ^ -(<long long>(value & 1))
+
+    cdef object _string(self, const unsigned char[:] buf, Py_ssize_t *pos):
+        cdef Py_ssize_t size = <Py_ssize_t>self._varint(buf, pos)
+        cdef Py_ssize_t start = pos[0]
+        if start + size > buf.shape[0]:
+            raise IndexError("string runs past the end of the buffer")
+        pos[0] = start + size
+        value = bytes(buf[start:start + size])
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            return value
+
+    cdef object _value(self, const unsigned char[:] buf, Py_ssize_t *pos,
+                       int ctype, object args):
+        cdef unsigned char byte
+        if ctype == COMPACT_I32 or ctype == COMPACT_I64 or \
+                ctype == COMPACT_I16:
+            return self._zigzag(buf, pos)
+        if ctype == COMPACT_BINARY:
+            return self._string(buf, pos)
+        if ctype == COMPACT_STRUCT:
+            return self._struct(buf, pos,
+                                args[0] if args is not None else None)
+        if ctype == COMPACT_LIST or ctype == COMPACT_SET:
+            return self._collection(buf, pos, args)
+        if ctype == COMPACT_MAP:
+            return self._map(buf, pos, args)
+        if ctype == COMPACT_BYTE:
+            byte = buf[pos[0]]
+            pos[0] += 1
+            return <signed char>byte
+        if ctype == COMPACT_TRUE or ctype == COMPACT_FALSE:
+            # in collections booleans take a byte.
+            byte = buf[pos[0]]
+            pos[0] += 1
+            return byte == COMPACT_TRUE
+        if ctype == COMPACT_DOUBLE:
+            if pos[0] + 8 > buf.shape[0]:
+                raise IndexError("double runs past the end of the buffer")
+            value = struct.unpack("<d", bytes(buf[pos[0]:pos[0] + 8]))[0]
+            pos[0] += 8
+            return value
+        raise ValueError("unknown compact type {0}".format(ctype))
+
+    cdef list _collection(self, const unsigned char[:] buf, Py_ssize_t *pos,
+                          object args):
+        cdef unsigned char header = buf[pos[0]]
+        cdef Py_ssize_t size = header >> 4
+        cdef Py_ssize_t i
+        cdef int ctype = header & 0x0f
+        pos[0] += 1
+        if size == 15:
+            size = <Py_ssize_t>self._varint(buf, pos)
+        element_args = args[1] if args is not None else None
+        values = []
+        if ctype == COMPACT_STRUCT:
+            cls = element_args[0] if element_args is not None else None
+            for i in range(size):
+                values.append(self._struct(buf, pos, cls))
+        else:
+            for i in range(size):
+                values.append(self._value(buf, pos, ctype, element_args))
+        return values
+
+    cdef dict _map(self, const unsigned char[:] buf, Py_ssize_t *pos,
+                   object args):
+        cdef Py_ssize_t size = <Py_ssize_t>self._varint(buf, pos)
+        cdef Py_ssize_t i
+        cdef unsigned char types
+        values = {}
+        if size == 0:
+            return values
+        types = buf[pos[0]]
+        pos[0] += 1
+        key_args = args[1] if args is not None else None
+        value_args = args[3] if args is not None else None
+        for i in range(size):
+            key = self._value(buf, pos, types >> 4, key_args)
+            values[key] = self._value(buf, pos, types & 0x0f, value_args)
+        return values
+
+    cdef list _offsets(self, const unsigned char[:] buf, Py_ssize_t *pos):
+        cdef unsigned char header = buf[pos[0]]
+        cdef Py_ssize_t size = header >> 4
+        cdef Py_ssize_t i
+        pos[0] += 1
+        if size == 15:
+            size = <Py_ssize_t>self._varint(buf, pos)
+        if size and header & 0x0f != COMPACT_STRUCT:
+            raise ValueError("expected a list of structs")
+        offsets = []
+        for i in range(size):
+            offsets.append(pos[0])
+            self._skip(buf, pos, COMPACT_STRUCT)
+        return offsets
+
+    cdef int _skip(self, const unsigned char[:] buf, Py_ssize_t *pos,
+                   int ctype) except -1:
+        # moves past a value without decoding it.
+        cdef unsigned char header
+        cdef Py_ssize_t size
+        cdef Py_ssize_t i
+        if ctype == COMPACT_I32 or ctype == COMPACT_I64 or \
+                ctype == COMPACT_I16:
+            self._varint(buf, pos)
+        elif ctype == COMPACT_BINARY:
+            size = <Py_ssize_t>self._varint(buf, pos)
+            if pos[0] + size > buf.shape[0]:
+                raise IndexError("string runs past the end of the buffer")
+            pos[0] += size
+        elif ctype == COMPACT_STRUCT:
+            while True:
+                header = buf[pos[0]]
+                pos[0] += 1
+                ctype = header & 0x0f
+                if ctype == COMPACT_STOP:
+                    return 0
+                if ctype > COMPACT_STRUCT:
+                    raise ValueError("unknown compact type {0}".format(ctype))
+                if not header >> 4:
+                    self._zigzag(buf, pos)
+                # the value of a boolean field is in its type.
+                if ctype != COMPACT_TRUE and ctype != COMPACT_FALSE:
+                    self._skip(buf, pos, ctype)
+        elif ctype == COMPACT_LIST or ctype == COMPACT_SET:
+            header = buf[pos[0]]
+            pos[0] += 1
+            size = header >> 4
+            if size == 15:
+                size = <Py_ssize_t>self._varint(buf, pos)
+            for i in range(size):
+                self._skip(buf, pos, header & 0x0f)
+        elif ctype == COMPACT_MAP:
+            size = <Py_ssize_t>self._varint(buf, pos)
+            if size:
+                header = buf[pos[0]]
+                pos[0] += 1
+                for i in range(size):
+                    self._skip(buf, pos, header >> 4)
+                    self._skip(buf, pos, header & 0x0f)
+        elif ctype == COMPACT_BYTE or ctype == COMPACT_TRUE or \
+                ctype == COMPACT_FALSE:
+            # in collections booleans take a byte.
+            buf[pos[0]]
+            pos[0] += 1
+        elif ctype == COMPACT_DOUBLE:
+            if pos[0] + 8 > buf.shape[0]:
+                raise IndexError("double runs past the end of the buffer")
+            pos[0] += 8
+        else:
+            raise ValueError("unknown compact type {0}".format(ctype))
+        return 0
+
+    cdef object _struct(self, const unsigned char[:] buf, Py_ssize_t *pos,
+                        object cls, frozenset lazy=None):
+        cdef long long fid = 0
+        cdef unsigned char header
+        cdef int ctype
+        cdef int ttype
+        cdef dict fields = None
+        cdef tuple field
+        obj = None
+        if cls is not None:
+            obj = cls()
+            fields = self._fields[cls]
+        while True:
+            header = buf[pos[0]]
+            pos[0] += 1
+            ctype = header & 0x0f
+            if ctype == COMPACT_STOP:
+                return obj
+            if ctype > COMPACT_STRUCT:
+                raise ValueError("unknown compact type {0}".format(ctype))
+            if header >> 4:
+                fid += header >> 4
+            else:
+                fid = self._zigzag(buf, pos)
+            ttype = COMPACT_TTYPES[ctype]
+            field = fields.get(fid) if fields is not None else None
+            if field is not None and field[1] != ttype:
+                # fields of an unexpected type are skipped.
+                self._value(buf, pos, ctype, None)
+            elif ctype == COMPACT_TRUE or ctype == COMPACT_FALSE:
+                # the value of a boolean field is in its type.
+                value = ctype == COMPACT_TRUE
+                if field is not None:
+                    setattr(obj, field[0], value)
+                elif isinstance(obj, self._keep_unknown):
+                    self._keep(obj, None)
+            elif lazy is not None and ctype == COMPACT_LIST and \
+                    field is not None and field[0] in lazy:
+                setattr(obj, field[0], self._offsets(buf, pos))
+            elif field is not None:
+                setattr(obj, field[0], self._value(buf, pos, ctype, field[2]))
+            else:
+                value = self._value(buf, pos, ctype, None)
+                if obj is not None and isinstance(obj, self._keep_unknown):
+                    if ttype != TTYPE_I32 and ttype != TTYPE_STRING:
+                        value = None
+                    self._keep(obj, value)
+
+    cdef _keep(self, obj, value):
+        extra = getattr(obj, 'extra', [])
+        extra.append(value)
+        obj.extra = extra
@@ -0,0 +1,41 @@
+"""Decoding of thrift compact protocol structs from in-memory buffers.
+
+thriftpy's TCompactProtocol pulls every byte through the transport and
+decodes each struct field by field in generated python. The compiled
+_optimized.CompactDecoder instead walks a buffer directly, driven by the
+thrift_spec tables of the ttypes structs, and builds the same objects.
+"""
+
+import parquet._optimized
+from parquet import ttypes
+
+
+def _struct_fields(cls):
+    """Returns a dict of field id to (name, thrift type, type arguments) for
+    the given ttypes struct."""
+    return dict((spec[0], (spec[2], spec[1], spec[3]))
+                for spec in cls.thrift_spec if spec is not None)
+
+
+STRUCTS = [cls for cls in vars(ttypes).values()
+           if isinstance(cls, type) and cls.__module__ == ttypes.__name__ and
+           hasattr(cls, 'thrift_spec')]
+
+# the generated SchemaElement.read keeps the values of unknown fields.
+_decoder = parquet._optimized.CompactDecoder(
+    dict((cls, _struct_fields(cls)) for cls in STRUCTS),
+    keep_unknown=(ttypes.SchemaElement,))
+
+
+def read_struct(cls, buf, pos=0):
+    """Decodes the compact protocol encoded cls (a ttypes struct, such as
+    FileMetaData or PageHeader) at pos in buf, which can be bytes or a
+    memoryview. Returns the struct and the position just after it."""
+    return _decoder.read_struct(cls, buf, pos)
+
+
+def read_struct_lazy(cls, buf, pos=0, lazy=()):
+    """Decodes cls like read_struct, but leaves the lists of structs named in
+    lazy encoded: these fields are set to the positions of their elements in
+    buf, to decode each of them from with read_struct when needed."""
+    return _decoder.read_struct_lazy(cls, buf, pos, lazy)
@@ -4,10 +4,13 @@ Deal with parquet logical types (aka converted types), higher-order
 things built from primitive types.
 """
 import datetime
+import decimal
 import pandas as pd
 import numpy as np
 import struct
 import sys
+from parquet.encoding import ByteArrays, fixed_bytes_to_object
+from parquet.ttypes import ConvertedType
 PY3 = sys.version_info.major > 2
 
 # define bytes->int for non 2, 4, 8 byte ints
@@ -23,6 +26,13 @@ def invert_dict(d):
     return {v:k for k, v in d.items()}
 
 
+# INT96 timestamps, as written by Impala and Spark, are the nanoseconds within
+# the day followed by the Julian day, both little endian.
+INT96_DTYPE = np.dtype([('nanos', '<i8'), ('days', '<i4')])
+JULIAN_DAY_OF_EPOCH = 2440588
+NANOS_PER_DAY = 86400 * 10**9
+
+
 def map_spark_timestamp(x):
     """Special conversion for 'timestamp' column as created by spark, and
     possibly hive. Such a column does not have a 'converted type' defined,
@@ -31,47 +41,327 @@ def map_spark_timestamp(x):
     
     Data should be a column/series of 12-byte values (INT96).
     
-    Use with series.map(map_spark_timestamp)
+    Use with series.map(map_spark_timestamp), or int96_to_datetime64 to
+    convert a whole array at once.
 
     Note that times are assumed to be UTC.    
     """
-    sec, days = struct.unpack('<ql', x)
-    return datetime.datetime.fromtimestamp((days - 2440588) * 86400 + sec / 1000000000)
+    # numpy drops the trailing zero bytes of fixed width byte strings.
+    nanos, days = struct.unpack('<ql', x.ljust(12, b'\0'))
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(
+        days=days - JULIAN_DAY_OF_EPOCH, microseconds=nanos // 1000)
 
 
-def convert_column(data, schemae):
-    """Convert known types from primitive to rich.
-    Designed for pandas series."""
-    ctype = types_i[schemae.converted_type]
-    if  ctype == 'DECIMAL':
-        scale = 10**schemae.extra[0]
-        precision = schemae.extra[1]   # not used - defined by byte width
-        if data.dtype == object:
-            out = data.map(b2int) / scale
+def int96_to_datetime64(values):
+    """Converts an array of 12-byte INT96 timestamps to datetime64[ns] (UTC)
+    by viewing them as (nanos, days) records. Nulls of a masked array become
+    NaT."""
+    mask = None
+    if isinstance(values, np.ma.MaskedArray):
+        mask = np.ma.getmaskarray(values)
+        values = values.data
+    records = np.ascontiguousarray(values, dtype='S12').view(INT96_DTYPE)
+    out = (records['days'].astype(np.int64) - JULIAN_DAY_OF_EPOCH) * \
+        NANOS_PER_DAY + records['nanos']
+    out = out.view('datetime64[ns]')
+    if mask is not None:
+        out[mask] = np.datetime64('NaT')
+    return out
+
+
+def int96_to_int(values):
+    """Converts an array of 12-byte INT96 values to an object array of the
+    python ints (nanos << 32 | days) they're shown as when they aren't
+    timestamps. Nulls of a masked array become None."""
+    data = np.ascontiguousarray(np.ma.getdata(values), dtype='S12')
+    records = data.view(INT96_DTYPE)
+    out = (records['nanos'].astype(object) << 32) | \
+        records['days'].astype(object)
+    if isinstance(values, np.ma.MaskedArray):
+        out[np.ma.getmaskarray(values)] = None
+    return out
+
+
+def has_int96_timestamps(footer):
+    """Returns True if the file was written by Spark or Impala, which store
+    timestamps as INT96."""
+    for kv in footer.key_value_metadata or []:
+        if kv.key.startswith('org.apache.spark.'):
+            return True
+    created_by = (footer.created_by or '').lower()
+    return created_by.startswith('impala') or 'spark' in created_by
+
+
+# wide enough for any DECIMAL parquet can store in 16 bytes.
+DECIMAL_CONTEXT = decimal.Context(prec=40)
+
+
+def _to_byte_arrays(values):
+    """Builds a ByteArrays from a sequence of bytes, None being empty."""
+    values = [v or b'' for v in values]
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum([len(v) for v in values], out=offsets[1:])
+    data = np.frombuffer(b''.join(values), dtype=np.uint8)
+    return ByteArrays(data, offsets)
+
+
+def _decimal_bytes(values):
+    """Returns big endian two's complement values as a uint8 matrix with a
+    row per value, right aligned and sign extended to the widest value."""
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'S':
+        # FIXED_LEN_BYTE_ARRAY values, already a matrix.
+        width = values.dtype.itemsize
+        return np.ascontiguousarray(values).view(np.uint8).reshape(-1, width)
+    if not isinstance(values, ByteArrays):
+        values = _to_byte_arrays(values)
+    count = len(values)
+    lengths = values.lengths()
+    width = max(int(lengths.max()) if count else 0, 1)
+    starts = values.offsets[:-1]
+    out = np.zeros((count, width), dtype=np.uint8)
+    nonempty = lengths > 0
+    negative = np.zeros(count, dtype=bool)
+    negative[nonempty] = values.data[starts[nonempty]] >= 0x80
+    out[negative] = 0xff
+    # the row and column of every byte of every value.
+    rows = np.repeat(np.arange(count), lengths)
+    positions = np.arange(values.offsets[0], values.offsets[-1])
+    cols = positions - np.repeat(starts, lengths) + \
+        np.repeat(width - lengths, lengths)
+    out[rows, cols] = values.data[positions]
+    return out
+
+
+def _sign_extend(matrix, width):
+    count, n = matrix.shape
+    if n == width:
+        return matrix
+    if n > width:
+        raise ValueError("DECIMAL values of {0} bytes are not supported"
+                         .format(n))
+    out = np.zeros((count, width), dtype=np.uint8)
+    out[matrix[:, 0] >= 0x80] = 0xff
+    out[:, width - n:] = matrix
+    return out
+
+
+def unscaled_decimals(values):
+    """Returns the unscaled integers of raw DECIMAL values as a tuple of an
+    int64 array of high words, None if all the values fit in 8 bytes, and an
+    array of low words (int64, or uint64 if there are high words). values are
+    int32 or int64 arrays, or big endian two's complement bytes."""
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'iu':
+        return None, values.astype(np.int64)
+    matrix = _decimal_bytes(values)
+    if matrix.shape[1] <= 8:
+        words = _sign_extend(matrix, 8)
+        return None, words.view('>i8').reshape(-1).astype(np.int64)
+    words = _sign_extend(matrix, 16)
+    high = np.ascontiguousarray(words[:, :8]).view('>i8').reshape(-1)
+    low = np.ascontiguousarray(words[:, 8:]).view('>u8').reshape(-1)
+    return high.astype(np.int64), low.astype(np.uint64)
+
+
+def decimal_column(values, scale, to='float'):
+    """Converts the raw values of a DECIMAL column in bulk, to float64 values
+    ('float'), the unscaled int64 values ('int', leaving the scale to the
+    caller) or exact decimal.Decimal objects ('decimal'). The Decimals are
+    only built when asked for. Nulls of a masked array stay null."""
+    mask = None
+    if isinstance(values, np.ma.MaskedArray):
+        mask = np.ma.getmaskarray(values)
+        values = values.data
+    scale = scale or 0
+    high, low = unscaled_decimals(values)
+    if to == 'float':
+        if high is not None:
+            # add the words as signed values, so that small negative values
+            # don't cancel out.
+            signed = low.view(np.int64)
+            out = signed.astype(np.float64)
+            out += (high + (signed < 0)).astype(np.float64) * 2.0 ** 64
+        else:
+            out = low.astype(np.float64)
+        out /= 10.0 ** scale
+    elif to == 'int':
+        if high is not None:
+            out = low.view(np.int64)
+            # only fits if the high word just extends the sign of the low.
+            if not (high == out >> 63).all():
+                raise OverflowError("DECIMAL values don't fit in int64")
         else:
-            out = data / scale
-    elif ctype == 'DATE':
-        # NB: If there are both DATE and TIME_MILLIS, should combine to
-        # datetime as done in map_spark_timestamp
-        out = (data * 86400000000000).astype('datetime64[ns]')
-    elif ctype == 'TIME_MILLIS':
-        out = (data * 1e6).astype('timedelta64[ns]')
-    elif ctype == 'TIMESTAMP_MILLIS':
-        out = pd.to_datetime(data, unit='ms')        
-    elif ctype == 'UTF8':
-        ## TODO: need decoder for py2
-        out = data.map(bytes.decode) if PY3 else out
-    elif ctype[0] == "U":
-        # unsigned integers of various widths
-        arr = data.values
-        arr.dtype = np.dtype('u' + arr.dtype.name)
-        out = pd.Series(arr)
+            out = low
+    elif to == 'decimal':
+        if high is None:
+            ints = low.tolist()
+        else:
+            ints = [h << 64 | l for h, l in zip(high.tolist(), low.tolist())]
+        out = np.empty(len(ints), dtype=object)
+        out[:] = [decimal.Decimal(i).scaleb(-scale, DECIMAL_CONTEXT)
+                  for i in ints]
     else:
-        print("Converted type %i not handled" % ctype)
-        out = data
+        raise ValueError("Unknown DECIMAL conversion {0!r}".format(to))
+    if mask is not None:
+        out = np.ma.MaskedArray(out, mask=mask)
+    return out
+
+
+def decode_utf8(values):
+    """Decodes the bytes in an object array of UTF8 values in bulk. Pages are
+    decoded as they are read, so values that are already str (or None) are
+    left as they are."""
+    values = np.asarray(values, dtype=object)
+    encoded = np.array([isinstance(v, bytes) for v in values], dtype=bool)
+    if not encoded.any():
+        return values
+    out = values.copy()
+    out[encoded] = _to_byte_arrays(values[encoded]).decode()
     return out
 
 
+def _narrow(dtype):
+    def convert(values, schemae, **options):
+        return values.astype(dtype)
+    return convert
+
+
+def _reinterpret(dtype):
+    def convert(values, schemae, **options):
+        # same width, so the bits are just viewed as the other type.
+        return np.ascontiguousarray(values).view(dtype)
+    return convert
+
+
+def _time_unit(dtype, unit):
+    def convert(values, schemae, **options):
+        return values.astype(np.int64).view(
+            '{0}[{1}]'.format(dtype, unit)).astype('{0}[ns]'.format(dtype))
+    return convert
+
+
+def _convert_decimal(values, schemae, decimals='float', **options):
+    return decimal_column(values, schemae.scale, decimals)
+
+
+def _convert_utf8(values, schemae, **options):
+    return decode_utf8(values)
+
+
+# an INTERVAL is three little endian uint32: months, days and milliseconds.
+INTERVAL_DTYPE = np.dtype([('months', '<u4'), ('days', '<u4'),
+                           ('millis', '<u4')])
+
+
+def _convert_interval(values, schemae, **options):
+    parts = np.ascontiguousarray(values, dtype='S12').view(INTERVAL_DTYPE)
+    # months have no fixed length, so intervals are calendar offsets.
+    out = np.empty(len(parts), dtype=object)
+    out[:] = [pd.DateOffset(months=m, days=d, milliseconds=ms)
+              for m, d, ms in zip(parts['months'].tolist(),
+                                  parts['days'].tolist(),
+                                  parts['millis'].tolist())]
+    return out
+
+
+# converted types of UTF8 text.
+TEXT_TYPES = (ConvertedType.UTF8, ConvertedType.ENUM, ConvertedType.JSON)
+
+# converted type name -> function converting a numpy array of the physical
+# values of a column (without nulls) in one go. Types missing here (MAP,
+# LIST, BSON, ...) are read as their physical values.
+converters = dict(
+    UTF8=_convert_utf8,
+    ENUM=_convert_utf8,
+    JSON=_convert_utf8,
+    DECIMAL=_convert_decimal,
+    DATE=_time_unit('datetime64', 'D'),
+    TIME_MILLIS=_time_unit('timedelta64', 'ms'),
+    TIME_MICROS=_time_unit('timedelta64', 'us'),
+    TIMESTAMP_MILLIS=_time_unit('datetime64', 'ms'),
+    TIMESTAMP_MICROS=_time_unit('datetime64', 'us'),
+    UINT_8=_narrow(np.uint8),
+    UINT_16=_narrow(np.uint16),
+    UINT_32=_reinterpret(np.uint32),
+    UINT_64=_reinterpret(np.uint64),
+    INT_8=_narrow(np.int8),
+    INT_16=_narrow(np.int16),
+    INT_32=_narrow(np.int32),
+    INT_64=_narrow(np.int64),
+    INTERVAL=_convert_interval,
+)
+
+
+def convert_array(values, schemae, **options):
+    """Converts a numpy array of the physical values of a column to its
+    converted type, if it has one. Masked arrays keep their mask, except
+    for dates and times whose nulls become NaT.
+
+    options are passed on to the converters, e.g. decimals (see
+    decimal_column).
+    """
+    convert = converters.get(types_i.get(schemae.converted_type))
+    if convert is None:
+        return values
+    if not isinstance(values, np.ma.MaskedArray):
+        return convert(values, schemae, **options)
+    mask = np.ma.getmaskarray(values)
+    data = values.data
+    if data.dtype == object:
+        # the null slots hold None, which the converters don't expect.
+        data = data.copy()
+        data[mask] = data[~mask][0] if (~mask).any() else b''
+    out = convert(data, schemae, **options)
+    if out.dtype.kind in 'mM':
+        out[mask] = out.dtype.type('NaT')
+        return out
+    return np.ma.MaskedArray(out, mask=mask)
+
+
+def _series_values(data):
+    """Returns the values of a pandas series as a numpy array, masked if the
+    series is of a nullable type with nulls."""
+    dtype = data.dtype
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype) and \
+       getattr(dtype, 'numpy_dtype', None) is not None and \
+       dtype.numpy_dtype.kind in 'iufb':
+        mask = data.isna().values
+        values = data.to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+        return np.ma.MaskedArray(values, mask=mask) if mask.any() else values
+    return data.values
+
+
+def masked_to_pandas(values):
+    """Converts a masked array to the matching pandas nullable array, or an
+    object array with None for nulls, leaving anything else untouched. Fixed
+    width bytes are converted to an object array of bytes either way, as
+    pandas would drop their trailing zero bytes."""
+    if getattr(values, 'dtype', None) is not None and \
+            values.dtype.kind == 'S':
+        return fixed_bytes_to_object(values)
+    if not isinstance(values, np.ma.MaskedArray):
+        return values
+    data = values.data
+    mask = np.ma.getmaskarray(values)
+    if data.dtype.kind in 'iu':
+        return pd.arrays.IntegerArray(data, mask)
+    if data.dtype.kind == 'f':
+        return pd.arrays.FloatingArray(data, mask)
+    if data.dtype.kind == 'b':
+        return pd.arrays.BooleanArray(data, mask)
+    out = data.astype(object)
+    out[mask] = None
+    return out
+
+
+def convert_column(data, schemae, **options):
+    """Convert known types from primitive to rich.
+    Designed for pandas series, see convert_array for numpy arrays."""
+    out = masked_to_pandas(
+        convert_array(_series_values(data), schemae, **options))
+    return pd.Series(out, index=data.index,
+                     dtype=object if out.dtype == object else None)
+
+
 # github.com/Parquet/parquet-format/blob/master/src/thrift/parquet.thrift
 # list possible converted types as follows
 types = dict(
@@ -112,11 +402,21 @@ types = dict(
    #
   TIME_MILLIS = 7,
 
+   # The total number of microseconds since midnight.  The value is stored
+   # as an INT64 physical type.
+   #
+  TIME_MICROS = 8,
+
    # Date and time recorded as milliseconds since the Unix epoch.  Recorded as
    # a physical type of INT64.
    #
   TIMESTAMP_MILLIS = 9,
 
+   # Date and time recorded as microseconds since the Unix epoch.  Recorded as
+   # a physical type of INT64.
+   #
+  TIMESTAMP_MICROS = 10,
+
    # The number describes the maximum number of meainful data bits in 
    # the stored value. 8, 16 and 32 bit values are stored using the 
    # INT32 physical type.  64 bit values are stored using the INT64
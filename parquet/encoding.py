@@ -1,12 +1,27 @@
-import array
 import math
 import struct
 import io
 import logging
+import numpy as np
+try:
+    from sys import intern
+except ImportError:
+    pass  # a builtin on python 2
 import parquet._optimized
 from parquet.ttypes import Type
 
 
+# numpy dtypes for the fixed width physical types. PLAIN encoded values of
+# these types are stored back to back in little endian order, so a page can be
+# viewed as an array of them directly.
+PLAIN_DTYPES = {
+    Type.INT32: np.dtype('<i4'),
+    Type.INT64: np.dtype('<i8'),
+    Type.FLOAT: np.dtype('<f4'),
+    Type.DOUBLE: np.dtype('<f8'),
+}
+
+
 def byte_width(bit_width):
     "Returns the byte width for the given bit_width"
     return int((bit_width + 7) / 8)
@@ -17,16 +32,381 @@ def width_from_max_int(value):
     return int(math.ceil(math.log(value + 1, 2)))
 
 
-def _mask_for_bits(i):
-    """Helper function for read_bitpacked to generage a mask to grab i bits."""
-    return (1 << i) - 1
+def plain_dtype(type_, type_length=None):
+    """Returns the numpy dtype for PLAIN encoded values of the given type, or
+    None if the type isn't fixed width."""
+    if type_ == Type.FIXED_LEN_BYTE_ARRAY:
+        return np.dtype('S{0}'.format(type_length))
+    if type_ == Type.INT96:
+        return np.dtype('S12')
+    return PLAIN_DTYPES.get(type_)
+
+
+def fixed_bytes_to_object(values):
+    """Returns an array of fixed width bytes (of an 'S' dtype, as read for
+    FIXED_LEN_BYTE_ARRAY and INT96 values) as an object array of bytes, None
+    where masked. Unlike astype(object), this keeps trailing zero bytes."""
+    data = np.ascontiguousarray(np.ma.getdata(values))
+    width = data.dtype.itemsize
+    rows = data.view(np.uint8).reshape(len(data), width)
+    out = np.empty(len(data), dtype=object)
+    out[:] = [row.tobytes() for row in rows]
+    if isinstance(values, np.ma.MaskedArray):
+        out[np.ma.getmaskarray(values)] = None
+    return out
+
+
+class BufferReader(object):
+    """A read-only file-like object over a buffer (bytes, a memoryview or an
+    mmap), like io.BytesIO but without copying the buffer. read() returns
+    bytes, while getbuffer() and read_buffer() give memoryviews of it."""
+
+    def __init__(self, data):
+        self._view = memoryview(data)
+        if self._view.ndim != 1 or self._view.itemsize != 1:
+            self._view = self._view.cast('B')
+        self._mmap = None
+        self._pos = 0
+
+    @classmethod
+    def from_mmap(cls, mapping):
+        """Wraps an mmap, which is closed along with the reader."""
+        reader = cls(mapping)
+        reader._mmap = mapping
+        return reader
+
+    def getbuffer(self):
+        return self._view
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self._view.nbytes
+        if offset < 0:
+            raise ValueError("negative seek position {0}".format(offset))
+        self._pos = offset
+        return offset
+
+    def read(self, size=-1):
+        return self.read_buffer(size).tobytes()
+
+    def read_buffer(self, size=-1):
+        """Like read, but returns a memoryview of the buffer."""
+        start = min(self._pos, self._view.nbytes)
+        stop = self._view.nbytes if size is None or size < 0 else \
+            min(start + size, self._view.nbytes)
+        self._pos = stop
+        return self._view[start:stop]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._mmap is not None:
+            try:
+                self._view.release()
+                self._mmap.close()
+            except BufferError:
+                # arrays read still point into the mapping, which is unmapped
+                # once they are gone.
+                pass
+            self._mmap = None
+
+
+def read_buffer(fo, size):
+    """Reads size bytes from fo. For BytesIO and BufferReader objects a
+    memoryview over the underlying buffer is returned instead of a copy."""
+    if isinstance(fo, BufferReader):
+        return fo.read_buffer(size)
+    if isinstance(fo, io.BytesIO):
+        start = fo.tell()
+        data = fo.getbuffer()[start:start + size]
+        fo.seek(len(data), 1)
+        return data
+    return fo.read(size)
+
+
+def read_plain_array(fo, dtype, count):
+    """Reads count PLAIN encoded values of the given fixed width dtype in one
+    go, returning them as a numpy array."""
+    data = read_buffer(fo, count * dtype.itemsize)
+    return np.frombuffer(data, dtype=dtype, count=count)
+
+
+def read_plain_boolean_array(fo, count, packed=False):
+    """Reads count PLAIN encoded BOOLEAN values, which are bit-packed least
+    significant bit first, returning a bool numpy array. If packed is set the
+    bitmap is returned as is, as a uint8 array of (count + 7) // 8 bytes."""
+    data = np.frombuffer(read_buffer(fo, (count + 7) // 8), dtype=np.uint8)
+    if packed:
+        return data
+    return np.unpackbits(data, count=count, bitorder='little').view(np.bool_)
+
+
+def unpack_bits(data, bit_width, count):
+    """Unpacks count values of bit_width bits each from data, packed starting
+    at the least significant bit as in the rle/bit-packed hybrid encoding.
+
+    Returns an int32 numpy array, or int64 for widths above 32 bits.
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if bit_width == 0:
+        return np.zeros(count, dtype=np.int32)
+    count = min(count, raw.size * 8 // bit_width)
+    if bit_width == 8:
+        return raw[:count].astype(np.int32)
+    bits = np.unpackbits(raw, bitorder='little')[:count * bit_width]
+    # widen every value to 32 (or 64) bits and pack them back into little
+    # endian ints.
+    width = 32 if bit_width <= 32 else 64
+    padded = np.zeros((count, width), dtype=np.uint8)
+    padded[:, :bit_width] = bits.reshape(count, bit_width)
+    packed = np.packbits(padded, axis=1, bitorder='little')
+    return packed.view('<i4' if width == 32 else '<i8').ravel()
+
+
+def unpack_bits_msb(data, bit_width, count):
+    """Unpacks count values of bit_width bits each from data, packed starting
+    at the most significant bit as in the deprecated BIT_PACKED encoding.
+
+    Returns an int32 numpy array. Supports widths up to 32 bits.
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if bit_width == 0:
+        return np.zeros(count, dtype=np.int32)
+    count = min(count, raw.size * 8 // bit_width)
+    bits = np.unpackbits(raw)[:count * bit_width]
+    # right align every value in 32 bits and pack them into big endian ints.
+    padded = np.zeros((count, 32), dtype=np.uint8)
+    padded[:, 32 - bit_width:] = bits.reshape(count, bit_width)
+    packed = np.packbits(padded, axis=1)
+    return packed.view('>i4').ravel().astype(np.int32)
+
+
+def _read_unsigned_var_int(buf, pos):
+    """Reads a ULEB128 varint from buf at pos, returning it and the position
+    after it."""
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if (byte & 0x80) == 0:
+            return result, pos
+        shift += 7
+
+
+def _read_zigzag_var_int(buf, pos):
+    """Reads a zigzag encoded varint from buf at pos."""
+    value, pos = _read_unsigned_var_int(buf, pos)
+    return (value >> 1) ^ -(value & 1), pos
+
+
+def _remaining_buffer(fo):
+    """Returns everything from fo's position onwards without moving it, as a
+    memoryview for BytesIO objects."""
+    start = fo.tell()
+    if isinstance(fo, (io.BytesIO, BufferReader)):
+        return fo.getbuffer()[start:]
+    data = fo.read()
+    fo.seek(start, 0)
+    return data
+
+
+def read_delta_binary_packed(fo):
+    """Decodes a DELTA_BINARY_PACKED run from fo, returning the values as an
+    int64 numpy array and leaving fo positioned after the run.
+
+    The miniblocks are bit unpacked with unpack_bits and the deltas summed
+    with numpy; only the block headers are parsed in python.
+    """
+    start = fo.tell()
+    buf = _remaining_buffer(fo)
+    block_size, pos = _read_unsigned_var_int(buf, 0)
+    num_miniblocks, pos = _read_unsigned_var_int(buf, pos)
+    total, pos = _read_unsigned_var_int(buf, pos)
+    first, pos = _read_zigzag_var_int(buf, pos)
+    per_miniblock = block_size // num_miniblocks
+
+    num_deltas = max(total - 1, 0)
+    deltas = np.empty(num_deltas, dtype=np.int64)
+    seen = 0
+    while seen < num_deltas:
+        min_delta, pos = _read_zigzag_var_int(buf, pos)
+        bit_widths = bytearray(buf[pos:pos + num_miniblocks])
+        pos += num_miniblocks
+        for bit_width in bit_widths:
+            if seen >= num_deltas:
+                # unneeded miniblocks of the last block have no body.
+                break
+            size = bit_width * per_miniblock // 8
+            packed = unpack_bits(buf[pos:pos + size], bit_width, per_miniblock)
+            pos += size
+            if packed.dtype == np.int32:
+                packed = packed.view(np.uint32)
+            n = min(per_miniblock, num_deltas - seen)
+            # int64 arithmetic wraps around, as the encoding expects.
+            deltas[seen:seen + n] = packed[:n].astype(np.int64) + \
+                np.int64(min_delta)
+            seen += n
+    fo.seek(start + pos, 0)
+
+    values = np.empty(total, dtype=np.int64)
+    if total:
+        values[0] = first
+        np.cumsum(deltas, out=values[1:])
+        values[1:] += np.int64(first)
+    return values
+
+
+def read_delta_length_byte_array(fo):
+    """Decodes a DELTA_LENGTH_BYTE_ARRAY run from fo: delta packed lengths
+    followed by the concatenated values. Returns a ByteArrays whose data is
+    viewed over fo's buffer."""
+    lengths = read_delta_binary_packed(fo)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    data = np.frombuffer(read_buffer(fo, offsets[-1]), dtype=np.uint8)
+    if len(data) != offsets[-1]:
+        raise ValueError("byte array runs past the end of data")
+    return ByteArrays(data, offsets)
+
+
+def read_delta_byte_array(fo):
+    """Decodes a DELTA_BYTE_ARRAY (front coded) run from fo: delta packed
+    prefix lengths followed by the suffixes as DELTA_LENGTH_BYTE_ARRAY.
+    Returns a ByteArrays.
+
+    Each value is the first prefix_length bytes of the previous value plus
+    its suffix. Rather than building the values one by one, every prefix
+    byte is pointed at the same position of the previous value and the
+    pointers are followed by repeated doubling until they all land on a
+    suffix byte.
+    """
+    prefix_lengths = read_delta_binary_packed(fo)
+    suffixes = read_delta_length_byte_array(fo)
+    count = len(prefix_lengths)
+    lengths = prefix_lengths + suffixes.lengths()
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    value_index = np.repeat(np.arange(count), lengths)
+    position = np.arange(offsets[-1], dtype=np.int64) - offsets[value_index]
+    in_prefix = position < prefix_lengths[value_index]
+    if count and prefix_lengths[0] != 0:
+        raise ValueError("the first value can't have a prefix")
+    if (prefix_lengths[1:] > lengths[:-1]).any():
+        raise ValueError("prefix longer than the previous value")
+
+    data = np.empty(offsets[-1], dtype=np.uint8)
+    data[~in_prefix] = suffixes.data
+    source = np.arange(offsets[-1], dtype=np.int64)
+    source[in_prefix] = (offsets[value_index[in_prefix] - 1] +
+                         position[in_prefix])
+    while True:
+        followed = source[source]
+        if (followed == source).all():
+            break
+        source = followed
+    data[in_prefix] = data[source[in_prefix]]
+    return ByteArrays(data, offsets)
+
+
+class ByteArrays(object):
+    """BYTE_ARRAY values stored Arrow style as one contiguous uint8 data
+    buffer and an int64 offsets array, value i being
+    data[offsets[i]:offsets[i + 1]]."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) and key.step in (None, 1):
+            start, stop, _ = key.indices(len(self))
+            offsets = self.offsets[start:max(start, stop) + 1]
+            return ByteArrays(self.data[offsets[0]:offsets[-1]],
+                              offsets - offsets[0])
+        if isinstance(key, slice):
+            return self.take(np.arange(len(self))[key])
+        if np.ndim(key) == 0:
+            if key < 0:
+                key += len(self)
+            return self.data[self.offsets[key]:self.offsets[key + 1]].tobytes()
+        return self.take(key)
+
+    def __repr__(self):
+        return "ByteArrays({0!r})".format(self.to_numpy().tolist())
+
+    def lengths(self):
+        """Returns the length of every value."""
+        return np.diff(self.offsets)
+
+    def take(self, indices):
+        """Returns a ByteArrays of the values at the given indices, gathering
+        the bytes without creating an object per value."""
+        indices = np.asarray(indices)
+        lengths = self.lengths()[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # the source position of every output byte.
+        shift = np.repeat(self.offsets[indices] - offsets[:-1], lengths)
+        gather = np.arange(offsets[-1], dtype=np.int64) + shift
+        return ByteArrays(self.data[gather], offsets)
+
+    @classmethod
+    def concat(cls, arrays):
+        """Joins several ByteArrays into one."""
+        offsets = [np.zeros(1, dtype=np.int64)]
+        total = 0
+        for a in arrays:
+            offsets.append(a.offsets[1:] - a.offsets[0] + total)
+            total += a.offsets[-1] - a.offsets[0]
+        data = np.concatenate([a.data[a.offsets[0]:a.offsets[-1]]
+                               for a in arrays] or [np.empty(0, np.uint8)])
+        return cls(data, np.concatenate(offsets))
+
+    def to_numpy(self):
+        """Returns the values as an object array of bytes."""
+        data = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        out = np.empty(len(self), dtype=object)
+        out[:] = [data[a:b] for a, b in zip(offsets, offsets[1:])]
+        return out
+
+    def decode(self, encoding='utf-8', interned=False):
+        """Decodes all the values in bulk, returning an object array of
+        str. If interned is set the strings are interned, so that equal
+        values decoded from different pages share one object."""
+        offsets = self.offsets.tolist()
+        out = np.empty(len(self), dtype=object)
+        if encoding == 'utf-8' and not (self.data >= 0x80).any():
+            # ascii only, so byte offsets are also character offsets.
+            text = self.data.tobytes().decode('ascii')
+            values = [text[a:b] for a, b in zip(offsets, offsets[1:])]
+        else:
+            data = self.data.tobytes()
+            values = [data[a:b].decode(encoding)
+                      for a, b in zip(offsets, offsets[1:])]
+        out[:] = [intern(v) for v in values] if interned else values
+        return out
 
 
 class Encoding(object):
     def __init__(self, bit_width):
         self._bit_width = bit_width
         self._byte_width = byte_width(bit_width)
-        self._mask = _mask_for_bits(bit_width)
         self._fast_reader = parquet._optimized.BinaryReader()
         self._DECODE_PLAIN = {
             Type.BOOLEAN: self._fast_reader.read_plain_boolean,
@@ -39,12 +419,25 @@ class Encoding(object):
             Type.FIXED_LEN_BYTE_ARRAY: self._fast_reader.read_plain_byte_array_fixed
         }
 
-    def filter_values(self, dictionary, values, definition_levels):
-        return self._fast_reader.filter_values(dictionary, values, definition_levels)
-
     def read_plain(self, fo, type_, type_length):
         return self._DECODE_PLAIN[type_](fo, type_length)
 
+    def read_plain_byte_arrays(self, fo, count):
+        """Reads count PLAIN encoded BYTE_ARRAY values from fo into a
+        ByteArrays, scanning the length prefixes once and copying the value
+        bytes into a single buffer."""
+        start = fo.tell()
+        buf = _remaining_buffer(fo)
+        offsets, size = self._fast_reader.read_byte_array_offsets(buf, count)
+        fo.seek(start + size, 0)
+        offsets = np.frombuffer(offsets, dtype=np.int64)
+        # drop the four length bytes in front of every value.
+        keep = np.ones(size, dtype=bool)
+        prefixes = offsets[:-1] + 4 * np.arange(count, dtype=np.int64)
+        keep[(prefixes[:, None] + np.arange(4)).ravel()] = False
+        data = np.frombuffer(buf, dtype=np.uint8, count=size)[keep]
+        return ByteArrays(data, offsets)
+
     def read_rle(self, fo, header):
         """Read a run-length encoded run from the given fo with the given header
         and bit_width.
@@ -62,54 +455,59 @@ class Encoding(object):
         num_groups = header >> 1
         count = num_groups * 8
         byte_count = int((self._bit_width * count)/8)
-        data = fo.read(byte_count)
-        return self.read_bitpacked_data(data)
+        data = read_buffer(fo, byte_count)
+        return unpack_bits(data, self._bit_width, count)
 
 
-    def read_bitpacked_data(self, data):
-        return self._fast_reader.read_bitpacked_data(data, self._mask, self._bit_width)
+    def read_bitpacked_deprecated(self, fo, byte_count, count):
+        """Reads count values of the deprecated BIT_PACKED encoding, which
+        packs from the most significant bit, as an int32 numpy array."""
+        data = read_buffer(fo, byte_count)
+        return unpack_bits_msb(data, self._bit_width, count)
 
 
-    def read_bitpacked_deprecated(self, fo, byte_count, count):
-        raw_bytes = array.array('B', fo.read(byte_count)).tolist()
-
-        mask = self._mask
-        index = 0
-        res = []
-        word = 0
-        bits_in_word = 0
-        while len(res) < count and index <= len(raw_bytes):
-            if bits_in_word >= self._bit_width:
-                # how many bits over the value is stored
-                offset = (bits_in_word - self._bit_width)
-                # figure out the value
-                value = (word & (mask << offset)) >> offset
-                res.append(value)
-
-                bits_in_word -= self._bit_width
-            else:
-                word = (word << 8) | raw_bytes[index]
-                index += 1
-                bits_in_word += 8
-        return res
+    def _read_rle_value(self, fo):
+        """Reads the value repeated by a run-length encoded run."""
+        data = fo.read(self._byte_width)
+        return struct.unpack("<i", data + b"\x00" * (4 - len(data)))[0]
 
 
-    def read_rle_bit_packed_hybrid(self, fo, length=None):
+    def read_rle_bit_packed_hybrid(self, fo, length=None, count=None):
         """Implementation of a decoder for the rel/bit-packed hybrid encoding.
 
         If length is not specified, then a 32-bit int is read first to grab the
-        length of the encoded data.
+        length of the encoded data. If count is specified, the values are
+        written into an array preallocated to that size and decoding stops
+        once it's full. Returns a numpy int32 array.
         """
-        io_obj = fo
         if length is None:
             length = self._fast_reader.read_plain_int32(fo)
-        start = io_obj.tell()
-        limit = length + start
-        res = []
-        while io_obj.tell() < limit:
-            header = self._fast_reader.read_unsigned_var_int(io_obj)
+        limit = fo.tell() + length
+        if count is None:
+            runs = []
+            while fo.tell() < limit:
+                header = self._fast_reader.read_unsigned_var_int(fo)
+                if header & 1 == 0:
+                    runs.append(np.full(header >> 1, self._read_rle_value(fo),
+                                        dtype=np.int32))
+                else:
+                    runs.append(self.read_bitpacked(fo, header))
+            if not runs:
+                return np.empty(0, dtype=np.int32)
+            return np.concatenate(runs)
+
+        res = np.empty(count, dtype=np.int32)
+        pos = 0
+        while pos < count and fo.tell() < limit:
+            header = self._fast_reader.read_unsigned_var_int(fo)
             if header & 1 == 0:
-                res += self.read_rle(io_obj, header)
+                run_length = min(header >> 1, count - pos)
+                res[pos:pos + run_length] = self._read_rle_value(fo)
             else:
-                res += self.read_bitpacked(io_obj, header)
-        return res
+                values = self.read_bitpacked(fo, header)
+                run_length = min(len(values), count - pos)
+                res[pos:pos + run_length] = values[:run_length]
+            pos += run_length
+        # skip the padding of the last run, if any.
+        fo.seek(limit, 0)
+        return res[:pos]
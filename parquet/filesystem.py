@@ -0,0 +1,292 @@
+"""Filesystems the files of a parquet dataset are read from.
+
+A FileSystem opens files and reads byte ranges from them. Readers hand
+read_ranges every range they need from a file at once, so a backend for
+remote storage can fetch them concurrently or merge them into fewer
+requests. LocalFileSystem and MemoryFileSystem are the reference backends.
+
+By default the ranges are planned with coalesce_ranges, which merges ranges
+close to each other so that they take one read. Reading the few bytes in
+between is much cheaper than another request on remote storage.
+"""
+
+import mmap
+import os.path
+import posixpath
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from parquet import encoding
+
+
+# ranges at most this many bytes apart are read together by default.
+DEFAULT_COALESCE_GAP = 8 * 1024
+
+
+def coalesce_ranges(ranges, max_gap):
+    """Plans the reads of the given (offset, length) ranges, merging ranges
+    that overlap or are at most max_gap bytes apart.
+
+    Returns the list of (offset, length) reads, in file order, and for every
+    range the index of the read holding it and its offset in that read.
+    """
+    order = sorted(range(len(ranges)), key=lambda i: ranges[i][0])
+    reads = []
+    placement = [None] * len(ranges)
+    end = None
+    for i in order:
+        offset, length = ranges[i]
+        if end is None or offset > end + max_gap:
+            reads.append([offset, length])
+        else:
+            start = reads[-1][0]
+            reads[-1][1] = max(end, offset + length) - start
+        start = reads[-1][0]
+        end = start + reads[-1][1]
+        placement[i] = (len(reads) - 1, offset - start)
+    return [tuple(r) for r in reads], placement
+
+
+def open_file(filename, memory_map=False):
+    """Opens the given file for reading. If memory_map is set the file is
+    mapped into memory instead, and returned as an encoding.BufferReader so
+    that pages are decoded from the mapping without being copied."""
+    if not memory_map:
+        return open(filename, 'rb')
+    with open(filename, 'rb') as fo:
+        # the mapping stays valid once the file is closed.
+        return encoding.BufferReader.from_mmap(
+            mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class FileSystem(object):
+    """The interface of a filesystem. Subclasses implement open and
+    is_directory, and may override read_range to fetch a single range, or
+    read_ranges to fetch them concurrently.
+
+    Ranges at most coalesce_gap bytes apart are fetched with one read.
+    """
+
+    def __init__(self, coalesce_gap=DEFAULT_COALESCE_GAP):
+        self.coalesce_gap = coalesce_gap
+
+    def open(self, path):
+        """Opens the file at path for reading, returning a seekable binary
+        file object, which the caller closes."""
+        raise NotImplementedError()
+
+    def is_directory(self, path):
+        """Returns True if path is a directory."""
+        raise NotImplementedError()
+
+    def join(self, directory, name):
+        """Returns the path of the file name in directory."""
+        return posixpath.join(directory, name)
+
+    def stat(self, path):
+        """Returns the (size, modification time) of the file at path, or None
+        if the filesystem can't tell when a file changes. The metadata of
+        files is only cached if they can be statted."""
+        return None
+
+    def handle_key(self, path):
+        """Returns the key under which open handles of the file at path are
+        shared in a FilePool."""
+        return (self, path)
+
+    def read_range(self, fileobj, offset, length):
+        """Reads length bytes at offset of the open fileobj, or fewer at the
+        end of the file."""
+        fileobj.seek(offset, 0)
+        return encoding.read_buffer(fileobj, length)
+
+    def read_ranges(self, fileobj, ranges):
+        """Reads the given (offset, length) ranges of the open fileobj,
+        returning a buffer (bytes or a memoryview) for every range in order.
+        Ranges running past the end of the file are cut short.
+
+        The ranges are merged by coalesce_ranges and the merged reads
+        fetched one after the other with read_range.
+        """
+        reads, placement = coalesce_ranges(ranges, self.coalesce_gap)
+        data = [memoryview(self.read_range(fileobj, offset, length))
+                for offset, length in reads]
+        return [data[i][start:start + length]
+                for (i, start), (_, length) in zip(placement, ranges)]
+
+
+class LocalFileSystem(FileSystem):
+    """The local filesystem. If memory_map is set, files are memory mapped
+    and ranges are views of the mapping."""
+
+    def __init__(self, memory_map=False,
+                 coalesce_gap=DEFAULT_COALESCE_GAP):
+        super(LocalFileSystem, self).__init__(coalesce_gap)
+        self.memory_map = memory_map
+
+    def open(self, path):
+        return open_file(path, self.memory_map)
+
+    def is_directory(self, path):
+        return os.path.isdir(path)
+
+    def stat(self, path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime
+
+    def handle_key(self, path):
+        # any LocalFileSystem can share the handles of another.
+        return (LocalFileSystem, self.memory_map, os.path.abspath(path))
+
+    def join(self, directory, name):
+        return os.path.join(directory, name)
+
+
+class MemoryFileSystem(FileSystem):
+    """A filesystem of in-memory files, given as a dict of path to contents.
+    Directories are the prefixes of the paths, and files are opened as
+    encoding.BufferReader views of their contents."""
+
+    def __init__(self, files=None, coalesce_gap=DEFAULT_COALESCE_GAP):
+        super(MemoryFileSystem, self).__init__(coalesce_gap)
+        self.files = dict(files or {})
+
+    def open(self, path):
+        try:
+            return encoding.BufferReader(self.files[path])
+        except KeyError:
+            raise IOError("No such file: {0}".format(path))
+
+    def is_directory(self, path):
+        prefix = path.rstrip("/") + "/"
+        return path not in self.files and \
+            any(p.startswith(prefix) for p in self.files)
+
+
+# the number of files a FilePool keeps open by default.
+DEFAULT_MAX_OPEN_FILES = 128
+
+
+class FilePool(object):
+    """A pool of open file handles, keyed by FileSystem.handle_key.
+
+    Handles are checked out for the duration of a read and returned to the
+    pool afterwards, so readers of the same files share them without using
+    one at the same time. Once more than max_open handles are open, the
+    least recently used idle ones are closed, and reopened when needed
+    again. hits and misses count the checkouts that found an idle handle
+    and those that opened one, evictions the handles closed to stay within
+    max_open.
+
+    Handles are closed with the closer given when they were opened, or
+    their close method.
+    """
+
+    def __init__(self, max_open=DEFAULT_MAX_OPEN_FILES):
+        self.max_open = max_open
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # the idle handles of every key, least recently used key first.
+        self._idle = OrderedDict()
+        self._num_idle = 0
+        self._in_use = 0
+        # the closers of the open handles, by id.
+        self._closers = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Returns the number of open handles, idle or in use."""
+        with self._lock:
+            return self._num_idle + self._in_use
+
+    def acquire(self, key, opener, closer=None):
+        """Checks out an open handle for key, calling opener to open one if
+        there is no idle handle for it. closer(handle) closes the handle
+        opened, if given."""
+        with self._lock:
+            handles = self._idle.get(key)
+            if handles:
+                self.hits += 1
+                self._in_use += 1
+                self._num_idle -= 1
+                fileobj = handles.pop()
+                if not handles:
+                    del self._idle[key]
+                return fileobj
+            self.misses += 1
+            evicted = self._evict(self.max_open - 1 - self._in_use)
+            self._in_use += 1
+        self._close(evicted)
+        try:
+            fileobj = opener()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+            raise
+        if closer is not None:
+            with self._lock:
+                self._closers[id(fileobj)] = closer
+        return fileobj
+
+    def release(self, key, fileobj):
+        """Returns a handle checked out with acquire to the pool."""
+        with self._lock:
+            self._in_use -= 1
+            self._idle.setdefault(key, []).append(fileobj)
+            self._idle.move_to_end(key)
+            self._num_idle += 1
+            evicted = self._evict(self.max_open - self._in_use)
+        self._close(evicted)
+
+    @contextmanager
+    def open(self, key, opener, closer=None):
+        """Checks out a handle for key (see acquire) for the duration of the
+        with block."""
+        fileobj = self.acquire(key, opener, closer)
+        try:
+            yield fileobj
+        finally:
+            self.release(key, fileobj)
+
+    def discard(self, key):
+        """Closes the idle handles for key."""
+        with self._lock:
+            evicted = self._idle.pop(key, [])
+            self._num_idle -= len(evicted)
+        self._close(evicted)
+
+    def clear(self):
+        """Closes all the idle handles."""
+        with self._lock:
+            evicted = [h for handles in self._idle.values() for h in handles]
+            self._idle.clear()
+            self._num_idle = 0
+        self._close(evicted)
+
+    def _evict(self, max_idle):
+        # pops the least recently used idle handles beyond max_idle, which
+        # are closed outside the lock.
+        evicted = []
+        while self._num_idle > max(max_idle, 0):
+            key, handles = next(iter(self._idle.items()))
+            evicted.append(handles.pop(0))
+            if not handles:
+                del self._idle[key]
+            self._num_idle -= 1
+            self.evictions += 1
+        return evicted
+
+    def _close(self, handles):
+        for fileobj in handles:
+            with self._lock:
+                closer = self._closers.pop(id(fileobj), None)
+            if closer is None:
+                fileobj.close()
+            else:
+                closer(fileobj)
+
+
+# the pool shared by the readers of the process.
+FILE_POOL = FilePool()
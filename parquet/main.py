@@ -2,16 +2,24 @@ from __future__ import absolute_import, division, print_function
 import gzip
 import json
 import logging
+import re
 import struct
 import io
+from contextlib import closing
 import sys
 import os.path
 from collections import defaultdict
-from parquet.ttypes import (FileMetaData, CompressionCodec, Encoding,
-                    FieldRepetitionType, PageHeader, PageType, Type)
+import numpy as np
+from parquet.ttypes import (FileMetaData, CompressionCodec, ConvertedType,
+                    Encoding, FieldRepetitionType, PageHeader, PageType, Type)
 from thriftpy.protocol.compact import TCompactProtocol
 from thriftpy.transport import TTransportBase
+from parquet import compact
+from parquet import converted_types
 from parquet import encoding
+from parquet.filesystem import LocalFileSystem
+from parquet.metadata import FOOTER_CACHE, LazyRowGroups
+from parquet import nested
 from parquet import schema
 
 
@@ -49,9 +57,92 @@ class ParquetFormatException(Exception):
     pass
 
 
+# page types holding column values, and the encodings of values that are
+# indices into the column chunk's dictionary.
+DATA_PAGE_TYPES = (PageType.DATA_PAGE, PageType.DATA_PAGE_V2)
+DICTIONARY_ENCODINGS = (Encoding.PLAIN_DICTIONARY, Encoding.RLE_DICTIONARY)
+
+
+# the footer is found with a single read of the end of the file, which holds
+# all but the largest footers whole.
+FOOTER_READ_SIZE = 64 * 1024
+MAGIC = b'PAR1'
+
+# parquet-mr before 1.2.9 left the dictionary page header out of the column
+# chunk sizes (PARQUET-816), so chunks of its files are read with room for one.
+MAX_DICTIONARY_HEADER_SIZE = 100
+PARQUET_816_FIXED_VERSION = (1, 2, 9)
+
+
+def column_chunk_padding(footer):
+    """Returns the number of bytes to read past the end of every column chunk
+    of the file with the given footer."""
+    created_by = footer.created_by or ""
+    if not created_by.startswith("parquet-mr"):
+        return 0
+    match = re.search(r"version (\d+)\.(\d+)\.(\d+)", created_by)
+    if match and tuple(int(v) for v in match.groups()) >= \
+            PARQUET_816_FIXED_VERSION:
+        return 0
+    return MAX_DICTIONARY_HEADER_SIZE
+
+
+def read_struct(cls, data, pos=0):
+    """Decodes the thrift struct cls at pos in data with the compact decoder,
+    returning it and the position after it."""
+    try:
+        return compact.read_struct(cls, data, pos)
+    except ValueError as e:
+        raise ParquetFormatException(str(e))
+
+
+def data_page_header(page_header):
+    """Returns the DataPageHeader or DataPageHeaderV2 of the given page, or None
+    if it isn't a data page. Both have num_values and encoding."""
+    if page_header.type == PageType.DATA_PAGE_V2:
+        return page_header.data_page_header_v2
+    return page_header.data_page_header
+
+
+def decode_byte_arrays(values, schema_element, dictionary=False):
+    """Decodes BYTE_ARRAY values to an object array of str, except for
+    DECIMAL and BSON columns whose values are kept as bytes.
+
+    Dictionary entries are interned as they are decoded, so the rows of
+    every page and row group that look them up share one str per value.
+    """
+    if schema_element.converted_type in (ConvertedType.DECIMAL,
+                                         ConvertedType.BSON):
+        return values.to_numpy()
+    return values.decode(interned=dictionary)
+
+
+def expand_nulls(values, validity):
+    """Scatters the non-null values of a page into an array with a slot for
+    every entry of validity, masking the null slots. Returns values as is if
+    there are no nulls."""
+    if validity is None or validity.all():
+        return values
+    if values.dtype == object:
+        out = np.empty(len(validity), dtype=object)
+    else:
+        out = np.zeros(len(validity), dtype=values.dtype)
+    out[validity] = values
+    return np.ma.MaskedArray(out, mask=~validity)
+
+
 class ParquetMain(object):
-    def __init__(self):
+    def __init__(self, memory_map=False, filesystem=None,
+                 metadata_cache=None):
+        """Files are opened from the given filesystem.FileSystem, the local
+        filesystem by default. If memory_map is set, local files are memory
+        mapped instead of read (see filesystem.open_file). Parsed footers are
+        kept in the given metadata.FooterCache, by default the one shared by
+        the process."""
         self._readers = {}
+        self._filesystem = filesystem or LocalFileSystem(memory_map)
+        self._metadata_cache = FOOTER_CACHE if metadata_cache is None \
+            else metadata_cache
 
 
     def _get_name(self, type_, value):
@@ -69,41 +160,96 @@ class ParquetMain(object):
             return data_offset
         return dict_offset
 
-    def _check_header_magic_bytes(self, fo):
-        "Returns true if the file-like obj has the PAR1 magic bytes at the header"
-        fo.seek(0, 0)
-        magic = fo.read(4)
-        return magic == b'PAR1'
-
-
-    def _check_footer_magic_bytes(self, fo):
-        "Returns true if the file-like obj has the PAR1 magic bytes at the footer"
-        fo.seek(-4, 2)  # seek to four bytes from the end of the file
-        magic = fo.read(4)
-        return magic == b'PAR1'
-
-
-    def _get_footer_size(self, fo):
-        "Readers the footer size in bytes, which is serialized as little endian"
-        fo.seek(-8, 2)
-        tup = struct.unpack("<i", fo.read(4))
-        return tup[0]
-
-
-    def _read_footer(self, fo):
-        """Reads the footer from the given file object, returning a FileMetaData
-        object. This method assumes that the fo references a valid parquet file"""
-        footer_size = self._get_footer_size(fo)
-        fo.seek(-(8 + footer_size), 2)  # seek to beginning of footer
-        tin = TFileObjectTransport(fo)
-        pin = TCompactProtocol(tin)
-        fmd = FileMetaData()
-        fmd.read(pin)
-        return fmd
+    def _read_footer_data(self, fo, filename=None, check_header=False):
+        """Reads the encoded footer from the given file object.
 
+        The end of the file is read in one go, and the footer is read again
+        only if it's larger than that. The PAR1 magic bytes at the end are
+        always checked, those at the start if the read covers them or if
+        check_header is set.
+        """
+        fo.seek(0, 2)
+        file_size = fo.tell()
+        tail_size = min(FOOTER_READ_SIZE, file_size)
+        fo.seek(file_size - tail_size, 0)
+        tail = encoding.read_buffer(fo, tail_size)
+        if len(tail) < 12 or bytes(tail[-4:]) != MAGIC:
+            raise ParquetFormatException("{0} is not a valid parquet file "
+                                         "(missing magic bytes)"
+                                         .format(filename))
+        footer_size = struct.unpack("<i", bytes(tail[-8:-4]))[0]
+        if footer_size < 0 or footer_size + 12 > file_size:
+            raise ParquetFormatException(
+                "{0} has an invalid footer size {1}".format(filename,
+                                                            footer_size))
+        if tail_size == file_size:
+            header = tail[:4]
+        elif check_header:
+            fo.seek(0, 0)
+            header = fo.read(4)
+        else:
+            header = MAGIC
+        if bytes(header) != MAGIC:
+            raise ParquetFormatException("{0} is not a valid parquet file "
+                                         "(missing magic bytes)"
+                                         .format(filename))
+        if footer_size + 8 <= tail_size:
+            data = tail[tail_size - 8 - footer_size:tail_size - 8]
+        else:
+            fo.seek(file_size - 8 - footer_size, 0)
+            data = encoding.read_buffer(fo, footer_size)
+        return data
+
+    def _parse_footer(self, data):
+        """Decodes the encoded footer, leaving its row groups to be decoded
+        when accessed (see metadata.LazyRowGroups)."""
+        # the row groups keep the data, which mustn't be a view of a mapping.
+        data = bytes(data)
+        try:
+            footer = compact.read_struct_lazy(FileMetaData, data,
+                                              lazy=('row_groups',))[0]
+        except ValueError as e:
+            raise ParquetFormatException(str(e))
+        if footer.row_groups is not None:
+            footer.row_groups = LazyRowGroups(data, footer.row_groups,
+                                              read_struct)
+        return footer
+
+    def column_chunk_range(self, column_metadata, padding=0):
+        """Returns the (offset, length) of the pages of the given column
+        chunk in its file. padding is the number of bytes to read past the
+        chunk, if the file has them (see column_chunk_padding)."""
+        return (self._get_offset(column_metadata),
+                column_metadata.total_compressed_size + padding)
+
+    def column_chunk_reader(self, data, column_metadata):
+        """Returns an encoding.BufferReader to parse the pages of a column
+        chunk from, given the data read from its column_chunk_range."""
+        size = column_metadata.total_compressed_size
+        if len(data) < size:
+            raise ParquetFormatException(
+                "column chunk {0} is truncated: found {1} bytes "
+                "(expected {2})".format(
+                    ".".join(column_metadata.path_in_schema), len(data),
+                    size))
+        return encoding.BufferReader(data)
+
+    def read_column_chunk(self, fo, column_metadata, padding=0):
+        """Reads the pages of the given column chunk (with their headers)
+        from fo in one go, returning an encoding.BufferReader over them to
+        parse the pages from. For memory mapped files and BytesIO objects
+        the reader is a view, otherwise the chunk takes a single read."""
+        data, = self._filesystem.read_ranges(
+            fo, [self.column_chunk_range(column_metadata, padding)])
+        return self.column_chunk_reader(data, column_metadata)
 
     def _read_page_header(self, fo):
-        """Reads the page_header from the given fo"""
+        """Reads the page_header from the given fo. Headers of in-memory
+        pages are decoded straight from the buffer."""
+        if isinstance(fo, (encoding.BufferReader, io.BytesIO)):
+            ph, end = read_struct(PageHeader, fo.getbuffer(), fo.tell())
+            fo.seek(end, 0)
+            return ph
         tin = TFileObjectTransport(fo)
         pin = TCompactProtocol(tin)
         ph = PageHeader()
@@ -111,26 +257,45 @@ class ParquetMain(object):
         return ph
 
 
-    def read_footer(self, filename, fileobj=None):
-        """Reads and returns the FileMetaData object for the given file."""
+    def read_footer(self, filename, fileobj=None, check_header=False):
+        """Reads and returns the FileMetaData object for the given file.
+
+        The file is checked for the PAR1 magic bytes at its end, and at its
+        start too if the file is small or if check_header is set, which
+        takes another read otherwise.
+        """
+        return self.read_metadata(filename, fileobj, check_header)[0]
+
+    def read_metadata(self, filename, fileobj=None, check_header=False):
+        """Returns the FileMetaData of the given file, and a
+        schema.SchemaHelper for its schema (see read_footer). fileobj is the
+        open file, if there is one, or the file if filename is None.
+
+        Both are taken from the metadata cache while the file keeps its size
+        and modification time, and are shared by all its readers, so they
+        must not be modified. Files without a filename, or on a filesystem
+        that can't stat them, are read every time, as are reads with
+        check_header set.
+        """
+        key = None
+        if filename is not None:
+            stat = self._filesystem.stat(filename)
+            if stat is not None:
+                key = (self._filesystem.handle_key(filename),) + tuple(stat)
+        if key is not None and not check_header:
+            metadata = self._metadata_cache.get(key)
+            if metadata is not None:
+                return metadata
         if fileobj is None:
-            do_close = True
-            fileobj = open(filename, 'rb')
+            with closing(self._filesystem.open(filename)) as fo:
+                data = self._read_footer_data(fo, filename, check_header)
         else:
-            do_close = False
-        try:
-            self._validate_parquet_file(fileobj, filename)
-            return self._read_footer(fileobj)
-        finally:
-            if do_close:
-                fileobj.close()
-
-    def _validate_parquet_file(self, fo, filename=None):
-        if not self._check_header_magic_bytes(fo) or \
-           not self._check_footer_magic_bytes(fo):
-            raise ParquetFormatException("{0} is not a valid parquet file "
-                                         "(missing magic bytes)"
-                                         .format(filename))
+            data = self._read_footer_data(fileobj, filename, check_header)
+        footer = self._parse_footer(data)
+        metadata = footer, schema.SchemaHelper(footer.schema)
+        if key is not None:
+            self._metadata_cache.put(key, metadata, len(data))
+        return metadata
 
     def _get_reader(self, bit_width):
         if bit_width in self._readers:
@@ -142,7 +307,11 @@ class ParquetMain(object):
     def dump_metadata(self, filename, show_row_group_metadata, out=sys.stdout):
         def println(value):
             out.write(value + "\n")
-        footer = self.read_footer(filename)
+        with closing(self._filesystem.open(filename)) as fo:
+            self._dump_metadata(fo, filename, show_row_group_metadata, println)
+
+    def _dump_metadata(self, fo, filename, show_row_group_metadata, println):
+        footer = self.read_footer(filename, fo)
         println("File Metadata: {0}".format(filename))
         println("  Version: {0}".format(footer.version))
         println("  Num Rows: {0}".format(footer.num_rows))
@@ -199,76 +368,164 @@ class ParquetMain(object):
                                 data_page_offset=cmd.data_page_offset,
                                 dictionary_page_offset=cmd.dictionary_page_offset))
 
-                    local_filename = filename
                     if cg.file_path:
                         dirname = os.path.dirname(filename)
-                        local_filename = os.path.join(dirname, cg.file_path)
-                    with open(local_filename, 'rb') as fo:
-                        offset = self._get_offset(cmd)
-                        fo.seek(offset, 0)
-                        values_read = 0
-                        println("      pages: ")
-                        while values_read < num_rows:
-                            ph = self._read_page_header(fo)
-                            # seek past current page.
-                            fo.seek(ph.compressed_page_size, 1)
-                            daph = ph.data_page_header
-                            type_ = self._get_name(PageType, ph.type)
-                            raw_bytes = ph.uncompressed_page_size
-                            num_values = None
-                            if ph.type == PageType.DATA_PAGE:
-                                num_values = daph.num_values
-                                values_read += num_values
-                            if ph.type == PageType.DICTIONARY_PAGE:
-                                pass
-                                #num_values = diph.num_values
-
-                            encoding_type = None
-                            def_level_encoding = None
-                            rep_level_encoding = None
-                            if daph:
-                                encoding_type = self._get_name(Encoding, daph.encoding)
-                                def_level_encoding = self._get_name(
-                                    Encoding, daph.definition_level_encoding)
-                                rep_level_encoding = self._get_name(
-                                    Encoding, daph.repetition_level_encoding)
-
-                            println("        page header: type={type} "
-                                    "uncompressed_size={raw_bytes} "
-                                    "num_values={num_values} encoding={encoding} "
-                                    "def_level_encoding={def_level_encoding} "
-                                    "rep_level_encoding={rep_level_encoding}".format(
-                                        type=type_,
-                                        raw_bytes=raw_bytes,
-                                        num_values=num_values,
-                                        encoding=encoding_type,
-                                        def_level_encoding=def_level_encoding,
-                                        rep_level_encoding=rep_level_encoding))
-
-
-    def _read_page(self, fo, page_header, column_metadata):
-        """Internal function to read the data page from the given file-object
-        and convert it to raw, uncompressed bytes (if necessary)."""
-        bytes_from_file = fo.read(page_header.compressed_page_size)
-        codec = column_metadata.codec
+                        local_filename = self._filesystem.join(dirname,
+                                                               cg.file_path)
+                        with closing(self._filesystem.open(
+                                local_filename)) as chunk_fo:
+                            chunk = self.read_column_chunk(
+                                chunk_fo, cmd, column_chunk_padding(footer))
+                    else:
+                        chunk = self.read_column_chunk(
+                            fo, cmd, column_chunk_padding(footer))
+                    values_read = 0
+                    println("      pages: ")
+                    while values_read < num_rows:
+                        ph = self._read_page_header(chunk)
+                        # seek past current page.
+                        chunk.seek(ph.compressed_page_size, 1)
+                        daph = data_page_header(ph)
+                        type_ = self._get_name(PageType, ph.type)
+                        raw_bytes = ph.uncompressed_page_size
+                        num_values = None
+                        if ph.type in DATA_PAGE_TYPES:
+                            num_values = daph.num_values
+                            values_read += num_values
+                        if ph.type == PageType.DICTIONARY_PAGE:
+                            pass
+                            #num_values = diph.num_values
+
+                        encoding_type = None
+                        def_level_encoding = None
+                        rep_level_encoding = None
+                        if ph.type == PageType.DATA_PAGE_V2:
+                            # v2 levels are always RLE, without a prefix
+                            encoding_type = self._get_name(Encoding, daph.encoding)
+                            def_level_encoding = rep_level_encoding = "RLE"
+                        elif daph:
+                            encoding_type = self._get_name(Encoding, daph.encoding)
+                            def_level_encoding = self._get_name(
+                                Encoding, daph.definition_level_encoding)
+                            rep_level_encoding = self._get_name(
+                                Encoding, daph.repetition_level_encoding)
+
+                        println("        page header: type={type} "
+                                "uncompressed_size={raw_bytes} "
+                                "num_values={num_values} encoding={encoding} "
+                                "def_level_encoding={def_level_encoding} "
+                                "rep_level_encoding={rep_level_encoding}".format(
+                                    type=type_,
+                                    raw_bytes=raw_bytes,
+                                    num_values=num_values,
+                                    encoding=encoding_type,
+                                    def_level_encoding=def_level_encoding,
+                                    rep_level_encoding=rep_level_encoding))
+
+
+    def _decompress(self, data, codec):
+        """Returns data decompressed with the given codec."""
         if codec is not None and codec != CompressionCodec.UNCOMPRESSED:
-            if column_metadata.codec == CompressionCodec.SNAPPY:
-                raw_bytes = snappy.decompress(bytes_from_file)
-            elif column_metadata.codec == CompressionCodec.GZIP:
-                io_obj = io.BytesIO(bytes_from_file)
+            if codec == CompressionCodec.SNAPPY:
+                raw_bytes = snappy.decompress(data)
+            elif codec == CompressionCodec.GZIP:
+                io_obj = io.BytesIO(data)
                 with gzip.GzipFile(fileobj=io_obj, mode='rb') as f:
                     raw_bytes = f.read()
             else:
                 raise ParquetFormatException(
                     "Unsupported Codec: {0}".format(codec))
         else:
-            raw_bytes = bytes_from_file
+            raw_bytes = data
+        return raw_bytes
+
+    def _read_page(self, fo, page_header, column_metadata):
+        """Internal function to read the data page from the given file-object
+        and convert it to raw, uncompressed bytes (if necessary)."""
+        bytes_from_file = encoding.read_buffer(
+            fo, page_header.compressed_page_size)
+        raw_bytes = self._decompress(bytes_from_file, column_metadata.codec)
         assert len(raw_bytes) == page_header.uncompressed_page_size, \
             "found {0} raw bytes (expected {1})".format(
                 len(raw_bytes),
                 page_header.uncompressed_page_size)
         return raw_bytes
 
+    def _read_page_v2(self, fo, page_header, column_metadata):
+        """Reads a DATA_PAGE_V2 from the given file-object, returning its
+        level bytes and its (uncompressed) value bytes. The levels are never
+        compressed, and the values only if the page says so."""
+        dph = page_header.data_page_header_v2
+        levels_size = (dph.repetition_levels_byte_length +
+                       dph.definition_levels_byte_length)
+        bytes_from_file = encoding.read_buffer(
+            fo, page_header.compressed_page_size)
+        levels = bytes_from_file[:levels_size]
+        raw_bytes = bytes_from_file[levels_size:]
+        if dph.is_compressed is not False:
+            raw_bytes = self._decompress(raw_bytes, column_metadata.codec)
+        assert levels_size + len(raw_bytes) == \
+            page_header.uncompressed_page_size, \
+            "found {0} raw bytes (expected {1})".format(
+                levels_size + len(raw_bytes),
+                page_header.uncompressed_page_size)
+        return levels, raw_bytes
+
+    def _read_level_section_v2(self, io_obj, length, max_level, count):
+        bit_width = encoding.width_from_max_int(max_level)
+        if bit_width == 0:
+            io_obj.seek(length, 1)
+            return np.zeros(count, dtype=np.int32)
+        reader = self._get_reader(bit_width)
+        return reader.read_rle_bit_packed_hybrid(io_obj, length, count)
+
+    def _read_levels_v2(self, io_obj, dph, schema_helper, column_metadata):
+        """Reads the repetition and definition levels of a DATA_PAGE_V2. Both
+        are RLE encoded, without the length prefix of DATA_PAGE."""
+        path = column_metadata.path_in_schema
+        repetition_levels = None
+        definition_levels = None
+        max_repetition_level = schema_helper.max_repetition_level(path)
+        if max_repetition_level > 0:
+            repetition_levels = self._read_level_section_v2(
+                io_obj, dph.repetition_levels_byte_length,
+                max_repetition_level, dph.num_values)
+        else:
+            io_obj.seek(dph.repetition_levels_byte_length, 1)
+        max_definition_level = schema_helper.max_definition_level(path)
+        if max_definition_level > 0:
+            definition_levels = self._read_level_section_v2(
+                io_obj, dph.definition_levels_byte_length,
+                max_definition_level, dph.num_values)
+        return repetition_levels, definition_levels
+
+    def read_page_levels(self, fo, schema_helper, page_header,
+                         column_metadata):
+        """Reads only the levels of the given data page, returning a tuple of
+        repetition and definition levels (None where the column has none).
+
+        For DATA_PAGE_V2 the value section is skipped without being
+        decompressed, so this is cheap enough for counting nulls.
+        """
+        if page_header.type == PageType.DATA_PAGE_V2:
+            dph = page_header.data_page_header_v2
+            levels_size = (dph.repetition_levels_byte_length +
+                           dph.definition_levels_byte_length)
+            levels = encoding.read_buffer(fo, levels_size)
+            fo.seek(page_header.compressed_page_size - levels_size, 1)
+            return self._read_levels_v2(encoding.BufferReader(levels), dph,
+                                        schema_helper, column_metadata)
+        daph = page_header.data_page_header
+        io_obj = encoding.BufferReader(
+            self._read_page(fo, page_header, column_metadata))
+        repetition_levels = self._read_repetitions(io_obj, daph,
+                                                   schema_helper,
+                                                   column_metadata)
+        definition_levels = self._read_definitions(io_obj, daph,
+                                                   schema_helper,
+                                                   column_metadata)
+        return repetition_levels, definition_levels
+
 
     def _read_data(self, fo, fo_encoding, value_count, bit_width):
         """Internal method to read data from the file-object using the given
@@ -278,38 +535,34 @@ class ParquetMain(object):
         vals = []
         reader = self._get_reader(bit_width)
         if fo_encoding == Encoding.RLE:
-            seen = 0
-            while seen < value_count:
-                values = reader.read_rle_bit_packed_hybrid(fo)
-                if values is None:
-                    break  # EOF was reached.
-                vals += values
-                seen += len(values)
+            vals = reader.read_rle_bit_packed_hybrid(fo, count=value_count)
         elif fo_encoding == Encoding.BIT_PACKED:
-            raise NotImplementedError("Bit packing not yet supported")
+            # no length prefix, the run is exactly as long as the values.
+            byte_count = (value_count * bit_width + 7) // 8
+            vals = reader.read_bitpacked_deprecated(fo, byte_count,
+                                                    value_count)
 
         return vals
 
     def _read_definitions(self, io_obj, daph, schema_helper, column_metadata):
-        # definition levels are skipped if data is required.
-        if not schema_helper.is_required(column_metadata.path_in_schema[-1]):
-            max_definition_level = schema_helper.max_definition_level(
-                column_metadata.path_in_schema)
+        # definition levels are skipped if the column and all its parents are
+        # required.
+        max_definition_level = schema_helper.max_definition_level(
+            column_metadata.path_in_schema)
+        if max_definition_level > 0:
             bit_width = encoding.width_from_max_int(max_definition_level)
-            if bit_width == 0:
-                definition_levels = [0] * daph.num_values
-            else:
-                definition_levels = self._read_data(io_obj,
-                                                    daph.definition_level_encoding,
-                                                    daph.num_values,
-                                                    bit_width)
+            definition_levels = self._read_data(io_obj,
+                                                daph.definition_level_encoding,
+                                                daph.num_values,
+                                                bit_width)
             return definition_levels
         return None
 
     def _read_repetitions(self, io_obj, daph, schema_helper, column_metadata):
-        if len(column_metadata.path_in_schema) > 1:
-            max_repetition_level = schema_helper.max_repetition_level(
-                column_metadata.path_in_schema)
+        # repetition levels are only there for repeated columns.
+        max_repetition_level = schema_helper.max_repetition_level(
+            column_metadata.path_in_schema)
+        if max_repetition_level > 0:
             bit_width = encoding.width_from_max_int(max_repetition_level)
             repetition_levels = self._read_data(io_obj,
                                                 daph.repetition_level_encoding,
@@ -317,67 +570,204 @@ class ParquetMain(object):
             return repetition_levels
         return None
 
-    def _read_plain(self, io_obj, daph, column_metadata, reader):
-        vals = []
-        width = getattr(column_metadata, 'num_values')
-        for i in range(daph.num_values):
-            dat = reader.read_plain(io_obj, column_metadata.type, width)
-            vals.append(dat)
-        return vals
+    def _read_plain(self, io_obj, count, column_metadata, reader, width=None):
+        dtype = encoding.plain_dtype(column_metadata.type, width)
+        if dtype is not None:
+            # fixed width values are decoded in a single pass.
+            return encoding.read_plain_array(io_obj, dtype, count)
+        if column_metadata.type == Type.BYTE_ARRAY:
+            return reader.read_plain_byte_arrays(io_obj, count)
+        return encoding.read_plain_boolean_array(io_obj, count)
 
-    def _read_plain_dict(self, io_obj, daph, definition_levels, dictionary):
+    def _read_plain_dict(self, io_obj, count, dictionary, codes=False):
         # bit_width is stored as single byte.
         bit_width = struct.unpack("<B", io_obj.read(1))[0]
-        dict_values_bytes = io_obj.read()
-        dict_values_io_obj = io.BytesIO(dict_values_bytes)
+        length = io_obj.getbuffer().nbytes - io_obj.tell()
         reader = self._get_reader(bit_width)
-        values = reader.read_rle_bit_packed_hybrid(
-            dict_values_io_obj, len(dict_values_bytes))
+        values = reader.read_rle_bit_packed_hybrid(io_obj, length, count)
+        if len(values) != count:
+            raise ParquetFormatException(
+                "Error reading enough data from dictionary")
+        if codes:
+            return values
+        if not isinstance(dictionary, (np.ndarray, encoding.ByteArrays)):
+            dictionary = np.array(dictionary, dtype=object)
+        return dictionary[values]
+
+    def _read_delta_binary_packed(self, io_obj, count, column_metadata):
+        vals = encoding.read_delta_binary_packed(io_obj)
+        if len(vals) < count:
+            raise ParquetFormatException(
+                "Expected {0} delta encoded values, found {1}".format(
+                    count, len(vals)))
+        # INT32 values wrap around like the int64 arithmetic they came from.
+        return vals[:count].astype(encoding.PLAIN_DTYPES[column_metadata.type])
+
+    def _read_delta_byte_array(self, io_obj, count, column_metadata, width,
+                               decoder):
+        vals = decoder(io_obj)
+        if len(vals) < count:
+            raise ParquetFormatException(
+                "Expected {0} delta encoded values, found {1}".format(
+                    count, len(vals)))
+        vals = vals[:count]
+        if column_metadata.type == Type.FIXED_LEN_BYTE_ARRAY:
+            return vals.data.view(encoding.plain_dtype(column_metadata.type,
+                                                       width))
+        return vals
 
-        if definition_levels is not None:
-            vals = reader.filter_values(dictionary, values, definition_levels)
+    def read_data_page_levels(self, fo, schema_helper, page_header,
+                              column_metadata, dictionary,
+                              dictionary_codes=False):
+        """Reads the datapage like read_data_page, but without placing nulls
+        or assembling lists.
+
+        Returns a tuple of the non-null values, the repetition levels and the
+        definition levels. The levels are None for columns that have none. If
+        dictionary_codes is set, dictionary encoded pages return the indices
+        into the dictionary instead of the values.
+        """
+        if page_header.type == PageType.DATA_PAGE_V2:
+            daph = page_header.data_page_header_v2
+            levels, raw_bytes = self._read_page_v2(fo, page_header,
+                                                   column_metadata)
+            repetition_levels, definition_levels = self._read_levels_v2(
+                encoding.BufferReader(levels), daph, schema_helper,
+                column_metadata)
+            io_obj = encoding.BufferReader(raw_bytes)
         else:
-            vals = [dictionary[v] for v in values]
+            daph = page_header.data_page_header
+            raw_bytes = self._read_page(fo, page_header, column_metadata)
+            io_obj = encoding.BufferReader(raw_bytes)
+
+            repetition_levels = self._read_repetitions(io_obj, daph,
+                                                       schema_helper,
+                                                       column_metadata)
+            definition_levels = self._read_definitions(io_obj, daph,
+                                                       schema_helper,
+                                                       column_metadata)
+
+        count = daph.num_values
+        if definition_levels is not None:
+            max_definition_level = schema_helper.max_definition_level(
+                column_metadata.path_in_schema)
+            count = int(np.count_nonzero(
+                definition_levels == max_definition_level))
 
-        if len(vals)  > daph.num_values:
-            vals = vals[0: daph.num_values]
-        return vals
+        reader = self._get_reader(1)
+        width = schema_helper.schema_element(
+            column_metadata.path_in_schema).type_length
+        if daph.encoding == Encoding.PLAIN:
+            vals = self._read_plain(io_obj, count, column_metadata, reader,
+                                    width)
+        elif daph.encoding in DICTIONARY_ENCODINGS:
+            vals = self._read_plain_dict(io_obj, count, dictionary,
+                                         dictionary_codes)
+        elif daph.encoding == Encoding.RLE and \
+                column_metadata.type == Type.BOOLEAN:
+            # booleans are rle encoded as 1 bit wide values, with a length.
+            vals = reader.read_rle_bit_packed_hybrid(io_obj, count=count)
+            if len(vals) != count:
+                raise ParquetFormatException(
+                    "expected {0} values, found {1}".format(count, len(vals)))
+            vals = vals.astype(np.bool_)
+        elif daph.encoding == Encoding.DELTA_BINARY_PACKED:
+            vals = self._read_delta_binary_packed(io_obj, count,
+                                                  column_metadata)
+        elif daph.encoding == Encoding.DELTA_LENGTH_BYTE_ARRAY:
+            vals = self._read_delta_byte_array(
+                io_obj, count, column_metadata, width,
+                encoding.read_delta_length_byte_array)
+        elif daph.encoding == Encoding.DELTA_BYTE_ARRAY:
+            vals = self._read_delta_byte_array(
+                io_obj, count, column_metadata, width,
+                encoding.read_delta_byte_array)
+        else:
+            raise ParquetFormatException("Unsupported encoding: {0}".format(
+                self._get_name(Encoding, daph.encoding)))
+        return vals, repetition_levels, definition_levels
+
+    def read_data_page_compact(self, fo, schema_helper, page_header,
+                               column_metadata, dictionary,
+                               dictionary_codes=False):
+        """Reads the datapage like read_data_page, but without placing nulls.
+
+        Returns a tuple of the non-null values and a boolean validity array
+        built from the definition levels, which is True for every non-null
+        slot of the page. The validity is None for required columns. If
+        dictionary_codes is set, dictionary encoded pages return the indices
+        into the dictionary instead of the values.
+        """
+        vals, _, definition_levels = self.read_data_page_levels(
+            fo, schema_helper, page_header, column_metadata, dictionary,
+            dictionary_codes)
+        validity = None
+        if definition_levels is not None:
+            max_definition_level = schema_helper.max_definition_level(
+                column_metadata.path_in_schema)
+            validity = definition_levels == max_definition_level
+        return vals, validity
 
     def read_data_page(self, fo, schema_helper, page_header, column_metadata,
                        dictionary):
         """Reads the datapage from the given file-like object based upon the
         metadata in the schema_helper, page_header, column_metadata, and
-        (optional) dictionary. Returns a list of values.
+        (optional) dictionary. Returns a numpy array of values, which is a
+        masked array if the page contains nulls. Repeated columns return a
+        nested.ListArray with a list per record instead, which is only whole
+        if the page doesn't end within a record (see read_repeated_page).
         """
-        daph = page_header.data_page_header
-        raw_bytes = self._read_page(fo, page_header, column_metadata)
-        io_obj = io.BytesIO(raw_bytes)
-
-        definition_levels = self._read_definitions(io_obj, daph,
-                                                   schema_helper,
-                                                   column_metadata)
-        self._read_repetitions(io_obj, daph, schema_helper,
-                               column_metadata)
-
-        reader = self._get_reader(1)
-        if daph.encoding == Encoding.PLAIN:
-            vals = self._read_plain(io_obj, daph, column_metadata, reader)
-        elif daph.encoding == Encoding.PLAIN_DICTIONARY:
-            vals = self._read_plain_dict(io_obj, daph, definition_levels, dictionary)
-
-            if len(vals) != daph.num_values:
-                raise ParquetFormatException("Error reading enough data from dictionary")
-        else:
-            raise ParquetFormatException("Unsupported encoding: %s",
-                                         _get_name(Encoding, daph.encoding))
-        return vals
+        vals, repetition_levels, definition_levels = self.read_repeated_page(
+            fo, schema_helper, page_header, column_metadata, dictionary)
+        if repetition_levels is None:
+            return vals
+        return nested.assemble(
+            vals, repetition_levels, definition_levels,
+            schema_helper.repeated_definition_levels(
+                column_metadata.path_in_schema))
+
+    def read_repeated_page(self, fo, schema_helper, page_header,
+                           column_metadata, dictionary):
+        """Reads the datapage like read_data_page, but without assembling
+        lists.
+
+        Returns a tuple of the values, with a slot (masked if null) for every
+        element of the innermost lists, and the repetition and definition
+        levels, which are None for columns that have none. A record can
+        continue on the next DATA_PAGE page, so the pages of a repeated
+        column chunk are assembled together with nested.assemble_pages.
+        """
+        vals, repetition_levels, definition_levels = \
+            self.read_data_page_levels(fo, schema_helper, page_header,
+                                       column_metadata, dictionary)
+        path = column_metadata.path_in_schema
+        if isinstance(vals, encoding.ByteArrays):
+            vals = decode_byte_arrays(vals, schema_helper.schema_element(path))
+        validity = None
+        if definition_levels is not None:
+            validity = definition_levels == \
+                schema_helper.max_definition_level(path)
+        if repetition_levels is None:
+            return expand_nulls(vals, validity), None, definition_levels
+        # only the slots of the innermost lists hold a value or a null.
+        repeated_levels = schema_helper.repeated_definition_levels(path)
+        slots = definition_levels >= repeated_levels[-1]
+        return (expand_nulls(vals, validity[slots]), repetition_levels,
+                definition_levels)
 
 
     def read_dictionary_page(self, fo, page_header, column_metadata, width=None):
         raw_bytes = self._read_page(fo, page_header, column_metadata)
-        io_obj = io.BytesIO(raw_bytes)
-        dict_items = []
+        io_obj = encoding.BufferReader(raw_bytes)
+        dtype = encoding.plain_dtype(column_metadata.type, width)
+        if dtype is not None:
+            return encoding.read_plain_array(
+                io_obj, dtype, page_header.dictionary_page_header.num_values)
         reader = self._get_reader(1)
+        if column_metadata.type == Type.BYTE_ARRAY:
+            return reader.read_plain_byte_arrays(
+                io_obj, page_header.dictionary_page_header.num_values)
+        dict_items = []
         l = len(raw_bytes)
         while io_obj.tell() < l:
             dat = reader.read_plain(io_obj, column_metadata.type, width)
@@ -385,21 +775,37 @@ class ParquetMain(object):
         return dict_items
 
 
-    def _dump(self, fo, options, out=sys.stdout):
+    def _dump(self, fo, options, out=sys.stdout, filename=None):
         def println(value):
             out.write(value + "\n")
 
         def _to_str(val):
             if isinstance(val, bytes):
-                return val.decode('utf-8')
+                try:
+                    return val.decode('utf-8')
+                except UnicodeDecodeError:
+                    # binary values, such as decimals, are shown escaped.
+                    return repr(val)
             return str(val)
 
-        footer = self._read_footer(fo)
-        schema_helper = schema.SchemaHelper(footer.schema)
+        def _to_list(values, se):
+            if getattr(values, 'dtype', None) is None or \
+                    values.dtype.kind != 'S':
+                return values.tolist()
+            if se.type != Type.INT96:
+                return encoding.fixed_bytes_to_object(values).tolist()
+            if not int96_timestamps:
+                return converted_types.int96_to_int(values).tolist()
+            mask = np.ma.getmaskarray(values)
+            timestamps = converted_types.int96_to_datetime64(values)
+            return [None if m else str(t) for m, t in zip(mask, timestamps)]
+
+        footer, schema_helper = self.read_metadata(filename, fo)
+        int96_timestamps = converted_types.has_int96_timestamps(footer)
+        padding = column_chunk_padding(footer)
         total_count = 0
         for rg in footer.row_groups:
             res = defaultdict(list)
-            row_group_rows = rg.num_rows
             for idx, cg in enumerate(rg.columns):
                 dict_items = []
                 cmd = cg.meta_data
@@ -407,25 +813,45 @@ class ParquetMain(object):
                 if options.col and not ".".join(cmd.path_in_schema) in options.col:
                     continue
 
-                offset = self._get_offset(cmd)
-                fo.seek(offset, 0)
+                chunk = self.read_column_chunk(fo, cmd, padding)
+                se = schema_helper.schema_element(cmd.path_in_schema)
+                repeated = schema_helper.max_repetition_level(
+                    cmd.path_in_schema) > 0
+                pages = []
                 values_seen = 0
-                while values_seen < row_group_rows:
-                    ph = self._read_page_header(fo)
-                    if ph.type == PageType.DATA_PAGE:
-                        values = self.read_data_page(fo, schema_helper, ph, cmd,
-                                                     dict_items)
-                        res[".".join(cmd.path_in_schema)] += values
-                        values_seen += ph.data_page_header.num_values
+                # repeated columns have more values than the row group rows.
+                while values_seen < cmd.num_values:
+                    ph = self._read_page_header(chunk)
+                    if ph.type in DATA_PAGE_TYPES and repeated:
+                        pages.append(self.read_repeated_page(
+                            chunk, schema_helper, ph, cmd, dict_items))
+                        values_seen += data_page_header(ph).num_values
+                    elif ph.type in DATA_PAGE_TYPES:
+                        values = self.read_data_page(chunk, schema_helper, ph,
+                                                     cmd, dict_items)
+                        res[".".join(cmd.path_in_schema)].extend(
+                            _to_list(values, se))
+                        values_seen += data_page_header(ph).num_values
                     elif ph.type == PageType.DICTIONARY_PAGE:
                         logger.debug(ph)
-                        assert dict_items == []
-                        dict_items = self.read_dictionary_page(fo, ph, cmd)
+                        assert len(dict_items) == 0
+                        dict_items = self.read_dictionary_page(
+                            chunk, ph, cmd, se.type_length)
+                        if isinstance(dict_items, encoding.ByteArrays):
+                            dict_items = decode_byte_arrays(dict_items, se,
+                                                            dictionary=True)
                     else:
                         logger.warn("Skipping unknown page type={0}".format(
-                            _get_name(PageType, ph.type)))
-            keys = options.col if options.col else [s.name for s in
-                                                    footer.schema if s.name in res]
+                            self._get_name(PageType, ph.type)))
+                        chunk.seek(ph.compressed_page_size, 1)
+                if pages:
+                    values = nested.assemble_pages(
+                        pages, schema_helper.repeated_definition_levels(
+                            cmd.path_in_schema))
+                    res[".".join(cmd.path_in_schema)].extend(values.tolist())
+            keys = options.col if options.col else [
+                ".".join(c.meta_data.path_in_schema) for c in rg.columns
+                if ".".join(c.meta_data.path_in_schema) in res]
             if options.format == 'custom':
                 custom_datatype = out(res, keys)
                 return custom_datatype
@@ -442,5 +868,6 @@ class ParquetMain(object):
 
 
     def dump(self, filename, options, out=sys.stdout):
-        with open(filename, 'rb') as fo:
-            return self._dump(fo, options=options, out=out)
+        with closing(self._filesystem.open(filename)) as fo:
+            return self._dump(fo, options=options, out=out,
+                              filename=filename)
@@ -0,0 +1,136 @@
+"""Caching of parsed file metadata.
+
+Parsing a footer takes most of the time of opening a small file, and the same
+files are often opened over and over. ParquetMain.read_metadata keeps the
+parsed FileMetaData of every file, with the schema.SchemaHelper derived from
+it, in a FooterCache shared by the process. Entries are keyed by the path,
+size and modification time of the file, so a file that changes is parsed
+again.
+
+Footers are parsed lazily: the row groups, which make up most of the footer
+of a large file, are only decoded when accessed (see LazyRowGroups).
+"""
+
+import threading
+from collections import OrderedDict
+
+from parquet.ttypes import RowGroup
+
+
+# the number of footers a FooterCache keeps by default.
+DEFAULT_MAX_ENTRIES = 1024
+# the total size of the encoded footers a FooterCache keeps by default.
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class FooterCache(object):
+    """A thread-safe LRU cache of parsed footers.
+
+    Every entry is put with its size in bytes, the size of the encoded footer,
+    which the parsed objects take a roughly constant multiple of. Once the
+    cache holds more than max_entries entries or max_bytes bytes, the least
+    recently used entries are dropped. hits and misses count the lookups that
+    found an entry and those that didn't, evictions the entries dropped.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        # key to (value, size), least recently used first.
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        """Returns the value for key, or None if it isn't cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size):
+        """Caches value for key, given its size in bytes. Values larger than
+        max_bytes aren't cached."""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while len(self._entries) > self.max_entries or \
+                    self.nbytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """Drops all the entries."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+class LazyRowGroups(object):
+    """The row groups of a footer, decoded on first access.
+
+    offsets are the positions of the encoded RowGroup structs in the footer
+    data, and read_struct(cls, data, pos) decodes a struct at pos returning it
+    and its end. The decoded row groups are kept.
+    """
+
+    def __init__(self, data, offsets, read_struct):
+        self.data = data
+        self.offsets = offsets
+        self._read_struct = read_struct
+        self._row_groups = [None] * len(offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        row_group = self._row_groups[index]
+        if row_group is None:
+            # concurrent readers may both decode it, to equal row groups.
+            row_group = self._read_struct(RowGroup, self.data,
+                                          self.offsets[index])[0]
+            self._row_groups[index] = row_group
+        return row_group
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __eq__(self, other):
+        if isinstance(other, (LazyRowGroups, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def decoded(self):
+        """Returns the number of row groups decoded so far."""
+        return sum(1 for rg in self._row_groups if rg is not None)
+
+
+# the cache shared by the readers of the process.
+FOOTER_CACHE = FooterCache()
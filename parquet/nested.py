@@ -0,0 +1,203 @@
+"""Assembly of repeated (LIST and MAP) columns from their repetition and
+definition levels.
+
+A repeated column is stored as its leaf values plus two levels per value. The
+repetition level says at which depth a new list starts, and the definition
+level how many of the optional or repeated fields along the path are present.
+The assembly below turns those into one offsets array per depth with numpy,
+so no state machine runs per value.
+"""
+
+import numpy as np
+
+from parquet.encoding import ByteArrays, fixed_bytes_to_object
+
+
+def _concat_values(chunks):
+    if isinstance(chunks[0], (ListArray, ByteArrays)):
+        return type(chunks[0]).concat(chunks)
+    if any(isinstance(c, np.ma.MaskedArray) for c in chunks):
+        return np.ma.concatenate(chunks)
+    return np.concatenate(chunks)
+
+
+def _to_list(values):
+    if isinstance(values, ByteArrays):
+        return values.to_numpy().tolist()
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'S':
+        return fixed_bytes_to_object(values).tolist()
+    return values.tolist()
+
+
+class ListArray(object):
+    """A column of lists stored as the flat values of all the lists and an
+    int64 offsets array, list i being values[offsets[i]:offsets[i + 1]].
+    validity is a boolean array that is False for null lists, or None if
+    there are none."""
+
+    def __init__(self, offsets, values, validity=None):
+        self.offsets = offsets
+        self.values = values
+        self.validity = validity
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) and key.step in (None, 1):
+            start, stop, _ = key.indices(len(self))
+            stop = max(start, stop)
+            return self._with_offsets(
+                self.offsets[start:stop + 1],
+                None if self.validity is None else self.validity[start:stop])
+        if isinstance(key, slice):
+            raise IndexError("only contiguous slices are supported")
+        if key < 0:
+            key += len(self)
+        if self.validity is not None and not self.validity[key]:
+            return None
+        return self._to_python(self.offsets[key], self.offsets[key + 1])
+
+    def __repr__(self):
+        return "{0}({1!r})".format(type(self).__name__, self.tolist())
+
+    def _with_offsets(self, offsets, validity):
+        return ListArray(offsets, self.values, validity)
+
+    def _to_python(self, start, stop):
+        return _to_list(self.values[start:stop])
+
+    def lengths(self):
+        """Returns the length of every list, 0 for null lists."""
+        return np.diff(self.offsets)
+
+    def flat_values(self):
+        """Returns the values of all the lists, in order."""
+        return self.values[self.offsets[0]:self.offsets[-1]]
+
+    @classmethod
+    def concat(cls, arrays):
+        """Joins several ListArrays into one."""
+        offsets = [np.zeros(1, dtype=np.int64)]
+        total = 0
+        for a in arrays:
+            offsets.append(a.offsets[1:] - a.offsets[0] + total)
+            total += a.offsets[-1] - a.offsets[0]
+        validity = None
+        if any(a.validity is not None for a in arrays):
+            validity = np.concatenate(
+                [np.ones(len(a), dtype=bool) if a.validity is None
+                 else a.validity for a in arrays])
+        return cls._from_parts(arrays, np.concatenate(offsets), validity)
+
+    @classmethod
+    def _from_parts(cls, arrays, offsets, validity):
+        return cls(offsets, _concat_values([a.flat_values() for a in arrays]),
+                   validity)
+
+    def tolist(self):
+        """Returns the lists as python lists, None for null lists."""
+        flat = _to_list(self.flat_values())
+        offsets = (self.offsets - self.offsets[0]).tolist()
+        out = [flat[a:b] for a, b in zip(offsets, offsets[1:])]
+        if self.validity is not None:
+            for i in np.flatnonzero(~self.validity).tolist():
+                out[i] = None
+        return out
+
+    def to_numpy(self):
+        """Returns the lists as an object array of python lists."""
+        out = np.empty(len(self), dtype=object)
+        out[:] = self.tolist()
+        return out
+
+
+class MapArray(ListArray):
+    """A column of maps, stored like a ListArray of its keys with the
+    matching items alongside."""
+
+    def __init__(self, offsets, keys, items, validity=None):
+        super(MapArray, self).__init__(offsets, keys, validity)
+        self.items = items
+
+    @property
+    def keys(self):
+        return self.values
+
+    def _with_offsets(self, offsets, validity):
+        return MapArray(offsets, self.values, self.items, validity)
+
+    def _to_python(self, start, stop):
+        return dict(zip(_to_list(self.values[start:stop]),
+                        _to_list(self.items[start:stop])))
+
+    def flat_items(self):
+        """Returns the items of all the maps, in order."""
+        return self.items[self.offsets[0]:self.offsets[-1]]
+
+    @classmethod
+    def _from_parts(cls, arrays, offsets, validity):
+        return cls(offsets, _concat_values([a.flat_values() for a in arrays]),
+                   _concat_values([a.flat_items() for a in arrays]), validity)
+
+    @classmethod
+    def from_lists(cls, keys, items):
+        """Builds a MapArray from the assembled key and value columns of a
+        map, which share their offsets."""
+        return cls(keys.offsets, keys.values, items.values, keys.validity)
+
+    def tolist(self):
+        """Returns the maps as dicts, None for null maps."""
+        keys = _to_list(self.flat_values())
+        items = _to_list(self.flat_items())
+        offsets = (self.offsets - self.offsets[0]).tolist()
+        out = [dict(zip(keys[a:b], items[a:b]))
+               for a, b in zip(offsets, offsets[1:])]
+        if self.validity is not None:
+            for i in np.flatnonzero(~self.validity).tolist():
+                out[i] = None
+        return out
+
+
+def assemble(values, repetition_levels, definition_levels, repeated_levels):
+    """Assembles the values of a repeated column into nested ListArrays.
+
+    values holds one value (or null) per element of the innermost lists.
+    repeated_levels is the definition level of every repeated field along the
+    column's path, outermost first. Returns a ListArray with one list per
+    record.
+    """
+    rep = np.asarray(repetition_levels)
+    defs = np.asarray(definition_levels)
+    for depth in range(len(repeated_levels), 0, -1):
+        level = repeated_levels[depth - 1]
+        parent_level = repeated_levels[depth - 2] if depth > 1 else 0
+        # a list starts where the repetition level is below its depth, as
+        # long as its parent is there. Every defined entry that doesn't
+        # repeat a deeper list adds one element to the current list.
+        starts = np.flatnonzero((rep < depth) & (defs >= parent_level))
+        elements = (rep <= depth) & (defs >= level)
+        before = np.cumsum(elements) - elements
+        offsets = np.empty(len(starts) + 1, dtype=np.int64)
+        offsets[:-1] = before[starts]
+        offsets[-1] = np.count_nonzero(elements)
+        # the list itself is null if the field holding it is undefined.
+        validity = defs[starts] >= level - 1
+        if validity.all():
+            validity = None
+        values = ListArray(offsets, values, validity)
+    return values
+
+
+def assemble_pages(pages, repeated_levels):
+    """Assembles a repeated column from the (values, repetition_levels,
+    definition_levels) of each of its pages, like assemble.
+
+    A record of a DATA_PAGE page can continue on the next page, so the pages
+    of a column chunk are assembled together.
+    """
+    values = _concat_values([p[0] for p in pages])
+    repetition_levels = np.concatenate([p[1] for p in pages])
+    definition_levels = np.concatenate([p[2] for p in pages])
+    return assemble(values, repetition_levels, definition_levels,
+                    repeated_levels)
@@ -1,2 +1 @@
-int read_bitpacked_internal(void *data, int data_len, int mask, int* res, int total, int bit_width);
 long read_litle_endian_int(unsigned char *data);
\ No newline at end of file
@@ -1,11 +1,164 @@
-from .main import ParquetMain
+from .main import (DATA_PAGE_TYPES, DICTIONARY_ENCODINGS, ParquetMain,
+                   column_chunk_padding, data_page_header,
+                   decode_byte_arrays, expand_nulls)
+from .filesystem import FILE_POOL, LocalFileSystem
 from .ttypes import PageType, Type
-from .converted_types import convert_column
-from .schema import SchemaHelper
+from .converted_types import (TEXT_TYPES, convert_array, has_int96_timestamps,
+                              int96_to_datetime64, masked_to_pandas)
+from .encoding import ByteArrays, fixed_bytes_to_object, plain_dtype
+from .nested import ListArray, MapArray, assemble_pages
+from .ttypes import ConvertedType, FieldRepetitionType
+from contextlib import contextmanager
+from functools import partial
 
 from collections import defaultdict
+import weakref
+import numpy as np
 import pandas as pd
-import os.path
+from pandas.api.types import union_categoricals
+try:
+    # builds sparse arrays straight from their values and positions.
+    from pandas._libs.sparse import IntIndex
+except ImportError:
+    IntIndex = None
+
+
+def _sparse_array(values, indices, length):
+    """Builds a pd.arrays.SparseArray of the given length from its non-null
+    values and their positions. Nulls can't be held by integer or boolean
+    values. Integers of up to 32 bits are widened to float64, which holds
+    them exactly, and other integers and booleans are kept as objects."""
+    fill_value = np.nan
+    if values.dtype.kind in 'mM':
+        fill_value = values.dtype.type('NaT')
+    elif values.dtype.kind in 'iu' and values.dtype.itemsize <= 4:
+        values = values.astype(np.float64)
+    elif values.dtype.kind in 'iub':
+        values = values.astype(object)
+    elif values.dtype.kind == 'S':
+        values = fixed_bytes_to_object(values)
+    if IntIndex is None:
+        dense = np.empty(length, dtype=values.dtype)
+        dense[:] = fill_value
+        dense[indices] = values
+        return pd.arrays.SparseArray(dense, fill_value=fill_value)
+    return pd.arrays.SparseArray(
+        values, sparse_index=IntIndex(length, indices.astype(np.int32)),
+        fill_value=fill_value)
+
+
+def _concat_sparse(chunks):
+    length = 0
+    indices = []
+    for chunk in chunks:
+        indices.append(chunk.sp_index.indices + length)
+        length += len(chunk)
+    return _sparse_array(np.concatenate([c.sp_values for c in chunks]),
+                         np.concatenate(indices), length)
+
+
+def _concat(chunks):
+    """Joins the per-page values of a column. Pages decoded to numpy arrays
+    are joined without going through python objects."""
+    if not chunks:
+        return []
+    if len(chunks) == 1:
+        return chunks[0]
+    if isinstance(chunks[0], ListArray):
+        return type(chunks[0]).concat(chunks)
+    if isinstance(chunks[0], pd.arrays.SparseArray):
+        return _concat_sparse(chunks)
+    if any(isinstance(c, pd.Categorical) for c in chunks):
+        # pages that weren't dictionary encoded are folded into the
+        # categories of the others.
+        return union_categoricals(
+            [c if isinstance(c, pd.Categorical) else
+             pd.Categorical(_to_nullable(c)) for c in chunks])
+    if any(isinstance(c, np.ma.MaskedArray) for c in chunks):
+        return np.ma.concatenate(chunks)
+    if chunks and all(isinstance(c, np.ndarray) for c in chunks):
+        return np.concatenate(chunks)
+    out = []
+    for chunk in chunks:
+        out.extend(chunk)
+    return out
+
+
+def _close_file(reader_ref, fileobj):
+    # pooled files can outlive their reader, which the pool doesn't keep
+    # alive.
+    reader = reader_ref()
+    if reader is None:
+        fileobj.close()
+    else:
+        reader._close_file(fileobj)
+
+
+def _dictionary_dtype(dict_items, schema_element):
+    """Returns the pd.CategoricalDtype of the values of a dictionary, and an
+    array mapping dictionary indices to category codes, or None if they are
+    the same. NaN can't be a category, so it is left out and maps to -1
+    (null)."""
+    categories = _to_nullable(dict_items)
+    code_map = None
+    if isinstance(categories, np.ndarray) and categories.dtype.kind == 'f':
+        valid = ~np.isnan(categories)
+        if not valid.all():
+            code_map = np.full(len(categories), -1, dtype=np.int64)
+            code_map[valid] = np.arange(np.count_nonzero(valid))
+            categories = categories[valid]
+    if schema_element.type == Type.BYTE_ARRAY and \
+            schema_element.converted_type not in (ConvertedType.DECIMAL,
+                                                  ConvertedType.BSON):
+        # decoded to str (see decode_byte_arrays), which pandas can't tell
+        # from an empty dictionary, as written for all null row groups.
+        categories = pd.Index(categories, dtype=str)
+    return pd.CategoricalDtype(categories), code_map
+
+
+def _to_nullable(values):
+    """Converts a masked array of column values to the matching pandas
+    nullable array, and lists (or maps) to an object array of python lists
+    (or dicts), leaving anything else untouched."""
+    if isinstance(values, ListArray):
+        return values.to_numpy()
+    return masked_to_pandas(values)
+
+
+def _convert_physical(values, convert, schema_element):
+    """Applies a bulk conversion of physical values to a column, which for a
+    pd.Categorical only converts its categories, and for a sparse array its
+    non-null values."""
+    if isinstance(values, pd.arrays.SparseArray):
+        # the non-null values are widened (see _sparse_array).
+        raw = values.sp_values
+        dtype = plain_dtype(schema_element.type, schema_element.type_length)
+        if dtype is not None:
+            raw = raw.astype(dtype)
+        return _sparse_array(convert(raw), values.sp_index.indices,
+                             len(values))
+    if not isinstance(values, pd.Categorical):
+        return convert(values)
+    categories = values.categories.tolist()
+    if schema_element.type == Type.FIXED_LEN_BYTE_ARRAY:
+        # restores the trailing zero bytes pandas drops.
+        raw = np.array(categories, dtype='S{0}'.format(
+            schema_element.type_length))
+    elif schema_element.type == Type.INT96:
+        raw = np.array(categories, dtype='S12')
+    elif schema_element.type == Type.BYTE_ARRAY:
+        raw = np.empty(len(categories), dtype=object)
+        raw[:] = categories
+    else:
+        raw = np.asarray(categories)
+    converted = convert(raw)
+    if pd.Index(converted).is_unique:
+        return values.rename_categories(converted)
+    # lossy conversions, such as of close decimals to float, map distinct
+    # values to the same category.
+    merged, categories = pd.factorize(converted)
+    codes = np.where(values.codes < 0, -1, merged[values.codes])
+    return pd.Categorical.from_codes(codes, categories)
 
 
 class CurrentLocation(object):
@@ -19,21 +172,41 @@ class CurrentLocation(object):
 
 
 class ParquetReader(object):
-    def __init__(self, binary_stream):
+    def __init__(self, binary_stream, memory_map=False, filesystem=None,
+                 file_pool=None, metadata_cache=None):
+        """Reads the parquet file, or directory of files with a _metadata
+        file, with the given name, or the given binary stream.
+
+        Files are opened from the given filesystem.FileSystem, the local
+        filesystem by default. If memory_map is set, local files are memory
+        mapped and their pages decoded from the mapping without being
+        copied. Open files are kept in the given filesystem.FilePool, by
+        default the one shared by all readers, and parsed footers in the
+        given metadata.FooterCache (see ParquetMain.read_metadata).
+        """
         self._main_file = None
         self._directory = None
         self._main_filename = None
+        # the pool keys of the files opened, by name.
         self._files = {}
-        self._main = ParquetMain()
+        self._filesystem = filesystem or LocalFileSystem(memory_map)
+        self._file_pool = FILE_POOL if file_pool is None else file_pool
+        self._main = ParquetMain(filesystem=self._filesystem,
+                                 metadata_cache=metadata_cache)
         self._open_main(binary_stream)
-        self._footer = self._main.read_footer(self._main_filename, self._main_file)
-        self._schema_helper = SchemaHelper(self._footer.schema)
+        # a cached footer takes no read, so the file is only opened to read
+        # the columns.
+        self._footer, self._schema_helper = self._main.read_metadata(
+            self._main_filename, self._main_file)
+        self._chunk_padding = column_chunk_padding(self._footer)
         self._rg = self._footer.row_groups
         self._cg = self._rg[0].columns
         self._schema = [s for s in self._footer.schema if s.num_children is None]
         self._cols = []
-        for c in self._cg:
-            self._cols.append(".".join([x for x in c.meta_data.path_in_schema]))
+        self._leaf_columns = self._find_columns()
+        for name in self._leaf_columns.values():
+            if name not in self._cols:
+                self._cols.append(name)
         self._rows = self._footer.num_rows
         self._row_group_index = 0
         self._column_group_locations = defaultdict(CurrentLocation)
@@ -46,83 +219,222 @@ class ParquetReader(object):
         if isinstance(binary_stream_or_name, str):
             if self._is_directory(binary_stream_or_name):
                 self._directory = binary_stream_or_name
-                self._main_filename = os.path.join(binary_stream_or_name, "_metadata")
+                self._main_filename = self._filesystem.join(
+                    binary_stream_or_name, "_metadata")
             else:
                 self._main_filename = binary_stream_or_name
-            self._main_file = self._open_file(self._main_filename)
         else:
             self._main_file = binary_stream_or_name
 
     def _is_directory(self, file_name):
-        """ For non local files (ie HDFS), this will need to be overridden
-        """
-        return os.path.isdir(file_name)
+        return self._filesystem.is_directory(file_name)
 
     def _open_file(self, file_name):
-        """ For non local files (ie HDFS), this will need to be overridden
-        """
-        fileobj = open(file_name, 'rb')
-        self._files[file_name] = fileobj
-        return fileobj
+        """Opens the file with the given name. Opens it from the filesystem by
+        default."""
+        return self._filesystem.open(file_name)
 
     def _close_file(self, fileobj):
-        """ For non local files (ie HDFS), this will need to be overridden
-        """
+        """Closes a file opened with _open_file, once the file pool lets go
+        of it."""
         fileobj.close()
 
-    def _get_file(self, file_name):
-        if self._directory is not None:
-            file_name = os.path.join(self._directory, file_name)
-        if file_name in self._files:
-            return self._files[file_name]
-        return self._open_file(file_name)
+    @contextmanager
+    def _open(self, file_name):
+        """Checks the file with the given name (the file_path of a column
+        chunk, None for the main file) out of the file pool for the duration
+        of the with block. A binary stream given as the main file is used as
+        is."""
+        if file_name is None and self._main_file is not None:
+            yield self._main_file
+            return
+        if file_name is None:
+            path = self._main_filename
+        elif self._directory is not None:
+            path = self._filesystem.join(self._directory, file_name)
+        else:
+            path = file_name
+        key = self._files.get(path)
+        if key is None:
+            key = self._files[path] = self._filesystem.handle_key(path)
+        closer = partial(_close_file, weakref.ref(self))
+        with self._file_pool.open(key, partial(self._open_file, path),
+                                  closer) as fo:
+            yield fo
 
     def close(self):
-        for fileobj in self._files.values():
-            self._close_file(fileobj)
-        self._files = []
+        """Closes the files of this reader that aren't in use by another
+        one."""
+        files = getattr(self, '_files', {})
+        for key in files.values():
+            self._file_pool.discard(key)
+        self._files = {}
+
+    def _find_columns(self):
+        """Maps the name of every leaf column to the name of the column it is
+        read into. The leaves of a LIST, or the key and value of a MAP, are
+        read into one column named after the list or map."""
+        nested = defaultdict(list)
+        for c in self._cg:
+            path = c.meta_data.path_in_schema
+            elements = self._schema_helper.path_elements(path)
+            for i, se in enumerate(elements):
+                if se.repetition_type == FieldRepetitionType.REPEATED or \
+                   se.converted_type in (ConvertedType.LIST, ConvertedType.MAP,
+                                         ConvertedType.MAP_KEY_VALUE):
+                    nested[".".join(path[:i + 1])].append(".".join(path))
+                    break
+        columns = {}
+        for c in self._cg:
+            name = ".".join(c.meta_data.path_in_schema)
+            columns[name] = name
+        for name, leaves in nested.items():
+            if len(leaves) == 1 or \
+               (len(leaves) == 2 and self._is_map(name)):
+                for leaf in leaves:
+                    columns[leaf] = name
+        return columns
+
+    def _is_map(self, name):
+        se = self._schema_helper.schema_element(name.split("."))
+        return se.converted_type in (ConvertedType.MAP,
+                                     ConvertedType.MAP_KEY_VALUE)
 
     def _get_column_info(self, col):
-        name = ".".join(x for x in col.meta_data.path_in_schema)
-        ind = [s for s in self._schema if s.name == name]
-        width = ind[0].type_length
+        path = col.meta_data.path_in_schema
+        name = ".".join(path)
+        width = self._schema_helper.schema_element(path).type_length
         return (name, width)
 
-    def _read_rows_in_group(self, col, name, width, rg, remaining_rows,
-                            natural):
-        file_name = col.file_path
+    def _read_dictionary(self, fileobj, ph, cmd, width):
+        """Reads a dictionary page, decoding byte array dictionaries once so
+        that data pages only look the decoded values up."""
+        dict_items = self._main.read_dictionary_page(fileobj, ph, cmd, width)
+        if isinstance(dict_items, ByteArrays):
+            dict_items = decode_byte_arrays(
+                dict_items,
+                self._schema_helper.schema_element(cmd.path_in_schema),
+                dictionary=True)
+        return dict_items
 
-        if file_name is not None:
-            fileobj = self._get_file(file_name)
-        else:
-            fileobj = self._main_file
-        offset = self._main._get_offset(col.meta_data)
-        fileobj.seek(offset, 0)
+    def _read_categorical_page(self, fileobj, ph, cmd, dtype, code_map=None):
+        """Reads a dictionary encoded data page as a pd.Categorical whose codes
+        are the decoded dictionary indices, mapped through code_map if given
+        (see _dictionary_dtype)."""
+        codes, validity = self._main.read_data_page_compact(
+            fileobj, self._schema_helper, ph, cmd, dtype.categories,
+            dictionary_codes=True)
+        if code_map is not None:
+            codes = code_map[codes]
+        codes = np.ma.filled(expand_nulls(codes, validity), -1)
+        return pd.Categorical.from_codes(codes, dtype=dtype)
+
+    def _read_sparse_page(self, fileobj, ph, cmd, dict_items):
+        """Reads a data page as a pd.arrays.SparseArray of its non-null
+        values, placed by the definition levels without expanding the
+        nulls."""
+        vals, validity = self._main.read_data_page_compact(
+            fileobj, self._schema_helper, ph, cmd, dict_items)
+        if isinstance(vals, ByteArrays):
+            vals = decode_byte_arrays(
+                vals, self._schema_helper.schema_element(cmd.path_in_schema))
+        return _sparse_array(vals, np.flatnonzero(validity), len(validity))
+
+    def _read_column_chunks(self, columns):
+        """Reads the given column chunks of a row group, with a single
+        read_ranges call per file. Returns an encoding.BufferReader over the
+        pages of every chunk."""
+        by_file = defaultdict(list)
+        for i, col in enumerate(columns):
+            by_file[col.file_path].append(i)
+        chunks = [None] * len(columns)
+        for file_name, indices in by_file.items():
+            ranges = [self._main.column_chunk_range(columns[i].meta_data,
+                                                    self._chunk_padding)
+                      for i in indices]
+            with self._open(file_name) as fileobj:
+                data = self._filesystem.read_ranges(fileobj, ranges)
+            for i, chunk_data in zip(indices, data):
+                chunks[i] = self._main.column_chunk_reader(
+                    chunk_data, columns[i].meta_data)
+        return chunks
+
+    def _read_repeated_rows_in_group(self, col, fileobj, name, width,
+                                     remaining_rows, natural):
+        """Reads the records of a repeated column chunk. A record can span
+        pages, so all the pages of the chunk are assembled together, and the
+        location in the group is the number of records read."""
+        cmd = col.meta_data
+        location_in_group = self._column_group_locations[name]
+        pages = []
+        values_seen = 0
+        dict_items = []
+        while values_seen < cmd.num_values:
+            ph = self._main._read_page_header(fileobj)
+            if ph.type in DATA_PAGE_TYPES:
+                pages.append(self._main.read_repeated_page(
+                    fileobj, self._schema_helper, ph, cmd, dict_items))
+                values_seen += data_page_header(ph).num_values
+            elif ph.type == PageType.DICTIONARY_PAGE:
+                dict_items = self._read_dictionary(fileobj, ph, cmd, width)
+            else:
+                fileobj.seek(ph.compressed_page_size, 1)
+        values = assemble_pages(
+            pages, self._schema_helper.repeated_definition_levels(
+                cmd.path_in_schema))
+        start = 0 if natural else location_in_group._row_index
+        stop = len(values)
+        if remaining_rows is not None:
+            stop = min(stop, start + remaining_rows)
+        location_in_group._row_index = stop
+        return values[start:stop]
+
+    def _read_rows_in_group(self, col, fileobj, name, width, rg,
+                            remaining_rows, natural, categorical=False,
+                            sparse=False):
         cmd = col.meta_data
-        cmd.width = width
+        if self._schema_helper.max_repetition_level(cmd.path_in_schema) > 0:
+            return self._read_repeated_rows_in_group(
+                col, fileobj, name, width, remaining_rows, natural)
         location_in_group = self._column_group_locations[name]
-        total_rows_in_group = rg.num_rows
+        # pages of repeated columns hold more values than rows.
+        total_values_in_group = cmd.num_values
         values_seen = 0
         page_index = 0
         column = []
+        column_size = 0
         dict_items = []
+        dict_dtype = None
+        code_map = None
 
-        while values_seen < total_rows_in_group:
+        while values_seen < total_values_in_group:
             ph = self._main._read_page_header(fileobj)
             if page_index < location_in_group._page_index and not natural:
                 # skip
-                if ph.type == PageType.DATA_PAGE:
+                if ph.type in DATA_PAGE_TYPES:
                     fileobj.seek(ph.compressed_page_size, 1)
-                    daph = ph.data_page_header
+                    daph = data_page_header(ph)
                     values_seen += daph.num_values
                 elif ph.type == PageType.DICTIONARY_PAGE:
-                    dict_items = self._main.read_dictionary_page(fileobj, ph, cmd)
+                    dict_items = self._read_dictionary(fileobj, ph, cmd,
+                                                      width)
             else:
                 # start reading rows.
-                if ph.type == PageType.DATA_PAGE:
-                    values = self._main.read_data_page(fileobj,
-                                                       self._schema_helper, ph,
-                                                       cmd, dict_items)
+                if ph.type in DATA_PAGE_TYPES:
+                    daph = data_page_header(ph)
+                    if categorical and daph.encoding in DICTIONARY_ENCODINGS:
+                        if dict_dtype is None:
+                            dict_dtype, code_map = _dictionary_dtype(
+                                dict_items, self._schema_helper.schema_element(
+                                    cmd.path_in_schema))
+                        values = self._read_categorical_page(
+                            fileobj, ph, cmd, dict_dtype, code_map)
+                    elif sparse:
+                        values = self._read_sparse_page(fileobj, ph, cmd,
+                                                        dict_items)
+                    else:
+                        values = self._main.read_data_page(
+                            fileobj, self._schema_helper, ph, cmd, dict_items)
 
                     # Need to check which values to keep
                     if location_in_group._row_index != 0:
@@ -130,23 +442,25 @@ class ParquetReader(object):
 
                     done = False
                     if remaining_rows is not None:
-                        if len(values) + len(column) >= remaining_rows:
+                        if len(values) + column_size >= remaining_rows:
                             done = True
-                            needed = remaining_rows - len(column)
+                            needed = remaining_rows - column_size
                             if needed != len(values):
                                 values = values[:needed]
                                 location_in_group._page_index = page_index
                                 location_in_group._row_index += needed
                             else:
-                                location_in_group._page_index += 1
+                                location_in_group._page_index = page_index + 1
                                 location_in_group._row_index = 0
-                    column += values
+                    column.append(values)
+                    column_size += len(values)
                     if done:
-                        return column
+                        return _concat(column)
 
-                    values_seen += ph.data_page_header.num_values
+                    values_seen += daph.num_values
                 elif ph.type == PageType.DICTIONARY_PAGE:
-                    dict_items = self._main.read_dictionary_page(fileobj, ph, cmd)
+                    dict_items = self._read_dictionary(fileobj, ph, cmd,
+                                                      width)
             if page_index < location_in_group._page_index:
                 page_index += 1
             else:
@@ -154,9 +468,54 @@ class ParquetReader(object):
                 location_in_group._row_index = 0
                 page_index += 1
 
-        return column
+        return _concat(column)
+
+    def read(self, columns=None, rows=None, natural=False, categorical=False,
+             int96_timestamps=None, decimals='float', sparse=False):
+        """Reads the given columns (all by default) into a pd.DataFrame.
+
+        If categorical is True, or a list of column names, dictionary encoded
+        column chunks are returned as pd.Categorical without expanding the
+        dictionary. The dictionaries of all the row groups (and files, for a
+        directory) read are unified into one set of categories.
 
-    def read(self, columns=None, rows=None, natural=False):
+        LIST and MAP columns are read into python lists and dicts.
+
+        INT96 columns are converted to datetime64[ns] if int96_timestamps is
+        True, or by default if the file was written by Spark or Impala, which
+        store timestamps that way. Otherwise they are left as 12-byte values.
+
+        DECIMAL columns are read as float64 by default. With decimals='int'
+        they hold the unscaled int64 values instead, and the scale of every
+        such column is in the DataFrame's attrs['decimal_scales']. With
+        decimals='decimal' they hold exact decimal.Decimal values.
+
+        If sparse is True, or a list of column names, optional columns are
+        read into pd.arrays.SparseArray built from the non-null values and
+        their positions, so mostly null columns take memory in proportion to
+        their non-null values.
+        """
+        if int96_timestamps is None:
+            int96_timestamps = has_int96_timestamps(self._footer)
+        res = self._read_columns(columns, rows, natural, categorical, sparse)
+        return self._make_dataframe(res, columns or self._cols,
+                                    int96_timestamps, decimals)
+
+    def read_arrays(self, columns=None, rows=None, natural=False,
+                    categorical=False):
+        """Reads the given columns like read, but returns a dict of column
+        name to its physical values: a numpy array (masked if there are
+        nulls), a pd.Categorical, or for LIST and MAP columns a
+        nested.ListArray or nested.MapArray of list offsets and flat values.
+        """
+        columns = columns or self._cols
+        res = self._read_columns(columns, rows, natural, categorical)
+        arrays = self._combine(res)
+        return dict((name, arrays[name]) for name in columns
+                    if name in arrays)
+
+    def _read_columns(self, columns, rows, natural, categorical,
+                      sparse=False):
         if columns:
             for c in columns:
                 if c not in self._cols:
@@ -170,41 +529,91 @@ class ParquetReader(object):
         remaining_rows = rows
         while self._row_group_index < len(self._rg):
             rg = self._rg[self._row_group_index]
-            cg = rg.columns
+            cg = [col for col in rg.columns
+                  if self._leaf_columns[self._get_column_info(col)[0]]
+                  in columns]
+            # the chunks of the row group are fetched together.
+            chunks = self._read_column_chunks(cg)
             rows_read = 0
-            for col in cg:
+            for col, chunk in zip(cg, chunks):
                 name, width = self._get_column_info(col)
-                if name not in columns:
-                    continue
-                row_data = self._read_rows_in_group(col, name, width,
-                                                    rg, remaining_rows, natural)
-                res[name] += row_data
+                path = col.meta_data.path_in_schema
+                flat = self._schema_helper.max_repetition_level(path) == 0
+                as_categorical = (categorical is True or bool(
+                    categorical and self._leaf_columns[name] in categorical)) \
+                    and flat
+                # only columns with nulls can be sparse.
+                as_sparse = (sparse is True or bool(
+                    sparse and self._leaf_columns[name] in sparse)) \
+                    and flat and not as_categorical and \
+                    self._schema_helper.max_definition_level(path) > 0
+                row_data = self._read_rows_in_group(col, chunk, name, width,
+                                                    rg, remaining_rows, natural,
+                                                    as_categorical, as_sparse)
+                res[name].append(row_data)
                 if rows_read == 0 and len(row_data):
                     rows_read = len(row_data)
 
             if natural and rows_read != 0:
-                self._row_group_index += 1
+                self._next_row_group()
                 break
             if remaining_rows is not None:
                 remaining_rows -= rows_read
                 if remaining_rows == 0:
                     break
 
-            self._row_group_index += 1
+            self._next_row_group()
+
+        return res
+
+    def _next_row_group(self):
+        # the page locations are within the current row group.
+        self._row_group_index += 1
+        self._column_group_locations.clear()
 
-        return self._make_dataframe(res, columns)
+    def _combine(self, res):
+        """Joins the chunks read of every leaf column, and the key and value
+        leaves of maps."""
+        arrays = {}
+        for name, chunks in res.items():
+            column = self._leaf_columns.get(name, name)
+            if column in arrays:
+                # the value leaf of a map, whose key leaf came first.
+                arrays[column] = MapArray.from_lists(arrays[column],
+                                                     _concat(chunks))
+            else:
+                arrays[column] = _concat(chunks)
+        return arrays
 
-    def _make_dataframe(self, res, columns):
+    def _make_dataframe(self, res, columns, int96_timestamps=False,
+                        decimals='float'):
         if len(res) == 0:
             for name in columns:
-                res[name] = []
-
-        out = pd.DataFrame(res, columns=columns)
+                res[name] = [[]]
 
-        for col in columns:
-            match = [s for s in self._schema if col == s.name]
-            if len(match):
-                schema = match[0]
-                if schema.converted_type:
-                    out[col] = convert_column(out[col], schema)
+        arrays = self._combine(res)
+        # converted types are converted in bulk from the physical values.
+        decimal_scales = {}
+        for name, values in arrays.items():
+            se = self._schema_helper.schema_elements_by_path.get(
+                tuple(name.split(".")))
+            if se is None or (se.type == Type.BYTE_ARRAY and
+                              se.converted_type in TEXT_TYPES):
+                # text is decoded as the pages are read.
+                continue
+            if se.converted_type is not None:
+                convert = partial(convert_array, schemae=se,
+                                  decimals=decimals)
+                if se.converted_type == ConvertedType.DECIMAL:
+                    decimal_scales[name] = se.scale or 0
+            elif int96_timestamps and se.type == Type.INT96:
+                convert = int96_to_datetime64
+            else:
+                continue
+            arrays[name] = _convert_physical(values, convert, se)
+        out = pd.DataFrame(dict((name, _to_nullable(values))
+                                for name, values in arrays.items()),
+                           columns=columns)
+        if decimals == 'int' and decimal_scales:
+            out.attrs['decimal_scales'] = decimal_scales
         return out
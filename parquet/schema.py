@@ -9,31 +9,72 @@ class SchemaHelper(object):
         self.schema_elements = schema_elements
         self.schema_elements_by_name = dict(
             [(se.name, se) for se in schema_elements])
-        assert len(self.schema_elements) == len(self.schema_elements_by_name)
+        # nested schemas reuse names (list, element, key_value, ...), so
+        # elements are also indexed by their path from the root.
+        self.schema_elements_by_path = {}
+        self._index_paths()
+
+    def _index_paths(self):
+        # the schema is the depth-first flattening of the tree, where each
+        # group gives its number of children. The root isn't part of a path.
+        if not self.schema_elements:
+            return
+        root = self.schema_elements[0]
+        num_children = root.num_children
+        if num_children is None:
+            num_children = len(self.schema_elements) - 1
+        stack = [[(), num_children]]
+        for se in self.schema_elements[1:]:
+            while stack[-1][1] == 0:
+                stack.pop()
+            parent = stack[-1]
+            parent[1] -= 1
+            path = parent[0] + (se.name,)
+            self.schema_elements_by_path[path] = se
+            if se.num_children:
+                stack.append([path, se.num_children])
 
     def schema_element(self, name):
-        """Get the schema element with the given name."""
+        """Get the schema element with the given name, or path (a list of
+        names from the root, as in ColumnMetaData.path_in_schema)."""
+        if isinstance(name, (list, tuple)):
+            return self.schema_elements_by_path[tuple(name)]
         return self.schema_elements_by_name[name]
 
+    def path_elements(self, path):
+        """Get the schema elements along the given path, outermost first."""
+        return [self.schema_elements_by_path[tuple(path[:i + 1])]
+                for i in range(len(path))]
+
     def is_required(self, name):
-        """Returns true iff the schema element with the given name is
-        required"""
+        """Returns true iff the schema element with the given name (or path)
+        is required"""
         return self.schema_element(name).repetition_type == FieldRepetitionType.REQUIRED
 
     def max_repetition_level(self, path):
         """get the max repetition level for the given schema path."""
         max_level = 0
-        for part in path:
-            se = self.schema_element(part)
-            if se.repetition_type == FieldRepetitionType.REQUIRED:
+        for se in self.path_elements(path):
+            if se.repetition_type == FieldRepetitionType.REPEATED:
                 max_level += 1
         return max_level
 
     def max_definition_level(self, path):
         """get the max definition level for the given schema path."""
         max_level = 0
-        for part in path:
-            se = self.schema_element(part)
+        for se in self.path_elements(path):
             if se.repetition_type != FieldRepetitionType.REQUIRED:
                 max_level += 1
         return max_level
+
+    def repeated_definition_levels(self, path):
+        """get the definition level of every repeated element along the given
+        schema path, outermost first. There is one per repetition level."""
+        levels = []
+        max_level = 0
+        for se in self.path_elements(path):
+            if se.repetition_type != FieldRepetitionType.REQUIRED:
+                max_level += 1
+            if se.repetition_type == FieldRepetitionType.REPEATED:
+                levels.append(max_level)
+        return levels
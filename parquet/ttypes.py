@@ -65,12 +65,48 @@ class ConvertedType:
   MAP = 1
   MAP_KEY_VALUE = 2
   LIST = 3
+  ENUM = 4
+  DECIMAL = 5
+  DATE = 6
+  TIME_MILLIS = 7
+  TIME_MICROS = 8
+  TIMESTAMP_MILLIS = 9
+  TIMESTAMP_MICROS = 10
+  UINT_8 = 11
+  UINT_16 = 12
+  UINT_32 = 13
+  UINT_64 = 14
+  INT_8 = 15
+  INT_16 = 16
+  INT_32 = 17
+  INT_64 = 18
+  JSON = 19
+  BSON = 20
+  INTERVAL = 21
 
   _VALUES_TO_NAMES = {
     0: "UTF8",
     1: "MAP",
     2: "MAP_KEY_VALUE",
     3: "LIST",
+    4: "ENUM",
+    5: "DECIMAL",
+    6: "DATE",
+    7: "TIME_MILLIS",
+    8: "TIME_MICROS",
+    9: "TIMESTAMP_MILLIS",
+    10: "TIMESTAMP_MICROS",
+    11: "UINT_8",
+    12: "UINT_16",
+    13: "UINT_32",
+    14: "UINT_64",
+    15: "INT_8",
+    16: "INT_16",
+    17: "INT_32",
+    18: "INT_64",
+    19: "JSON",
+    20: "BSON",
+    21: "INTERVAL",
   }
 
   _NAMES_TO_VALUES = {
@@ -78,6 +114,24 @@ class ConvertedType:
     "MAP": 1,
     "MAP_KEY_VALUE": 2,
     "LIST": 3,
+    "ENUM": 4,
+    "DECIMAL": 5,
+    "DATE": 6,
+    "TIME_MILLIS": 7,
+    "TIME_MICROS": 8,
+    "TIMESTAMP_MILLIS": 9,
+    "TIMESTAMP_MICROS": 10,
+    "UINT_8": 11,
+    "UINT_16": 12,
+    "UINT_32": 13,
+    "UINT_64": 14,
+    "INT_8": 15,
+    "INT_16": 16,
+    "INT_32": 17,
+    "INT_64": 18,
+    "JSON": 19,
+    "BSON": 20,
+    "INTERVAL": 21,
   }
 
 class FieldRepetitionType:
@@ -111,6 +165,10 @@ class Encoding:
   PLAIN_DICTIONARY = 2
   RLE = 3
   BIT_PACKED = 4
+  DELTA_BINARY_PACKED = 5
+  DELTA_LENGTH_BYTE_ARRAY = 6
+  DELTA_BYTE_ARRAY = 7
+  RLE_DICTIONARY = 8
 
   _VALUES_TO_NAMES = {
     0: "PLAIN",
@@ -118,6 +176,10 @@ class Encoding:
     2: "PLAIN_DICTIONARY",
     3: "RLE",
     4: "BIT_PACKED",
+    5: "DELTA_BINARY_PACKED",
+    6: "DELTA_LENGTH_BYTE_ARRAY",
+    7: "DELTA_BYTE_ARRAY",
+    8: "RLE_DICTIONARY",
   }
 
   _NAMES_TO_VALUES = {
@@ -126,6 +188,10 @@ class Encoding:
     "PLAIN_DICTIONARY": 2,
     "RLE": 3,
     "BIT_PACKED": 4,
+    "DELTA_BINARY_PACKED": 5,
+    "DELTA_LENGTH_BYTE_ARRAY": 6,
+    "DELTA_BYTE_ARRAY": 7,
+    "RLE_DICTIONARY": 8,
   }
 
 class CompressionCodec:
@@ -155,17 +221,20 @@ class PageType:
   DATA_PAGE = 0
   INDEX_PAGE = 1
   DICTIONARY_PAGE = 2
+  DATA_PAGE_V2 = 3
 
   _VALUES_TO_NAMES = {
     0: "DATA_PAGE",
     1: "INDEX_PAGE",
     2: "DICTIONARY_PAGE",
+    3: "DATA_PAGE_V2",
   }
 
   _NAMES_TO_VALUES = {
     "DATA_PAGE": 0,
     "INDEX_PAGE": 1,
     "DICTIONARY_PAGE": 2,
+    "DATA_PAGE_V2": 3,
   }
 
 
@@ -191,6 +260,11 @@ class SchemaElement:
   This field is not set when the element is a primitive type
    - converted_type: When the schema is the result of a conversion from another model
   Used to record the original type to help with cross conversion.
+   - scale: Used when this column contains decimal data.
+  See the DECIMAL converted type for more details.
+   - precision
+   - field_id: When the original schema supports field ids, this will save the
+  original field id in the parquet schema
   """
 
   thrift_spec = (
@@ -201,15 +275,21 @@ class SchemaElement:
     (4, TType.STRING, 'name', None, None, ), # 4
     (5, TType.I32, 'num_children', None, None, ), # 5
     (6, TType.I32, 'converted_type', None, None, ), # 6
+    (7, TType.I32, 'scale', None, None, ), # 7
+    (8, TType.I32, 'precision', None, None, ), # 8
+    (9, TType.I32, 'field_id', None, None, ), # 9
   )
 
-  def __init__(self, type=None, type_length=None, repetition_type=None, name=None, num_children=None, converted_type=None,):
+  def __init__(self, type=None, type_length=None, repetition_type=None, name=None, num_children=None, converted_type=None, scale=None, precision=None, field_id=None,):
     self.type = type
     self.type_length = type_length
     self.repetition_type = repetition_type
     self.name = name
     self.num_children = num_children
     self.converted_type = converted_type
+    self.scale = scale
+    self.precision = precision
+    self.field_id = field_id
 
   def read(self, iprot):
     iprot.read_struct_begin()
@@ -247,6 +327,21 @@ class SchemaElement:
           self.converted_type = iprot.read_int()
         else:
           iprot.skip(ftype)
+      elif fid == 7:
+        if ftype == TType.I32:
+          self.scale = iprot.read_int()
+        else:
+          iprot.skip(ftype)
+      elif fid == 8:
+        if ftype == TType.I32:
+          self.precision = iprot.read_int()
+        else:
+          iprot.skip(ftype)
+      elif fid == 9:
+        if ftype == TType.I32:
+          self.field_id = iprot.read_int()
+        else:
+          iprot.skip(ftype)
       else:
         if ftype == TType.I32:
             piece = iprot.read_int()
@@ -287,6 +382,18 @@ class SchemaElement:
       oprot.write_field_begin('converted_type', TType.I32, 6)
       oprot.write_i32(self.converted_type)
       oprot.write_field_end()
+    if self.scale is not None:
+      oprot.write_field_begin('scale', TType.I32, 7)
+      oprot.write_i32(self.scale)
+      oprot.write_field_end()
+    if self.precision is not None:
+      oprot.write_field_begin('precision', TType.I32, 8)
+      oprot.write_i32(self.precision)
+      oprot.write_field_end()
+    if self.field_id is not None:
+      oprot.write_field_begin('field_id', TType.I32, 9)
+      oprot.write_i32(self.field_id)
+      oprot.write_field_end()
     oprot.write_field_stop()
     oprot.write_struct_end()
 
@@ -515,6 +622,153 @@ class DictionaryPageHeader:
   def __ne__(self, other):
     return not (self == other)
 
+class DataPageHeaderV2:
+  """
+  New page format allowing reading levels without decompressing the data
+  Repetition and definition levels are uncompressed
+  The remaining section containing the data is compressed if is_compressed is true
+
+  Attributes:
+   - num_values: Number of values, including NULLs, in this data page. *
+   - num_nulls: Number of NULL values, in this data page.
+  Number of non-null = num_values - num_nulls which is also the number of values in the data section *
+   - num_rows: Number of rows in this data page. which means pages change on record boundaries (r = 0) *
+   - encoding: Encoding used for data in this page *
+   - definition_levels_byte_length: length of the definition levels
+   - repetition_levels_byte_length: length of the repetition levels
+   - is_compressed: whether the values are compressed.
+  Which means the section of the page between
+  definition_levels_byte_length + repetition_levels_byte_length + 1 and compressed_page_size (included)
+  is compressed with the compression_codec.
+  If missing it is considered compressed
+  """
+
+  thrift_spec = (
+    None, # 0
+    (1, TType.I32, 'num_values', None, None, ), # 1
+    (2, TType.I32, 'num_nulls', None, None, ), # 2
+    (3, TType.I32, 'num_rows', None, None, ), # 3
+    (4, TType.I32, 'encoding', None, None, ), # 4
+    (5, TType.I32, 'definition_levels_byte_length', None, None, ), # 5
+    (6, TType.I32, 'repetition_levels_byte_length', None, None, ), # 6
+    (7, TType.BOOL, 'is_compressed', None, True, ), # 7
+  )
+
+  def __init__(self, num_values=None, num_nulls=None, num_rows=None, encoding=None, definition_levels_byte_length=None, repetition_levels_byte_length=None, is_compressed=thrift_spec[7][4],):
+    self.num_values = num_values
+    self.num_nulls = num_nulls
+    self.num_rows = num_rows
+    self.encoding = encoding
+    self.definition_levels_byte_length = definition_levels_byte_length
+    self.repetition_levels_byte_length = repetition_levels_byte_length
+    self.is_compressed = is_compressed
+
+  def read(self, iprot):
+    iprot.read_struct_begin()
+    while True:
+      (fname, ftype, fid) = iprot.read_field_begin()
+      if ftype == TType.STOP:
+        break
+      if fid == 1:
+        if ftype == TType.I32:
+          self.num_values = iprot.read_int()
+        else:
+          iprot.skip(ftype)
+      elif fid == 2:
+        if ftype == TType.I32:
+          self.num_nulls = iprot.read_int()
+        else:
+          iprot.skip(ftype)
+      elif fid == 3:
+        if ftype == TType.I32:
+          self.num_rows = iprot.read_int()
+        else:
+          iprot.skip(ftype)
+      elif fid == 4:
+        if ftype == TType.I32:
+          self.encoding = iprot.read_int()
+        else:
+          iprot.skip(ftype)
+      elif fid == 5:
+        if ftype == TType.I32:
+          self.definition_levels_byte_length = iprot.read_int()
+        else:
+          iprot.skip(ftype)
+      elif fid == 6:
+        if ftype == TType.I32:
+          self.repetition_levels_byte_length = iprot.read_int()
+        else:
+          iprot.skip(ftype)
+      elif fid == 7:
+        if ftype == TType.BOOL:
+          self.is_compressed = iprot.read_bool()
+        else:
+          iprot.skip(ftype)
+      else:
+        iprot.skip(ftype)
+      iprot.read_field_end()
+    iprot.read_struct_end()
+
+  def write(self, oprot):
+    oprot.write_struct_begin('DataPageHeaderV2')
+    if self.num_values is not None:
+      oprot.write_field_begin('num_values', TType.I32, 1)
+      oprot.write_i32(self.num_values)
+      oprot.write_field_end()
+    if self.num_nulls is not None:
+      oprot.write_field_begin('num_nulls', TType.I32, 2)
+      oprot.write_i32(self.num_nulls)
+      oprot.write_field_end()
+    if self.num_rows is not None:
+      oprot.write_field_begin('num_rows', TType.I32, 3)
+      oprot.write_i32(self.num_rows)
+      oprot.write_field_end()
+    if self.encoding is not None:
+      oprot.write_field_begin('encoding', TType.I32, 4)
+      oprot.write_i32(self.encoding)
+      oprot.write_field_end()
+    if self.definition_levels_byte_length is not None:
+      oprot.write_field_begin('definition_levels_byte_length', TType.I32, 5)
+      oprot.write_i32(self.definition_levels_byte_length)
+      oprot.write_field_end()
+    if self.repetition_levels_byte_length is not None:
+      oprot.write_field_begin('repetition_levels_byte_length', TType.I32, 6)
+      oprot.write_i32(self.repetition_levels_byte_length)
+      oprot.write_field_end()
+    if self.is_compressed is not None:
+      oprot.write_field_begin('is_compressed', TType.BOOL, 7)
+      oprot.write_bool(self.is_compressed)
+      oprot.write_field_end()
+    oprot.write_field_stop()
+    oprot.write_struct_end()
+
+  def validate(self):
+    if self.num_values is None:
+      raise TProtocolException(message='Required field num_values is unset!')
+    if self.num_nulls is None:
+      raise TProtocolException(message='Required field num_nulls is unset!')
+    if self.num_rows is None:
+      raise TProtocolException(message='Required field num_rows is unset!')
+    if self.encoding is None:
+      raise TProtocolException(message='Required field encoding is unset!')
+    if self.definition_levels_byte_length is None:
+      raise TProtocolException(message='Required field definition_levels_byte_length is unset!')
+    if self.repetition_levels_byte_length is None:
+      raise TProtocolException(message='Required field repetition_levels_byte_length is unset!')
+    return
+
+
+  def __repr__(self):
+    L = ['%s=%r' % (key, value)
+      for key, value in self.__dict__.items()]
+    return '%s(%s)' % (self.__class__.__name__, ', '.join(L))
+
+  def __eq__(self, other):
+    return isinstance(other, self.__class__) and self.__dict__ == other.__dict__
+
+  def __ne__(self, other):
+    return not (self == other)
+
 class PageHeader:
   """
   Attributes:
@@ -527,6 +781,7 @@ class PageHeader:
    - data_page_header
    - index_page_header
    - dictionary_page_header
+   - data_page_header_v2
   """
 
   thrift_spec = (
@@ -538,9 +793,10 @@ class PageHeader:
     (5, TType.STRUCT, 'data_page_header', (DataPageHeader, DataPageHeader.thrift_spec), None, ), # 5
     (6, TType.STRUCT, 'index_page_header', (IndexPageHeader, IndexPageHeader.thrift_spec), None, ), # 6
     (7, TType.STRUCT, 'dictionary_page_header', (DictionaryPageHeader, DictionaryPageHeader.thrift_spec), None, ), # 7
+    (8, TType.STRUCT, 'data_page_header_v2', (DataPageHeaderV2, DataPageHeaderV2.thrift_spec), None, ), # 8
   )
 
-  def __init__(self, type=None, uncompressed_page_size=None, compressed_page_size=None, crc=None, data_page_header=None, index_page_header=None, dictionary_page_header=None,):
+  def __init__(self, type=None, uncompressed_page_size=None, compressed_page_size=None, crc=None, data_page_header=None, index_page_header=None, dictionary_page_header=None, data_page_header_v2=None,):
     self.type = type
     self.uncompressed_page_size = uncompressed_page_size
     self.compressed_page_size = compressed_page_size
@@ -548,6 +804,7 @@ class PageHeader:
     self.data_page_header = data_page_header
     self.index_page_header = index_page_header
     self.dictionary_page_header = dictionary_page_header
+    self.data_page_header_v2 = data_page_header_v2
 
   def read(self, iprot):
     iprot.read_struct_begin()
@@ -593,6 +850,12 @@ class PageHeader:
           self.dictionary_page_header.read(iprot)
         else:
           iprot.skip(ftype)
+      elif fid == 8:
+        if ftype == TType.STRUCT:
+          self.data_page_header_v2 = DataPageHeaderV2()
+          self.data_page_header_v2.read(iprot)
+        else:
+          iprot.skip(ftype)
       else:
         iprot.skip(ftype)
       iprot.read_field_end()
@@ -628,6 +891,10 @@ class PageHeader:
       oprot.write_field_begin('dictionary_page_header', TType.STRUCT, 7)
       self.dictionary_page_header.write(oprot)
       oprot.write_field_end()
+    if self.data_page_header_v2 is not None:
+      oprot.write_field_begin('data_page_header_v2', TType.STRUCT, 8)
+      self.data_page_header_v2.write(oprot)
+      oprot.write_field_end()
     oprot.write_field_stop()
     oprot.write_struct_end()
 
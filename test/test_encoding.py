@@ -74,6 +74,126 @@ class TestPlain(unittest.TestCase):
                 fo, Type.FIXED_LEN_BYTE_ARRAY, 3))
 
 
+class TestBufferReader(unittest.TestCase):
+
+    def test_read(self):
+        fo = parquet.encoding.BufferReader(b"foobar")
+        self.assertEquals(b"fo", fo.read(2))
+        self.assertEquals(2, fo.tell())
+        self.assertEquals(b"oba", bytes(parquet.encoding.read_buffer(fo, 3)))
+        self.assertEquals(b"r", fo.read())
+        self.assertEquals(b"", fo.read(1))
+
+    def test_seek(self):
+        fo = parquet.encoding.BufferReader(b"foobar")
+        fo.seek(-2, 2)
+        self.assertEquals(b"ar", fo.read())
+        fo.seek(1, 0)
+        fo.seek(2, 1)
+        self.assertEquals(b"ba", fo.read(2))
+
+    def test_no_copy(self):
+        data = bytearray(struct.pack("<3i", 1, -2, 999))
+        fo = parquet.encoding.BufferReader(memoryview(data))
+        dtype = parquet.encoding.plain_dtype(Type.INT32)
+        out = parquet.encoding.read_plain_array(fo, dtype, 3)
+        data[0] = 7
+        self.assertEquals([7, -2, 999], out.tolist())
+
+
+class TestPlainArray(unittest.TestCase):
+
+    def test_int32(self):
+        fo = BytesIO(struct.pack("<3i", 1, -2, 999))
+        dtype = parquet.encoding.plain_dtype(Type.INT32)
+        out = parquet.encoding.read_plain_array(fo, dtype, 3)
+        self.assertEquals([1, -2, 999], out.tolist())
+        self.assertEquals(12, fo.tell())
+
+    def test_int64(self):
+        fo = BytesIO(struct.pack("<2q", 1 << 40, -1))
+        dtype = parquet.encoding.plain_dtype(Type.INT64)
+        out = parquet.encoding.read_plain_array(fo, dtype, 2)
+        self.assertEquals([1 << 40, -1], out.tolist())
+
+    def test_double(self):
+        fo = BytesIO(struct.pack("<2d", 9.99, -0.5))
+        dtype = parquet.encoding.plain_dtype(Type.DOUBLE)
+        out = parquet.encoding.read_plain_array(fo, dtype, 2)
+        self.assertEquals([9.99, -0.5], out.tolist())
+
+    def test_fixed(self):
+        fo = BytesIO(b"foobar")
+        dtype = parquet.encoding.plain_dtype(Type.FIXED_LEN_BYTE_ARRAY, 3)
+        out = parquet.encoding.read_plain_array(fo, dtype, 2)
+        self.assertEquals([b"foo", b"bar"], out.tolist())
+
+    def test_variable_width(self):
+        self.assertIsNone(parquet.encoding.plain_dtype(Type.BYTE_ARRAY))
+
+    def test_boolean(self):
+        fo = BytesIO(struct.pack("<BBB", 0b00001101, 0b10000000, 0xff))
+        out = parquet.encoding.read_plain_boolean_array(fo, 10)
+        self.assertEquals("bool", out.dtype.name)
+        self.assertEquals([True, False, True, True, False, False, False,
+                           False, False, False], out.tolist())
+        self.assertEquals(2, fo.tell())
+
+    def test_boolean_packed(self):
+        fo = BytesIO(struct.pack("<BB", 0b00001101, 0b1))
+        out = parquet.encoding.read_plain_boolean_array(fo, 9, packed=True)
+        self.assertEquals([0b00001101, 0b1], out.tolist())
+
+
+class TestByteArrays(unittest.TestCase):
+
+    def _encoded(self, values):
+        return b"".join(struct.pack("<i", len(v)) + v for v in values)
+
+    def test_read_plain(self):
+        values = [b"foo", b"", b"quux"]
+        fo = BytesIO(self._encoded(values) + b"tail")
+        reader = parquet.encoding.Encoding(1)
+        out = reader.read_plain_byte_arrays(fo, 3)
+        self.assertEquals(b"fooquux", out.data.tobytes())
+        self.assertEquals([0, 3, 3, 7], out.offsets.tolist())
+        self.assertEquals(values, out.to_numpy().tolist())
+        self.assertEquals(b"tail", fo.read())
+
+    def test_truncated(self):
+        reader = parquet.encoding.Encoding(1)
+        fo = BytesIO(struct.pack("<i", 10) + b"short")
+        self.assertRaises(ValueError, reader.read_plain_byte_arrays, fo, 1)
+
+    def test_take_and_slice(self):
+        reader = parquet.encoding.Encoding(1)
+        arrays = reader.read_plain_byte_arrays(
+            BytesIO(self._encoded([b"a", b"bb", b"ccc"])), 3)
+        self.assertEquals([b"ccc", b"a", b"ccc"],
+                          arrays.take([2, 0, 2]).to_numpy().tolist())
+        self.assertEquals([b"bb", b"ccc"], arrays[1:].to_numpy().tolist())
+        self.assertEquals(b"bb", arrays[1])
+        joined = parquet.encoding.ByteArrays.concat([arrays[1:], arrays[:1]])
+        self.assertEquals([b"bb", b"ccc", b"a"], joined.to_numpy().tolist())
+
+    def test_decode(self):
+        values = [u"caf\u00e9".encode("utf-8"), b"plain"]
+        reader = parquet.encoding.Encoding(1)
+        arrays = reader.read_plain_byte_arrays(
+            BytesIO(self._encoded(values)), 2)
+        self.assertEquals([u"caf\u00e9", u"plain"], arrays.decode().tolist())
+        self.assertEquals([u"plain"], arrays[1:].decode().tolist())
+
+    def test_decode_interned(self):
+        reader = parquet.encoding.Encoding(1)
+        raw = self._encoded([b"repeated value", b"other value"])
+        first = reader.read_plain_byte_arrays(BytesIO(raw), 2)
+        second = reader.read_plain_byte_arrays(BytesIO(raw), 2)
+        self.assertIsNot(first.decode()[0], second.decode()[0])
+        self.assertIs(first.decode(interned=True)[0],
+                      second.decode(interned=True)[0])
+
+
 class TestRle(unittest.TestCase):
 
     def testFourByteValue(self):
@@ -83,6 +203,101 @@ class TestRle(unittest.TestCase):
         self.assertEquals([1 << 30] * 2, list(out))
 
 
+class TestRleBitPackedHybrid(unittest.TestCase):
+
+    def _encoded(self):
+        # an rle run of five 3s followed by one bit-packed group of 0..7
+        runs = struct.pack("<BB", 5 << 1, 3) + struct.pack(
+            "<BBBB", (1 << 1) | 1, 0b10001000, 0b11000110, 0b11111010)
+        return struct.pack("<i", len(runs)) + runs
+
+    def testMixedRuns(self):
+        reader = parquet.encoding.Encoding(3)
+        out = reader.read_rle_bit_packed_hybrid(BytesIO(self._encoded()))
+        self.assertEquals([3] * 5 + list(range(8)), out.tolist())
+
+    def testCountTruncatesPadding(self):
+        fo = BytesIO(self._encoded() + b"tail")
+        reader = parquet.encoding.Encoding(3)
+        out = reader.read_rle_bit_packed_hybrid(fo, count=10)
+        self.assertEquals([3] * 5 + list(range(5)), out.tolist())
+        self.assertEquals(b"tail", fo.read())
+
+
+class TestUnpackBits(unittest.TestCase):
+
+    def testWideValues(self):
+        values = [0, 1, 1023, 512, 77, 1000, 3, 256]
+        packed = 0
+        for i, v in enumerate(values):
+            packed |= v << (10 * i)
+        data = bytes(bytearray((packed >> (8 * i)) & 0xFF for i in range(10)))
+        out = parquet.encoding.unpack_bits(data, 10, 8)
+        self.assertEquals(values, out.tolist())
+
+    def testByteWidth(self):
+        out = parquet.encoding.unpack_bits(b"\x01\x02\xff", 8, 3)
+        self.assertEquals([1, 2, 255], out.tolist())
+
+
+class TestDeltaBinaryPacked(unittest.TestCase):
+
+    def testConstantDeltas(self):
+        # block of 128 values in 4 miniblocks, 5 values, first value 1 and
+        # a min delta of 1, so every miniblock has a bit width of 0.
+        data = struct.pack("<BBBBBB", 0x80, 0x01, 4, 5, 2, 2) + b"\x00" * 4
+        fo = BytesIO(data + b"tail")
+        out = parquet.encoding.read_delta_binary_packed(fo)
+        self.assertEquals([1, 2, 3, 4, 5], out.tolist())
+        self.assertEquals(b"tail", fo.read())
+
+    def testPackedDeltas(self):
+        # block of 32 values in 1 miniblock: 7, 5, 3, 1, 2, 3 has deltas
+        # -2, -2, -2, 1, 1 so min delta -2 and packed deltas 0, 0, 0, 3, 3.
+        packed = 0
+        for i, d in enumerate([0, 0, 0, 3, 3]):
+            packed |= d << (2 * i)
+        body = bytes(bytearray((packed >> (8 * i)) & 0xFF for i in range(8)))
+        data = struct.pack("<BBBBBB", 32, 1, 6, 14, 3, 2) + body
+        out = parquet.encoding.read_delta_binary_packed(BytesIO(data))
+        self.assertEquals([7, 5, 3, 1, 2, 3], out.tolist())
+
+
+def _delta_encoded(values):
+    """DELTA_BINARY_PACKED encodes up to 33 values as a single block of one
+    32 value miniblock."""
+    zigzag = lambda v: (v << 1) ^ (v >> 63)
+    deltas = [b - a for a, b in zip(values, values[1:])] or [0]
+    min_delta = min(deltas)
+    width = max(d - min_delta for d in deltas).bit_length()
+    packed = 0
+    for i, d in enumerate(deltas):
+        packed |= (d - min_delta) << (width * i)
+    body = bytes(bytearray((packed >> (8 * i)) & 0xFF
+                           for i in range(width * 4)))
+    return struct.pack("<BBBBBB", 32, 1, len(values), zigzag(values[0]),
+                       zigzag(min_delta), width) + body
+
+
+class TestDeltaByteArray(unittest.TestCase):
+
+    def testLengths(self):
+        fo = BytesIO(_delta_encoded([3, 0, 2]) + b"foobar" + b"tail")
+        out = parquet.encoding.read_delta_length_byte_array(fo)
+        self.assertEquals([b"foo", b"", b"ba"], out.to_numpy().tolist())
+        self.assertEquals(b"rtail", fo.read())
+
+    def testFrontCoding(self):
+        values = [b"abc", b"abd", b"abdx", b"abdxy", b"b", b""]
+        prefixes = [0, 2, 3, 4, 0, 0]
+        suffixes = [b"abc", b"d", b"x", b"y", b"b", b""]
+        data = (_delta_encoded(prefixes) +
+                _delta_encoded([len(x) for x in suffixes]) +
+                b"".join(suffixes))
+        out = parquet.encoding.read_delta_byte_array(BytesIO(data))
+        self.assertEquals(values, out.to_numpy().tolist())
+
+
 class TestVarInt(unittest.TestCase):
 
     def testSingleByte(self):
@@ -102,7 +317,7 @@ class TestBitPacked(unittest.TestCase):
 
     def testFromExample(self):
         raw_data_in = [0b10001000, 0b11000110, 0b11111010]
-        encoded_bitstring = array.array('B', raw_data_in).tostring()
+        encoded_bitstring = array.array('B', raw_data_in).tobytes()
         fo = BytesIO(encoded_bitstring)
         count = 3 << 1
         reader = parquet.encoding.Encoding(3)
@@ -114,11 +329,23 @@ class TestBitPackedDeprecated(unittest.TestCase):
 
     def testFromExample(self):
         encoded_bitstring = array.array(
-            'B', [0b00000101, 0b00111001, 0b01110111]).tostring()
+            'B', [0b00000101, 0b00111001, 0b01110111]).tobytes()
         fo = BytesIO(encoded_bitstring)
         reader = parquet.encoding.Encoding(3)
         res = reader.read_bitpacked_deprecated(fo, 3, 8)
-        self.assertEquals([x for x in range(8)], res)
+        self.assertEquals([x for x in range(8)], res.tolist())
+
+    def testWideValues(self):
+        values = [1023, 0, 512, 1, 77]
+        packed = 0
+        for v in values:
+            packed = (packed << 10) | v
+        packed <<= 7 * 8 - 50  # pad the last byte on the right
+        data = bytes(bytearray((packed >> (8 * i)) & 0xFF
+                               for i in range(6, -1, -1)))
+        reader = parquet.encoding.Encoding(10)
+        res = reader.read_bitpacked_deprecated(BytesIO(data), 7, 5)
+        self.assertEquals(values, res.tolist())
 
 
 class TestWidthFromMaxInt(unittest.TestCase):
@@ -1,35 +1,54 @@
 import csv
+import datetime
+import decimal
 import json
+import mmap
 import os
 from io import BytesIO, StringIO
+import struct
 import tempfile
+import threading
 import unittest
 
+import numpy as np
+import pandas as pd
+
+from thriftpy.protocol.compact import TCompactProtocol
+
 import parquet
+from parquet import compact
+import parquet.filesystem
+from parquet.metadata import FooterCache, LazyRowGroups
+from parquet.main import TFileObjectTransport
+from parquet.ttypes import (ColumnMetaData, CompressionCodec, ConvertedType,
+                            DataPageHeader, DataPageHeaderV2, Encoding,
+                            FieldRepetitionType, FileMetaData, PageHeader,
+                            PageType, RowGroup, SchemaElement, Type)
 
 
 class TestFileFormat(unittest.TestCase):
-    def test_header_magic_bytes(self):
-        main = parquet.ParquetMain()
+
+    def _read_footer(self, data, check_header=False):
         with tempfile.NamedTemporaryFile() as t:
-            t.write(b"PAR1_some_bogus_data")
+            t.write(data)
             t.flush()
-            self.assertTrue(main._check_header_magic_bytes(t))
+            main = parquet.ParquetMain(metadata_cache=FooterCache())
+            return main.read_footer(t.name, check_header=check_header)
+
+    def test_header_magic_bytes(self):
+        with open("test-data/nation.impala.parquet", "rb") as fo:
+            data = fo.read()
+        self._read_footer(data, check_header=True)
+        with self.assertRaises(parquet.main.ParquetFormatException):
+            self._read_footer(b"PAR0" + data[4:], check_header=True)
 
     def test_footer_magic_bytes(self):
-        main = parquet.ParquetMain()
-        with tempfile.NamedTemporaryFile() as t:
-            t.write(b"PAR1_some_bogus_data_PAR1")
-            t.flush()
-            self.assertTrue(main._check_footer_magic_bytes(t))
+        with self.assertRaises(parquet.main.ParquetFormatException):
+            self._read_footer(b"PAR1_some_bogus_data_PAR0")
 
     def test_not_parquet_file(self):
-        main = parquet.ParquetMain()
-        with tempfile.NamedTemporaryFile() as t:
-            t.write(b"blah")
-            t.flush()
-            self.assertFalse(main._check_header_magic_bytes(t))
-            self.assertFalse(main._check_footer_magic_bytes(t))
+        with self.assertRaises(parquet.main.ParquetFormatException):
+            self._read_footer(b"blah")
 
 
 class TestMetadata(unittest.TestCase):
@@ -39,7 +58,7 @@ class TestMetadata(unittest.TestCase):
     def test_footer_bytes(self):
         main = parquet.ParquetMain()
         with open(self.f, 'rb') as fo:
-            self.assertEquals(327, main._get_footer_size(fo))
+            self.assertEquals(327, len(main._read_footer_data(fo)))
 
     def test_read_footer(self):
         main = parquet.ParquetMain()
@@ -54,6 +73,38 @@ class TestMetadata(unittest.TestCase):
         main = parquet.ParquetMain()
         main.dump_metadata(self.f, data)
 
+    def test_single_read(self):
+        with open(self.f, "rb") as fo:
+            counting = CountingFile(fo)
+            main = parquet.ParquetMain(metadata_cache=FooterCache())
+            footer = main.read_footer(self.f, counting)
+            self.assertEquals(1, counting.reads)
+            self.assertEquals(25, footer.num_rows)
+
+    def test_large_footer(self):
+        expected = parquet.ParquetMain().read_footer(self.f)
+        footer_read_size = parquet.main.FOOTER_READ_SIZE
+        parquet.main.FOOTER_READ_SIZE = 100
+        try:
+            with open(self.f, "rb") as fo:
+                counting = CountingFile(fo)
+                main = parquet.ParquetMain(metadata_cache=FooterCache())
+                footer = main.read_footer(self.f, counting)
+                self.assertEquals(2, counting.reads)
+                footer = main.read_footer(self.f, counting, check_header=True)
+                self.assertEquals(5, counting.reads)
+        finally:
+            parquet.main.FOOTER_READ_SIZE = footer_read_size
+        self.assertEquals(expected, footer)
+
+    def test_bad_magic_bytes(self):
+        with open(self.f, "rb") as fo:
+            data = fo.read()
+        for bad in [b"PAR0" + data[4:], data[:-1] + b"0", data[-8:],
+                    data[:-8] + struct.pack("<i", len(data)) + b"PAR1"]:
+            with self.assertRaises(parquet.main.ParquetFormatException):
+                parquet.ParquetMain().read_footer(None, BytesIO(bad))
+
 
 class Options(object):
 
@@ -72,6 +123,1277 @@ class TestReadApi(unittest.TestCase):
     def test_limit(self):
         pass
 
+    def test_plain_values_are_arrays(self):
+        reader = parquet.ParquetReader("test-data/nation.plain.parquet")
+        df = reader.read(columns=["nation_key"])
+        self.assertEquals("int32", df["nation_key"].dtype.name)
+        self.assertEquals(list(range(25)), df["nation_key"].tolist())
+
+
+class TestMultiPage(unittest.TestCase):
+    """Row groups of 3000 and 1000 rows, whose chunks have several pages."""
+
+    f = "test-data/multi-page.parquet"
+
+    def _check(self, df):
+        self.assertEquals(list(range(4000)), df["id"].tolist())
+        self.assertEquals(["n{0}".format(i % 13) for i in range(4000)],
+                          df["name"].tolist())
+        self.assertEquals([None if i % 7 == 0 else i * 0.5
+                           for i in range(4000)],
+                          [None if pd.isna(v) else v for v in df["value"]])
+
+    def test_read(self):
+        reader = parquet.ParquetReader(self.f)
+        self.assertEquals(2, len(reader._footer.row_groups))
+        self._check(reader.read())
+        self._check(parquet.ParquetReader(self.f).read(
+            categorical=["name"], sparse=["value"]).astype(
+                {"name": object, "value": float}))
+
+    def test_rows(self):
+        # batches ending mid-page, at the end of a page and of a row group.
+        for rows in [700, 2999, 3000, 4000]:
+            reader = parquet.ParquetReader(self.f)
+            parts = []
+            while True:
+                df = reader.read(rows=rows)
+                if len(df) == 0:
+                    break
+                parts.append(df)
+            self.assertEquals(-(-4000 // rows), len(parts))
+            self._check(pd.concat(parts))
+
+    def test_natural(self):
+        reader = parquet.ParquetReader(self.f)
+        self.assertEquals([3000, 1000, 0],
+                          [len(reader.read(natural=True)) for _ in range(3)])
+
+
+class TestNulls(unittest.TestCase):
+
+    f = "test-data/nulls.parquet"
+
+    def test_plain(self):
+        df = parquet.ParquetReader(self.f).read(columns=["i32", "str"])
+        self.assertEquals([1, None, 3, None, 5, 6, None, 8, 9, None],
+                          [None if pd.isna(x) else x for x in df["i32"]])
+        self.assertEquals(["a", None, "bb", "ccc", None, None, "a", "dd",
+                           None, "e"],
+                          [None if pd.isna(x) else x for x in df["str"]])
+
+    def test_dictionary(self):
+        df = parquet.ParquetReader(self.f).read(columns=["i64", "cat"])
+        self.assertEquals("Int64", df["i64"].dtype.name)
+        self.assertEquals([None, 20, 20, None, 30, 30, 30, None, 20, 10],
+                          [None if pd.isna(x) else x for x in df["i64"]])
+        self.assertEquals(["x", "y", None, "x", "x", None, "y", "z", "x",
+                           None],
+                          [None if pd.isna(x) else x for x in df["cat"]])
+
+    def test_utf8_converted(self):
+        schema = SchemaElement(name="s", type=Type.BYTE_ARRAY,
+                               converted_type=0)
+        data = pd.Series([u"str", b"caf\xc3\xa9", None], dtype=object)
+        out = parquet.converted_types.convert_column(data, schema)
+        self.assertEquals([u"str", u"caf\u00e9", None], out.tolist())
+
+    def test_expand_nulls(self):
+        validity = np.array([True, False, True])
+        out = parquet.main.expand_nulls(np.array([1.5, 2.5]), validity)
+        self.assertEquals([1.5, None, 2.5], out.tolist())
+        values = np.array([1, 2])
+        self.assertIs(values,
+                      parquet.main.expand_nulls(values, validity[[0, 2]]))
+
+
+class TestBitPackedLevels(unittest.TestCase):
+
+    def test_definition_levels(self):
+        # an optional INT32 column with definition levels 1, 0, 1, 1, 0
+        # stored with the deprecated BIT_PACKED encoding.
+        schema_helper = parquet.schema.SchemaHelper([
+            SchemaElement(name="schema", num_children=1),
+            SchemaElement(name="a", type=Type.INT32,
+                          repetition_type=FieldRepetitionType.OPTIONAL)])
+        cmd = ColumnMetaData(type=Type.INT32, path_in_schema=["a"],
+                             codec=CompressionCodec.UNCOMPRESSED)
+        raw = struct.pack("<B", 0b10110000) + struct.pack("<3i", 7, 8, 9)
+        ph = PageHeader(
+            type=PageType.DATA_PAGE, uncompressed_page_size=len(raw),
+            compressed_page_size=len(raw),
+            data_page_header=DataPageHeader(
+                num_values=5, encoding=Encoding.PLAIN,
+                definition_level_encoding=Encoding.BIT_PACKED,
+                repetition_level_encoding=Encoding.BIT_PACKED))
+        main = parquet.ParquetMain()
+        values = main.read_data_page(BytesIO(raw), schema_helper, ph, cmd, [])
+        self.assertEquals([7, None, 8, 9, None], values.tolist())
+
+
+class TestCategorical(unittest.TestCase):
+
+    def test_row_groups_unified(self):
+        reader = parquet.ParquetReader("test-data/row-groups.parquet")
+        df = reader.read(categorical=True)
+        self.assertEquals("int32", df["id"].dtype.name)
+        cat = df["cat"].cat
+        self.assertEquals(["a", "b", "c"], list(cat.categories))
+        self.assertEquals([0, 1, 0, -1, 2, 0, 2, 1], cat.codes.tolist())
+
+    def test_directory_unified(self):
+        reader = parquet.ParquetReader("test-data/dataset")
+        df = reader.read(categorical=["cat"])
+        self.assertEquals(["x", "y", "z"],
+                          list(df["cat"].cat.categories))
+        self.assertEquals(["x", "y", "x", "z", "x"], df["cat"].tolist())
+
+    def test_opt_in(self):
+        reader = parquet.ParquetReader("test-data/nulls.parquet")
+        df = reader.read(columns=["i64", "cat"], categorical=["cat"])
+        self.assertEquals("category", df["cat"].dtype.name)
+        self.assertEquals("Int64", df["i64"].dtype.name)
+
+    def test_nan_in_dictionary(self):
+        # NaN can't be a category, so it reads as null.
+        df = parquet.ParquetReader("test-data/nan-dict.parquet").read(
+            categorical=True)
+        self.assertEquals([1.5, 2.0], list(df["d"].cat.categories))
+        self.assertEquals([0, -1, -1, 0, 1, -1], df["d"].cat.codes.tolist())
+        self.assertEquals([0.5, -1.0], list(df["f"].cat.categories))
+        self.assertEquals([-1, 0, 0, -1, -1, 1], df["f"].cat.codes.tolist())
+
+    def test_all_null_row_group(self):
+        # the last row group has a single null, and an empty dictionary.
+        reader = parquet.ParquetReader("test-data/null-row-group.parquet")
+        self.assertEquals(4, len(reader._footer.row_groups))
+        df = reader.read(categorical=True)
+        self.assertEquals("category", df["s"].dtype.name)
+        self.assertEquals(["v%d" % i for i in range(7)],
+                          list(df["s"].cat.categories))
+        self.assertEquals(["v%d" % (i % 7) for i in range(999)] + [None],
+                          [None if pd.isnull(v) else v for v in df["s"]])
+
+
+class TestDeltaEncoding(unittest.TestCase):
+
+    f = "test-data/delta.parquet"
+
+    def _expected(self):
+        i = np.arange(300, dtype=np.int64)
+        ts = 1600000000000000 + i * i * 1000
+        ts[::97] = -ts[::97]
+        ids = ((i * 2654435761) % 2 ** 32 - 2 ** 31).astype(np.int32)
+        return ts, ids
+
+    def test_binary_packed(self):
+        ts, ids = self._expected()
+        df = parquet.ParquetReader(self.f).read(columns=["ts", "ids"])
+        self.assertEquals("int32", df["ids"].dtype.name)
+        self.assertEquals(ts.tolist(), df["ts"].tolist())
+        self.assertEquals(ids.tolist(), df["ids"].tolist())
+
+    def test_binary_packed_nulls(self):
+        ts, _ = self._expected()
+        df = parquet.ParquetReader(self.f).read(columns=["ts_opt"])
+        expected = [None if i % 7 == 0 else v for i, v in enumerate(ts)]
+        self.assertEquals(expected, [None if pd.isna(x) else x
+                                     for x in df["ts_opt"]])
+
+
+class TestDeltaStrings(unittest.TestCase):
+
+    f = "test-data/delta-strings.parquet"
+
+    def _expected(self):
+        urls = sorted("http://example.com/%s/%d" % (p, i)
+                      for p in ["a", "ab", "abc", "b"] for i in range(40))
+        urls[5] = u"http://example.com/caf\u00e9"
+        return urls
+
+    def test_length_byte_array(self):
+        df = parquet.ParquetReader(self.f).read(columns=["lengths"])
+        self.assertEquals(self._expected(), df["lengths"].tolist())
+
+    def test_front_coded(self):
+        df = parquet.ParquetReader(self.f).read(columns=["front",
+                                                         "front_opt"])
+        urls = self._expected()
+        self.assertEquals(urls, df["front"].tolist())
+        self.assertEquals([None if i % 5 == 0 else u
+                           for i, u in enumerate(urls)],
+                          [None if pd.isna(x) else x
+                           for x in df["front_opt"]])
+
+    def test_front_coded_fixed(self):
+        df = parquet.ParquetReader(self.f).read(columns=["fixed"])
+        self.assertEquals([("%04d" % i).encode() for i in range(160)],
+                          df["fixed"].tolist())
+
+
+class TestDataPageV2(unittest.TestCase):
+
+    f = "test-data/v2.parquet"
+
+    def test_read(self):
+        df = parquet.ParquetReader(self.f).read()
+        self.assertEquals(list(range(500)), df["id"].tolist())
+        self.assertEquals([None if i % 7 == 0 else i * 3 for i in range(500)],
+                          [None if pd.isna(x) else x for x in df["opt"]])
+        self.assertEquals([None if i % 5 == 0 else "v%d" % (i % 13)
+                           for i in range(500)],
+                          [None if pd.isna(x) else x for x in df["cat"]])
+
+    def test_categorical(self):
+        df = parquet.ParquetReader(self.f).read(columns=["cat"],
+                                                categorical=True)
+        self.assertEquals("category", df["cat"].dtype.name)
+        self.assertEquals(13, len(df["cat"].cat.categories))
+
+    def _page(self):
+        # an optional INT32 column with values 7, None, 8 whose values are
+        # stored uncompressed although the column chunk codec is GZIP.
+        schema_helper = parquet.schema.SchemaHelper([
+            SchemaElement(name="schema", num_children=1),
+            SchemaElement(name="a", type=Type.INT32,
+                          repetition_type=FieldRepetitionType.OPTIONAL)])
+        cmd = ColumnMetaData(type=Type.INT32, path_in_schema=["a"],
+                             codec=CompressionCodec.GZIP)
+        levels = struct.pack("<BB", 0b11, 0b101)  # bit-packed run of 1, 0, 1
+        raw = levels + struct.pack("<2i", 7, 8)
+        ph = PageHeader(
+            type=PageType.DATA_PAGE_V2, uncompressed_page_size=len(raw),
+            compressed_page_size=len(raw),
+            data_page_header_v2=DataPageHeaderV2(
+                num_values=3, num_nulls=1, num_rows=3,
+                encoding=Encoding.PLAIN, definition_levels_byte_length=2,
+                repetition_levels_byte_length=0, is_compressed=False))
+        return schema_helper, cmd, ph, raw
+
+    def test_uncompressed_values(self):
+        schema_helper, cmd, ph, raw = self._page()
+        main = parquet.ParquetMain()
+        values = main.read_data_page(BytesIO(raw), schema_helper, ph, cmd, [])
+        self.assertEquals([7, None, 8], values.tolist())
+
+    def test_page_levels(self):
+        schema_helper, cmd, ph, raw = self._page()
+        fo = BytesIO(raw + b"next")
+        repetition_levels, definition_levels = \
+            parquet.ParquetMain().read_page_levels(fo, schema_helper, ph, cmd)
+        self.assertIsNone(repetition_levels)
+        self.assertEquals([1, 0, 1], definition_levels.tolist())
+        self.assertEquals(b"next", fo.read())
+
+
+class TestBooleans(unittest.TestCase):
+
+    def _check(self, f):
+        df = parquet.ParquetReader(f).read()
+        self.assertEquals("bool", df["flag"].dtype.name)
+        self.assertEquals([i % 3 == 0 for i in range(1000)],
+                          df["flag"].tolist())
+        self.assertEquals("boolean", df["opt"].dtype.name)
+        self.assertEquals([None if i % 5 == 0 else i % 2 == 1
+                           for i in range(1000)],
+                          [None if pd.isna(x) else x for x in df["opt"]])
+
+    def test_plain(self):
+        self._check("test-data/booleans.parquet")
+
+    def test_rle(self):
+        self._check("test-data/booleans-rle.parquet")
+
+
+class TestInt96(unittest.TestCase):
+
+    expected = ["1970-01-01T00:00:00", "2015-06-30T23:59:59.123456789",
+                "1900-02-28T12:00:00", "2262-04-11T23:47:16.854775807",
+                "2020-02-29T00:00:00.000000001"]
+
+    def _check(self, df):
+        expected = np.array(self.expected, dtype="datetime64[ns]")
+        self.assertEquals("datetime64[ns]", df["ts"].dtype.name)
+        self.assertEquals(expected.tolist(), df["ts"].values.tolist())
+        expected[[1, 3]] = np.datetime64("NaT")
+        self.assertEquals([str(v) for v in expected],
+                          [str(v) for v in df["opt"].values])
+
+    def test_spark_hint(self):
+        self._check(parquet.ParquetReader("test-data/int96.parquet").read())
+
+    def _raw(self):
+        # the nanoseconds of the day and the julian day of every timestamp.
+        nanos = np.array(self.expected, dtype="datetime64[ns]").astype(
+            np.int64).tolist()
+        day = 86400 * 10 ** 9
+        return [struct.pack("<qi", n % day, n // day + 2440588)
+                for n in nanos]
+
+    def test_no_hint(self):
+        reader = parquet.ParquetReader("test-data/int96-plain.parquet")
+        df = reader.read()
+        raw = self._raw()
+        self.assertEquals(raw, df["ts"].tolist())
+        self.assertEquals([raw[0], None, raw[2], None, raw[4]],
+                          df["opt"].tolist())
+        self.assertTrue(all(len(v) == 12 for v in df["ts"]))
+
+    def test_no_hint_categorical(self):
+        reader = parquet.ParquetReader("test-data/int96-plain.parquet")
+        df = reader.read(columns=["ts"], categorical=True)
+        self.assertEquals(self._raw(), df["ts"].tolist())
+
+    def test_dump(self):
+        out = StringIO()
+        parquet.ParquetMain().dump("test-data/int96.parquet", Options(),
+                                   out=out)
+        rows = [line.split("\t") for line in out.getvalue().splitlines()]
+        self.assertEquals(self.expected[1], rows[1][0])
+        self.assertEquals("None", rows[1][1])
+        self.assertEquals("1970-01-01T00:00:00.000000000", rows[0][0])
+
+    def test_dump_no_hint(self):
+        out = StringIO()
+        parquet.ParquetMain().dump("test-data/int96-plain.parquet",
+                                   Options(), out=out)
+        rows = [line.split("\t") for line in out.getvalue().splitlines()]
+        expected = [struct.unpack("<qi", raw) for raw in self._raw()]
+        self.assertEquals([str(nanos << 32 | days) for nanos, days in expected],
+                          [row[0] for row in rows])
+        self.assertEquals("None", rows[1][1])
+
+    def test_forced(self):
+        reader = parquet.ParquetReader("test-data/int96-plain.parquet")
+        self._check(reader.read(int96_timestamps=True))
+
+    def test_map_spark_timestamp(self):
+        value = struct.pack("<qi", 3600 * 10 ** 9 + 5000, 2440589)
+        self.assertEquals(
+            datetime.datetime(1970, 1, 2, 1, 0, 0, 5),
+            parquet.converted_types.map_spark_timestamp(value))
+
+
+class TestFixedBytes(unittest.TestCase):
+
+    f = "test-data/fixed-bytes.parquet"
+    plain = [b"ab\0\0", b"\0\1\2\0", None, b"wxyz", b"\0\0\0\0"]
+    dictionary = [b"ab\0\0", b"ab\0\0", b"\0\1\2\0", b"wxyz",
+                  b"\0\0\0\0"]
+
+    def test_trailing_zeros(self):
+        df = parquet.ParquetReader(self.f).read()
+        self.assertEquals(self.plain, df["plain"].tolist())
+        self.assertEquals(self.dictionary, df["dict"].tolist())
+
+    def test_categorical(self):
+        df = parquet.ParquetReader(self.f).read(categorical=True)
+        self.assertEquals("category", df["dict"].dtype.name)
+        self.assertEquals(self.dictionary, df["dict"].tolist())
+
+    def test_sparse(self):
+        df = parquet.ParquetReader(self.f).read(sparse=True)
+        self.assertEquals(self.plain, [None if v is np.nan else v
+                                       for v in df["plain"].tolist()])
+
+    def test_arrays(self):
+        arrays = parquet.ParquetReader(self.f).read_arrays()
+        self.assertEquals("S4", arrays["dict"].dtype.str[1:])
+        self.assertEquals(b"\0\1\2\0", arrays["dict"][2:3].tobytes())
+
+    def test_dump(self):
+        out = StringIO()
+        parquet.ParquetMain().dump(self.f, Options(format='json'), out=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEquals([u"ab\0\0", u"\0\1\2\0", u"None", u"wxyz",
+                           u"\0\0\0\0"], [row["plain"] for row in rows])
+
+
+class TestDecimal(unittest.TestCase):
+
+    f = "test-data/decimals.parquet"
+
+    def _unscaled(self):
+        d18 = [None if i % 9 == 0 else i * 123456789 - 3000000000
+               for i in range(50)]
+        d38 = [(-1) ** i * (10 ** 30 + i) for i in range(50)]
+        d9 = [i * (-1) ** i for i in range(50)]
+        return d18, d38, d9
+
+    def test_float(self):
+        d18, _, d9 = self._unscaled()
+        df = parquet.ParquetReader(self.f).read(columns=["d18", "d9"])
+        self.assertEquals("Float64", df["d18"].dtype.name)
+        self.assertEquals([None if v is None else v / 1e4 for v in d18],
+                          [None if pd.isna(x) else x for x in df["d18"]])
+        self.assertEquals([v / 1e2 for v in d9], df["d9"].tolist())
+
+    def test_int(self):
+        d18, _, d9 = self._unscaled()
+        df = parquet.ParquetReader(self.f).read(columns=["d18", "d9"],
+                                                decimals="int")
+        self.assertEquals({"d18": 4, "d9": 2}, df.attrs["decimal_scales"])
+        self.assertEquals(d18, [None if pd.isna(x) else x for x in df["d18"]])
+        self.assertEquals(d9, df["d9"].tolist())
+
+    def test_decimal(self):
+        d18, d38, _ = self._unscaled()
+        df = parquet.ParquetReader(self.f).read(columns=["d18", "d38"],
+                                                decimals="decimal")
+        self.assertEquals([None if v is None else decimal.Decimal("%de-4" % v)
+                           for v in d18], df["d18"].tolist())
+        self.assertEquals([decimal.Decimal("%de-6" % v) for v in d38],
+                          df["d38"].tolist())
+
+    def test_categorical(self):
+        df = parquet.ParquetReader(self.f).read(columns=["cat"],
+                                                categorical=True)
+        self.assertEquals([1.5, -2.25, 1000.0],
+                          list(df["cat"].cat.categories))
+        self.assertEquals([1.5, -2.25, 1000.0, 1.5], df["cat"][:4].tolist())
+
+    def test_categorical_close_values(self):
+        # DECIMAL(18, 4) values a float can't tell apart merge categories.
+        f = "test-data/close-decimals.parquet"
+        df = parquet.ParquetReader(f).read(categorical=True)
+        self.assertEquals([12345678901234.5678, 1.5],
+                          list(df["d"].cat.categories))
+        self.assertEquals([0, 0, -1, 0, 1], df["d"].cat.codes.tolist())
+        df = parquet.ParquetReader(f).read(categorical=True, decimals="int")
+        self.assertEquals([123456789012345678, 123456789012345679, 15000],
+                          list(df["d"].cat.categories))
+
+    def test_byte_widths(self):
+        values = [1, -1, 255, -256, 2 ** 40, -(2 ** 63)]
+        fixed = np.array([v.to_bytes(8, "big", signed=True) for v in values],
+                         dtype="S8")
+        out = parquet.converted_types.decimal_column(fixed, 0, "int")
+        self.assertEquals(values, out.tolist())
+        variable = np.empty(len(values), dtype=object)
+        variable[:] = [v.to_bytes((v.bit_length() + 8) // 8, "big",
+                                  signed=True) for v in values]
+        out = parquet.converted_types.decimal_column(variable, 0, "int")
+        self.assertEquals(values, out.tolist())
+
+
+class TestConvertedTypes(unittest.TestCase):
+
+    f = "test-data/converted.parquet"
+
+    def test_narrowed_ints(self):
+        df = parquet.ParquetReader(self.f).read(
+            columns=["i8", "i16", "u8", "u16", "u32", "u64"])
+        self.assertEquals(["int8", "Int16", "uint8", "uint16", "uint32",
+                           "UInt64"], [str(t) for t in df.dtypes])
+        self.assertEquals([(-1) ** i * i * 6 for i in range(20)],
+                          df["i8"].tolist())
+        self.assertEquals([2 ** 32 - 1 - i for i in range(20)],
+                          df["u32"].tolist())
+        self.assertEquals([None if i % 4 == 1 else 2 ** 64 - 1 - i
+                           for i in range(20)],
+                          [None if pd.isna(x) else x for x in df["u64"]])
+
+    def test_dictionary_narrowed(self):
+        df = parquet.ParquetReader(self.f).read(columns=["u16"],
+                                                categorical=True)
+        self.assertEquals("uint16", df["u16"].cat.categories.dtype.name)
+        self.assertEquals([i * 3000 for i in range(20)], df["u16"].tolist())
+
+    def test_times(self):
+        df = parquet.ParquetReader(self.f).read(columns=["date", "tsms",
+                                                         "tsus"])
+        self.assertEquals("datetime64[ns]", df["date"].dtype.name)
+        self.assertEquals(pd.Timestamp("2020-03-21"), df["date"][2])
+        self.assertTrue(pd.isna(df["date"][1]))
+        self.assertEquals(pd.Timestamp("2021-03-04 05:06:07.003"),
+                          df["tsms"][3])
+        self.assertEquals(pd.Timestamp("2021-03-04 05:06:07.000021"),
+                          df["tsus"][3])
+        self.assertTrue(pd.isna(df["tsus"][1]))
+
+    def test_time_of_day(self):
+        df = parquet.ParquetReader(self.f).read(columns=["tms", "tus"])
+        self.assertEquals("timedelta64[ns]", df["tms"].dtype.name)
+        self.assertEquals("timedelta64[ns]", df["tus"].dtype.name)
+        self.assertEquals(pd.Timedelta("03:03:03.003"), df["tms"][3])
+        self.assertEquals(pd.Timedelta("03:03:03.003003"), df["tus"][3])
+
+    def test_enum(self):
+        schema = parquet.ParquetReader(self.f)._schema_helper
+        self.assertEquals(ConvertedType.ENUM,
+                          schema.schema_element(["enum"]).converted_type)
+        df = parquet.ParquetReader(self.f).read(columns=["enum"])
+        self.assertEquals(["a", "b"] * 10, df["enum"].tolist())
+
+    def test_convert_array(self):
+        convert = parquet.converted_types.convert_array
+        schema = SchemaElement(name="t", type=Type.INT64,
+                               converted_type=ConvertedType.TIME_MICROS)
+        out = convert(np.array([1500000, 7], dtype=np.int64), schema)
+        self.assertEquals("timedelta64[ns]", out.dtype.name)
+        self.assertEquals([1500000000, 7000], out.astype(np.int64).tolist())
+        schema = SchemaElement(name="t", type=Type.INT32,
+                               converted_type=ConvertedType.TIME_MILLIS)
+        values = np.ma.masked_array([5, 0], mask=[False, True])
+        out = convert(values, schema)
+        self.assertEquals(np.timedelta64(5, "ms"), out[0])
+        self.assertTrue(np.isnat(out[1]))
+        schema = SchemaElement(name="i", type=Type.FIXED_LEN_BYTE_ARRAY,
+                               type_length=12,
+                               converted_type=ConvertedType.INTERVAL)
+        out = convert(np.array([struct.pack("<3I", 1, 2, 3000)],
+                               dtype="S12"), schema)
+        self.assertEquals(pd.DateOffset(months=1, days=2, milliseconds=3000),
+                          out[0])
+
+    def test_convert_column(self):
+        schema = SchemaElement(name="u", type=Type.INT32,
+                               converted_type=ConvertedType.UINT_8)
+        out = parquet.converted_types.convert_column(
+            pd.Series([200, None], dtype="Int32"), schema)
+        self.assertEquals("UInt8", out.dtype.name)
+        self.assertEquals(200, out[0])
+
+
+class TestSparse(unittest.TestCase):
+
+    def test_sparse(self):
+        df = parquet.ParquetReader("test-data/nulls.parquet").read(
+            columns=["i32", "str", "cat"], sparse=True)
+        self.assertEquals("Sparse[float64, nan]", str(df["i32"].dtype))
+        self.assertEquals(0.6, df["i32"].sparse.density)
+        self.assertEquals([1, 3, 5, 6, 8, 9],
+                          df["i32"].array.sp_values.tolist())
+        self.assertEquals([0, 2, 4, 5, 7, 8],
+                          df["i32"].array.sp_index.indices.tolist())
+        self.assertEquals(["a", None, "bb", "ccc", None, None, "a", "dd",
+                           None, "e"],
+                          [None if pd.isna(x) else x for x in df["str"]])
+        self.assertEquals(["x", "y", None, "x"],
+                          [None if pd.isna(x) else x for x in df["cat"][:4]])
+
+    def test_opt_in(self):
+        df = parquet.ParquetReader("test-data/nulls.parquet").read(
+            columns=["i32", "f64"], sparse=["f64"])
+        self.assertEquals("Int32", str(df["i32"].dtype))
+        self.assertEquals("Sparse[float64, nan]", str(df["f64"].dtype))
+
+    def test_rows_and_conversion(self):
+        reader = parquet.ParquetReader("test-data/converted.parquet")
+        first = reader.read(columns=["date", "i16"], rows=7, sparse=True)
+        rest = reader.read(columns=["date", "i16"], rows=13, sparse=True)
+        dense = parquet.ParquetReader("test-data/converted.parquet").read(
+            columns=["date", "i16"])
+        for name in ["date", "i16"]:
+            values = first[name].sparse.to_dense().tolist() + \
+                rest[name].sparse.to_dense().tolist()
+            self.assertEquals([None if pd.isna(x) else x
+                               for x in dense[name]],
+                              [None if pd.isna(x) else x for x in values])
+        self.assertEquals("float64", first["i16"].dtype.subtype.name)
+        self.assertEquals("datetime64[ns]", first["date"].dtype.subtype.name)
+
+    def test_int64_exact(self):
+        values = np.array([2 ** 60 + 1, -2 ** 62 - 1], dtype=np.int64)
+        out = parquet.reader._sparse_array(values, np.array([1, 3]), 4)
+        self.assertEquals("Sparse[object, nan]", str(out.dtype))
+        self.assertEquals([2 ** 60 + 1, -2 ** 62 - 1], out.sp_values.tolist())
+        df = parquet.ParquetReader("test-data/nulls.parquet").read(
+            columns=["i64"], sparse=True)
+        dense = parquet.ParquetReader("test-data/nulls.parquet").read(
+            columns=["i64"])
+        self.assertEquals([None if pd.isna(x) else x for x in dense["i64"]],
+                          [None if pd.isna(x) else x for x in df["i64"]])
+
+    def test_decimals(self):
+        for decimals in ["float", "int", "decimal"]:
+            reader = parquet.ParquetReader("test-data/decimals.parquet")
+            columns = [c for c in reader._cols if c != "d38"]
+            df = reader.read(columns=columns, sparse=True, decimals=decimals)
+            dense = parquet.ParquetReader("test-data/decimals.parquet").read(
+                columns=columns, decimals=decimals)
+            for name in columns:
+                self.assertEquals(
+                    [None if pd.isna(x) else x for x in dense[name]],
+                    [None if pd.isna(x) else x for x in df[name]])
+
+    def test_without_int_index(self):
+        int_index = parquet.reader.IntIndex
+        parquet.reader.IntIndex = None
+        try:
+            out = parquet.reader._sparse_array(
+                np.array([1.5, 2.5]), np.array([0, 2]), 3)
+        finally:
+            parquet.reader.IntIndex = int_index
+        self.assertEquals([0, 2], out.sp_index.indices.tolist())
+        self.assertEquals([1.5, 2.5], out.sp_values.tolist())
+
+
+class TestMemoryMap(unittest.TestCase):
+
+    def test_read(self):
+        for name in ["nation.impala.parquet", "nulls.parquet", "v2.parquet",
+                     "nested.parquet", "gzip-nation.impala.parquet"]:
+            filename = os.path.join("test-data", name)
+            expected = parquet.ParquetReader(filename).read()
+            reader = parquet.ParquetReader(filename, memory_map=True)
+            pd.testing.assert_frame_equal(expected, reader.read())
+
+    def test_no_copy(self):
+        pool = parquet.filesystem.FilePool()
+        reader = parquet.ParquetReader("test-data/nation.plain.parquet",
+                                       memory_map=True, file_pool=pool)
+        keys = reader.read_arrays(columns=["nation_key"])["nation_key"]
+        self.assertFalse(keys.flags.owndata)
+        self.assertIsInstance(keys.base.obj, mmap.mmap)
+        pool.clear()
+        # the mapping outlives the reader while arrays point into it.
+        self.assertEquals([0, 1, 2], keys[:3].tolist())
+
+    def test_dump(self):
+        expected = StringIO()
+        parquet.ParquetMain().dump("test-data/nulls.parquet", Options(),
+                                   out=expected)
+        actual = StringIO()
+        parquet.ParquetMain(memory_map=True).dump(
+            "test-data/nulls.parquet", Options(), out=actual)
+        self.assertEquals(expected.getvalue(), actual.getvalue())
+
+
+class CountingFile(object):
+    """Wraps a file object, counting its reads."""
+
+    def __init__(self, fo):
+        self.fo = fo
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return self.fo.read(size)
+
+    def seek(self, offset, whence=0):
+        return self.fo.seek(offset, whence)
+
+    def tell(self):
+        return self.fo.tell()
+
+    def close(self):
+        self.fo.close()
+
+
+class TestColumnChunks(unittest.TestCase):
+
+    def test_single_read(self):
+        with open("test-data/row-groups.parquet", "rb") as fo:
+            counting = CountingFile(fo)
+            reader = parquet.ParquetReader(counting)
+            reads = counting.reads
+            df = reader.read()
+            # the adjacent column chunks of a row group take one read.
+            self.assertEquals(len(reader._footer.row_groups),
+                              counting.reads - reads)
+            self.assertEquals(8, len(df))
+
+    def test_projection(self):
+        # the (padded) nation_key and region_key chunks are 202 bytes apart.
+        for gap, expected_reads in [(8192, 1), (202, 1), (201, 2)]:
+            with open("test-data/nation.plain.parquet", "rb") as fo:
+                counting = CountingFile(fo)
+                reader = parquet.ParquetReader(
+                    counting,
+                    filesystem=parquet.filesystem.LocalFileSystem(
+                        coalesce_gap=gap))
+                reads = counting.reads
+                df = reader.read(columns=["nation_key", "region_key"])
+                self.assertEquals(expected_reads, counting.reads - reads)
+                self.assertEquals(list(range(25)), df["nation_key"].tolist())
+
+    def test_single_read_per_chunk(self):
+        with open("test-data/row-groups.parquet", "rb") as fo:
+            counting = CountingFile(fo)
+            reader = parquet.ParquetReader(
+                counting,
+                filesystem=parquet.filesystem.LocalFileSystem(
+                    coalesce_gap=-1))
+            reads = counting.reads
+            reader.read()
+            chunks = sum(len(rg.columns) for rg in reader._footer.row_groups)
+            self.assertEquals(chunks, counting.reads - reads)
+
+    def test_truncated(self):
+        main = parquet.ParquetMain()
+        footer = main.read_footer("test-data/nation.plain.parquet")
+        cmd = footer.row_groups[0].columns[0].meta_data
+        with open("test-data/nation.plain.parquet", "rb") as fo:
+            data = fo.read(cmd.data_page_offset + 10)
+        with self.assertRaises(parquet.main.ParquetFormatException):
+            main.read_column_chunk(BytesIO(data), cmd)
+
+    def test_padding(self):
+        footer = parquet.ParquetMain().read_footer(
+            "test-data/nation.dict.parquet")
+        self.assertEquals(100, parquet.main.column_chunk_padding(footer))
+        # the cached footer is shared.
+        footer = FileMetaData()
+        footer.created_by = "parquet-mr version 1.8.1 (build 4aba4da)"
+        self.assertEquals(0, parquet.main.column_chunk_padding(footer))
+        footer.created_by = "parquet-cpp-arrow version 15.0.0"
+        self.assertEquals(0, parquet.main.column_chunk_padding(footer))
+
+
+class TestCompact(unittest.TestCase):
+
+    def _thriftpy(self, cls, data, pos=0):
+        fo = BytesIO(data)
+        fo.seek(pos)
+        obj = cls()
+        obj.read(TCompactProtocol(TFileObjectTransport(fo)))
+        return obj, fo.tell()
+
+    def test_footers(self):
+        for name in os.listdir("test-data"):
+            if not name.endswith(".parquet"):
+                continue
+            with open(os.path.join("test-data", name), "rb") as fo:
+                data = fo.read()
+            size = struct.unpack("<i", data[-8:-4])[0]
+            footer = data[-8 - size:-8]
+            self.assertEquals(self._thriftpy(FileMetaData, footer),
+                              compact.read_struct(FileMetaData, footer))
+
+    def test_page_header(self):
+        ph = PageHeader(
+            type=PageType.DATA_PAGE_V2, uncompressed_page_size=300,
+            compressed_page_size=-20, crc=1 << 30,
+            data_page_header_v2=DataPageHeaderV2(
+                num_values=3, num_nulls=1, num_rows=3,
+                encoding=Encoding.PLAIN, definition_levels_byte_length=2,
+                repetition_levels_byte_length=0, is_compressed=False))
+        data = (b"xx" +
+                b"\x15\x06\x15\xd8\x04\x15\x27\x15\x80\x80\x80\x80\x08" +
+                b"\x4c\x15\x06\x15\x02\x15\x06\x15\x00\x15\x04\x15\x00" +
+                b"\x12\x00\x00")
+        self.assertEquals((ph, len(data)), self._thriftpy(PageHeader, data, 2))
+        self.assertEquals((ph, len(data)),
+                          compact.read_struct(PageHeader, data, 2))
+        self.assertEquals((ph, len(data)),
+                          compact.read_struct(PageHeader, memoryview(data), 2))
+
+    def test_unknown_fields(self):
+        # a SchemaElement named "a" with an unknown I32 field 10 = 7 and an
+        # unknown struct field 11, both long field ids.
+        data = b"\x48\x01a\x05\x14\x0e\x0c\x16\x15\x02\x00\x00"
+        expected = self._thriftpy(SchemaElement, data)
+        actual = compact.read_struct(SchemaElement, data)
+        self.assertEquals(expected, actual)
+        self.assertEquals([7, None], actual[0].extra)
+        # other structs skip them.
+        data = b"\x05\x14\x0e\x15\x04\x00"
+        self.assertEquals(self._thriftpy(DataPageHeader, data),
+                          compact.read_struct(DataPageHeader, data))
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            compact.read_struct(PageHeader, b"\x15\x02\x15")
+        with self.assertRaises(ValueError):
+            compact.read_struct(SchemaElement, b"\x48\x05ab")
+
+    def test_lazy(self):
+        # a FileMetaData with two row groups, the first with unknown fields of
+        # every type, and num_rows after them.
+        data = (b"\x15\x02\x39\x2c" +
+                b"\x36\x0a\x01\x28\x17" + struct.pack("<d", 1.5) +
+                b"\x1b\x01\x85\x01k\x06\x19\x21\x01\x02\x13\x7f" +
+                b"\x1a\x15\x04\x1c\x18\x02ab\x00\x00" +
+                b"\x36\x04\x00\x06\x06\x0e\x00")
+        expected, end = self._thriftpy(FileMetaData, data)
+        self.assertEquals((expected, end), compact.read_struct(FileMetaData,
+                                                               data))
+        footer, lazy_end = compact.read_struct_lazy(FileMetaData, data,
+                                                    lazy=["row_groups"])
+        self.assertEquals(end, lazy_end)
+        self.assertEquals(7, footer.num_rows)
+        self.assertEquals(4, footer.row_groups[0])
+        self.assertEquals(expected.row_groups,
+                          [compact.read_struct(RowGroup, data, pos)[0]
+                           for pos in footer.row_groups])
+        with self.assertRaises(ValueError):
+            compact.read_struct_lazy(FileMetaData, data[:20],
+                                     lazy=["row_groups"])
+
+    def test_lazy_footers(self):
+        for name in os.listdir("test-data"):
+            if not name.endswith(".parquet"):
+                continue
+            with open(os.path.join("test-data", name), "rb") as fo:
+                data = fo.read()
+            size = struct.unpack("<i", data[-8:-4])[0]
+            footer = data[-8 - size:-8]
+            expected = compact.read_struct(FileMetaData, footer)[0]
+            lazy = parquet.ParquetMain()._parse_footer(footer)
+            self.assertIsInstance(lazy.row_groups, LazyRowGroups)
+            self.assertEquals(0, lazy.row_groups.decoded())
+            self.assertEquals(expected, lazy)
+
+
+class RecordingFileSystem(parquet.filesystem.MemoryFileSystem):
+    """Records the ranges of every read_ranges call."""
+
+    def __init__(self, files):
+        super(RecordingFileSystem, self).__init__(files)
+        self.calls = []
+
+    def read_ranges(self, fileobj, ranges):
+        self.calls.append(list(ranges))
+        return super(RecordingFileSystem, self).read_ranges(fileobj, ranges)
+
+
+class TestFileSystem(unittest.TestCase):
+
+    def _files(self, directory):
+        files = {}
+        for name in os.listdir(directory):
+            with open(os.path.join(directory, name), "rb") as fo:
+                files["data/" + name] = fo.read()
+        return files
+
+    def test_memory_dataset(self):
+        fs = parquet.filesystem.MemoryFileSystem(
+            self._files("test-data/dataset"))
+        self.assertTrue(fs.is_directory("data"))
+        self.assertFalse(fs.is_directory("data/_metadata"))
+        expected = parquet.ParquetReader("test-data/dataset").read()
+        actual = parquet.ParquetReader("data", filesystem=fs).read()
+        pd.testing.assert_frame_equal(expected, actual)
+
+    def test_ranges_per_row_group(self):
+        with open("test-data/row-groups.parquet", "rb") as fo:
+            fs = RecordingFileSystem({"f.parquet": fo.read()})
+        reader = parquet.ParquetReader("f.parquet", filesystem=fs)
+        reader.read()
+        row_groups = reader._footer.row_groups
+        self.assertEquals(len(row_groups), len(fs.calls))
+        for rg, ranges in zip(row_groups, fs.calls):
+            self.assertEquals([(min(c.meta_data.data_page_offset,
+                                    c.meta_data.dictionary_page_offset or
+                                    c.meta_data.data_page_offset),
+                                c.meta_data.total_compressed_size)
+                               for c in rg.columns], ranges)
+
+    def test_local_ranges(self):
+        fs = parquet.filesystem.LocalFileSystem()
+        size = os.path.getsize("test-data/nulls.parquet")
+        with fs.open("test-data/nulls.parquet") as fo:
+            head, tail = fs.read_ranges(fo, [(0, 4), (size - 4, 100)])
+        self.assertEquals(b"PAR1", bytes(head))
+        self.assertEquals(b"PAR1", bytes(tail))
+
+    def test_coalesce_ranges(self):
+        coalesce_ranges = parquet.filesystem.coalesce_ranges
+        self.assertEquals(([], []), coalesce_ranges([], 10))
+        # adjacent, overlapping and close ranges are merged, in file order.
+        ranges = [(100, 10), (0, 10), (10, 5), (12, 20), (40, 5)]
+        self.assertEquals(
+            ([(0, 45), (100, 10)],
+             [(1, 0), (0, 0), (0, 10), (0, 12), (0, 40)]),
+            coalesce_ranges(ranges, 8))
+        self.assertEquals(
+            ([(0, 32), (40, 5), (100, 10)],
+             [(2, 0), (0, 0), (0, 10), (0, 12), (1, 0)]),
+            coalesce_ranges(ranges, 0))
+        self.assertEquals(([(0, 110)], [(0, 100), (0, 0)]),
+                          coalesce_ranges([(100, 10), (0, 10)], 90))
+
+    def test_coalesced_reads(self):
+        fs = parquet.filesystem.MemoryFileSystem(
+            {"f": bytes(bytearray(range(100)))}, coalesce_gap=4)
+        reads = []
+        read_range = fs.read_range
+
+        def recording_read_range(fileobj, offset, length):
+            reads.append((offset, length))
+            return read_range(fileobj, offset, length)
+        fs.read_range = recording_read_range
+        fo = fs.open("f")
+        data = fs.read_ranges(fo, [(10, 2), (14, 2), (50, 3), (98, 10)])
+        self.assertEquals([(10, 6), (50, 3), (98, 10)], reads)
+        self.assertEquals([[10, 11], [14, 15], [50, 51, 52], [98, 99]],
+                          [list(bytearray(d)) for d in data])
+
+    def test_missing_file(self):
+        fs = parquet.filesystem.MemoryFileSystem()
+        with self.assertRaises(IOError):
+            fs.open("nope.parquet")
+
+
+class TestFilePool(unittest.TestCase):
+
+    def setUp(self):
+        self.opened = []
+
+    def opener(self, name):
+        def open_file():
+            fileobj = BytesIO(name.encode())
+            self.opened.append(fileobj)
+            return fileobj
+        return open_file
+
+    def test_hits_and_misses(self):
+        pool = parquet.filesystem.FilePool()
+        with pool.open("a", self.opener("a")) as fo:
+            self.assertEquals(b"a", fo.read())
+        with pool.open("a", self.opener("a")) as fo:
+            self.assertIs(self.opened[0], fo)
+        self.assertEquals((1, 1, 0), (pool.hits, pool.misses, pool.evictions))
+        self.assertEquals(1, len(pool))
+
+    def test_concurrent_checkouts(self):
+        pool = parquet.filesystem.FilePool()
+        with pool.open("a", self.opener("a")) as first:
+            with pool.open("a", self.opener("a")) as second:
+                self.assertIsNot(first, second)
+        self.assertEquals(2, len(pool))
+        self.assertEquals(2, pool.misses)
+
+    def test_lru_eviction(self):
+        pool = parquet.filesystem.FilePool(max_open=2)
+        for name in ["a", "b", "a", "c"]:
+            with pool.open(name, self.opener(name)):
+                pass
+        # b was the least recently used when c was opened.
+        a, b, c = self.opened
+        self.assertEquals([False, True, False],
+                          [a.closed, b.closed, c.closed])
+        self.assertEquals((1, 3, 1), (pool.hits, pool.misses, pool.evictions))
+        # and is reopened on demand.
+        with pool.open("b", self.opener("b")) as fo:
+            self.assertEquals(b"b", fo.read())
+        self.assertTrue(a.closed)
+        self.assertEquals(2, len(pool))
+
+    def test_discard(self):
+        pool = parquet.filesystem.FilePool()
+        for name in ["a", "b"]:
+            with pool.open(name, self.opener(name)):
+                pass
+        pool.discard("a")
+        pool.discard("a")
+        self.assertEquals([True, False], [f.closed for f in self.opened])
+        pool.clear()
+        self.assertEquals(0, len(pool))
+        self.assertTrue(self.opened[1].closed)
+
+    def test_closer(self):
+        pool = parquet.filesystem.FilePool(max_open=1)
+        closed = []
+        for name in ["a", "b"]:
+            with pool.open(name, self.opener(name), closed.append):
+                pass
+        self.assertEquals([self.opened[0]], closed)
+        self.assertFalse(self.opened[0].closed)
+        pool.clear()
+        self.assertEquals(self.opened, closed)
+
+    def test_reader_hooks(self):
+        calls = []
+
+        class HookedReader(parquet.ParquetReader):
+            def _open_file(self, file_name):
+                calls.append(("open", file_name))
+                return super(HookedReader, self)._open_file(file_name)
+
+            def _close_file(self, fileobj):
+                calls.append(("close", fileobj.name))
+                fileobj.close()
+
+        filename = "test-data/nation.impala.parquet"
+        reader = HookedReader(filename,
+                              file_pool=parquet.filesystem.FilePool())
+        reader.read()
+        reader.close()
+        self.assertEquals([("open", filename), ("close", filename)], calls)
+
+    def test_failed_open(self):
+        pool = parquet.filesystem.FilePool(max_open=1)
+
+        def fail():
+            raise IOError("no such file")
+        self.assertRaises(IOError, pool.acquire, "a", fail)
+        self.assertEquals(0, len(pool))
+
+    def test_shared_between_readers(self):
+        pool = parquet.filesystem.FilePool()
+        filename = "test-data/nation.impala.parquet"
+        first = parquet.ParquetReader(filename, file_pool=pool)
+        expected = first.read()
+        second = parquet.ParquetReader(filename, file_pool=pool)
+        pd.testing.assert_frame_equal(expected, second.read())
+        self.assertEquals(1, pool.misses)
+        self.assertEquals(1, len(pool))
+
+    def test_dataset_over_max_open(self):
+        pool = parquet.filesystem.FilePool(max_open=1)
+        reader = parquet.ParquetReader("test-data/dataset", file_pool=pool)
+        self.assertEquals(5, len(reader.read()))
+        self.assertEquals(1, len(pool))
+        self.assertTrue(pool.evictions > 0)
+
+    def test_close_twice(self):
+        pool = parquet.filesystem.FilePool()
+        reader = parquet.ParquetReader("test-data/nation.impala.parquet",
+                                       file_pool=pool)
+        reader.close()
+        reader.close()
+        self.assertEquals(0, len(pool))
+        # a closed reader reopens its files when read again.
+        self.assertEquals(25, len(reader.read()))
+        self.assertEquals(1, len(pool))
+
+
+class CountingFileSystem(parquet.filesystem.LocalFileSystem):
+    """Counts the files opened."""
+
+    def __init__(self):
+        super(CountingFileSystem, self).__init__()
+        self.opened = 0
+
+    def open(self, path):
+        self.opened += 1
+        return super(CountingFileSystem, self).open(path)
+
+
+class TestFooterCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = FooterCache(max_entries=2)
+        cache.put("a", 1, 10)
+        cache.put("b", 2, 10)
+        self.assertEquals(1, cache.get("a"))
+        cache.put("c", 3, 10)
+        self.assertEquals(None, cache.get("b"))
+        self.assertEquals(3, cache.get("c"))
+        self.assertEquals((2, 1, 1), (cache.hits, cache.misses,
+                                      cache.evictions))
+        self.assertEquals(20, cache.nbytes)
+
+    def test_max_bytes(self):
+        cache = FooterCache(max_bytes=100)
+        cache.put("a", 1, 60)
+        cache.put("b", 2, 30)
+        cache.put("c", 3, 30)
+        self.assertEquals(None, cache.get("a"))
+        self.assertEquals(60, cache.nbytes)
+        cache.put("d", 4, 101)
+        self.assertEquals(None, cache.get("d"))
+        cache.put("b", 5, 50)
+        self.assertEquals(80, cache.nbytes)
+        self.assertEquals([5, 3], [cache.get("b"), cache.get("c")])
+        cache.clear()
+        self.assertEquals((0, 0), (len(cache), cache.nbytes))
+
+    def test_read_once(self):
+        fs = CountingFileSystem()
+        cache = FooterCache()
+        filename = "test-data/nation.impala.parquet"
+        footer, helper = parquet.ParquetMain(
+            filesystem=fs, metadata_cache=cache).read_metadata(filename)
+        reader = parquet.ParquetReader(filename, filesystem=fs,
+                                       metadata_cache=cache)
+        self.assertIs(footer, reader._footer)
+        self.assertIs(helper, reader._schema_helper)
+        self.assertEquals(1, fs.opened)
+        self.assertEquals((1, 1), (cache.hits, cache.misses))
+
+    def test_changed_file(self):
+        cache = FooterCache()
+        main = parquet.ParquetMain(metadata_cache=cache)
+        with tempfile.NamedTemporaryFile(suffix=".parquet") as tmp:
+            for name in ["nation.impala.parquet", "nulls.parquet"]:
+                with open(os.path.join("test-data", name), "rb") as fo:
+                    tmp.seek(0)
+                    tmp.truncate()
+                    tmp.write(fo.read())
+                    tmp.flush()
+                expected = parquet.ParquetMain(
+                    metadata_cache=FooterCache()).read_footer(tmp.name)
+                self.assertEquals(expected, main.read_footer(tmp.name))
+            # the same size with another modification time.
+            os.utime(tmp.name, (0, 0))
+            self.assertEquals(expected, main.read_footer(tmp.name))
+        self.assertEquals((0, 3), (cache.hits, cache.misses))
+
+    def test_streams_not_cached(self):
+        cache = FooterCache()
+        with open("test-data/nulls.parquet", "rb") as fo:
+            parquet.ParquetReader(fo, metadata_cache=cache)
+        self.assertEquals(0, len(cache))
+
+    def test_threads(self):
+        cache = FooterCache(max_entries=2)
+        names = ["nation.impala.parquet", "nulls.parquet", "v2.parquet"]
+        expected = dict((name, parquet.ParquetMain().read_footer(
+            os.path.join("test-data", name))) for name in names)
+        errors = []
+
+        def read():
+            main = parquet.ParquetMain(metadata_cache=cache)
+            try:
+                for i in range(50):
+                    name = names[i % len(names)]
+                    footer = main.read_footer(os.path.join("test-data", name))
+                    assert footer == expected[name]
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEquals([], errors)
+        self.assertEquals(200, cache.hits + cache.misses)
+        self.assertEquals(2, len(cache))
+
+    def test_dump_metadata_opens_once(self):
+        fs = CountingFileSystem()
+        main = parquet.ParquetMain(filesystem=fs,
+                                   metadata_cache=FooterCache())
+        main.dump_metadata("test-data/row-groups.parquet", True,
+                           out=StringIO())
+        self.assertEquals(1, fs.opened)
+
+
+class TestLazyFooter(unittest.TestCase):
+
+    def test_schema_only(self):
+        main = parquet.ParquetMain(metadata_cache=FooterCache())
+        footer, helper = main.read_metadata("test-data/row-groups.parquet")
+        self.assertEquals(8, footer.num_rows)
+        self.assertFalse(helper.is_required("id"))
+        self.assertEquals(0, footer.row_groups.decoded())
+        self.assertEquals(2, len(footer.row_groups))
+        self.assertEquals(4, footer.row_groups[-1].num_rows)
+        self.assertEquals(1, footer.row_groups.decoded())
+        self.assertIs(footer.row_groups[-1], footer.row_groups[1])
+        self.assertEquals(8, sum(rg.num_rows for rg in footer.row_groups))
+
+    def test_memory_map(self):
+        pool = parquet.filesystem.FilePool()
+        reader = parquet.ParquetReader("test-data/row-groups.parquet",
+                                       memory_map=True, file_pool=pool,
+                                       metadata_cache=FooterCache())
+        pool.clear()
+        # the footer doesn't point into the closed mapping.
+        self.assertIsInstance(reader._footer.row_groups.data, bytes)
+        self.assertEquals(4, reader._footer.row_groups[1].num_rows)
+
+    def test_truncated_row_group(self):
+        with open("test-data/row-groups.parquet", "rb") as fo:
+            data = fo.read()
+        size = struct.unpack("<i", data[-8:-4])[0]
+        footer = data[-8 - size:-8]
+        main = parquet.ParquetMain()
+        start = main._parse_footer(footer).row_groups.offsets[1]
+        # the row groups are checked while skipped over.
+        with self.assertRaises(parquet.main.ParquetFormatException):
+            main._parse_footer(footer[:start + 10])
+
+
+class TestNested(unittest.TestCase):
+
+    f = "test-data/nested.parquet"
+
+    def _expected(self):
+        tags, attrs, nums = [], [], []
+        for i in range(200):
+            tags.append(None if i % 11 == 0 else [] if i % 7 == 0 else
+                        [None if (i + j) % 5 == 0 else "t%d" % ((i * j) % 9)
+                         for j in range(i % 4 + 1)])
+            attrs.append(None if i % 13 == 0 else
+                         dict(("k%d" % j, None if j == 2 else "v%d" % (i + j))
+                              for j in range(i % 3)))
+            nums.append(None if i % 17 == 0 else
+                        [None if j == 1 and i % 2 else
+                         [i * 10 + k for k in range(j)] for j in range(i % 3)])
+        return tags, attrs, nums
+
+    def test_columns(self):
+        reader = parquet.ParquetReader(self.f)
+        self.assertEquals(["id", "tags", "attrs", "nums"], reader._cols)
+
+    def test_lists_and_maps(self):
+        tags, attrs, nums = self._expected()
+        df = parquet.ParquetReader(self.f).read()
+        self.assertEquals(list(range(200)), df["id"].tolist())
+        self.assertEquals(tags, df["tags"].tolist())
+        self.assertEquals(attrs, df["attrs"].tolist())
+        self.assertEquals(nums, df["nums"].tolist())
+
+    def test_rows(self):
+        tags, _, nums = self._expected()
+        reader = parquet.ParquetReader(self.f)
+        first = reader.read(columns=["tags", "nums"], rows=70)
+        rest = reader.read(columns=["tags", "nums"], rows=130)
+        self.assertEquals(tags, first["tags"].tolist() + rest["tags"].tolist())
+        self.assertEquals(nums, first["nums"].tolist() + rest["nums"].tolist())
+
+    def test_records_across_pages(self):
+        # the DATA_PAGE pages end within the second and the last records.
+        f = "test-data/split-records.parquet"
+        expected = [[1, 2], [3, 4, 5, 6, 7], None, [], [8, None, 9]]
+        self.assertEquals(expected,
+                          parquet.ParquetReader(f).read()["l"].tolist())
+        reader = parquet.ParquetReader(f)
+        self.assertEquals(expected[:2], reader.read(rows=2)["l"].tolist())
+        self.assertEquals(expected[2:], reader.read(rows=3)["l"].tolist())
+        out = StringIO()
+        parquet.ParquetMain().dump(f, Options(), out=out)
+        self.assertEquals([str(v) for v in expected],
+                          out.getvalue().splitlines())
+
+    def test_assemble_pages(self):
+        # [[1, 2, 3], [4]] split after its second value.
+        pages = [(np.array([1, 2]), np.array([0, 1]), np.array([1, 1])),
+                 (np.array([3, 4]), np.array([1, 0]), np.array([1, 1]))]
+        out = parquet.nested.assemble_pages(pages, [1])
+        self.assertEquals([[1, 2, 3], [4]], out.tolist())
+
+    def test_offsets(self):
+        arrays = parquet.ParquetReader(self.f).read_arrays(
+            columns=["tags", "attrs"])
+        tags = arrays["tags"]
+        self.assertEquals([0, 0, 2, 5, 9, 10], tags.offsets[:6].tolist())
+        self.assertEquals(["t0", "t1", "t0"], tags.values[:3].tolist())
+        self.assertEquals([False, True], tags.validity[:2].tolist())
+        self.assertIsInstance(arrays["attrs"], parquet.nested.MapArray)
+
+    def test_assemble(self):
+        # [[[1, 2]], None, [], [[3], None]] as an optional list of optional
+        # lists, whose repeated fields are at definition levels 2 and 4.
+        rep = np.array([0, 2, 0, 0, 0, 1])
+        defs = np.array([5, 5, 0, 1, 5, 2])
+        out = parquet.nested.assemble(np.array([1, 2, 3]), rep, defs, [2, 4])
+        self.assertEquals([[[1, 2]], None, [], [[3], None]], out.tolist())
+        self.assertEquals([0, 1, 1, 1, 3], out.offsets.tolist())
+        self.assertEquals([0, 2, 3, 3], out.values.offsets.tolist())
+
+    def test_repetition_levels(self):
+        schema_helper = parquet.schema.SchemaHelper([
+            SchemaElement(name="schema", num_children=2),
+            SchemaElement(name="a", num_children=1,
+                          repetition_type=FieldRepetitionType.OPTIONAL),
+            SchemaElement(name="list", num_children=1,
+                          repetition_type=FieldRepetitionType.REPEATED),
+            SchemaElement(name="element", type=Type.INT32,
+                          repetition_type=FieldRepetitionType.REQUIRED),
+            SchemaElement(name="b", type=Type.INT32,
+                          repetition_type=FieldRepetitionType.REQUIRED)])
+        path = ["a", "list", "element"]
+        self.assertEquals(1, schema_helper.max_repetition_level(path))
+        self.assertEquals(2, schema_helper.max_definition_level(path))
+        self.assertEquals([2], schema_helper.repeated_definition_levels(path))
+        self.assertEquals(0, schema_helper.max_repetition_level(["b"]))
+
+
 class TestCompatibility(unittest.TestCase):
 
     td = "test-data"